@@ -0,0 +1,204 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from azure.core.polling.async_base_polling import AsyncLROBasePolling
+from azure.core.polling.base_polling import LROBasePolling
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Adaptive polling settings, overridable from the environment / .env file.
+# ADAPTIVE_POLLING=0 restores the SDK's fixed-interval poller.
+ADAPTIVE_POLLING = os.environ.get("ADAPTIVE_POLLING", "1") != "0"
+# The fixed interval we compare against (the SDK default), also used until a model has history
+POLL_INTERVAL_SECONDS = float(os.environ.get("POLL_INTERVAL_SECONDS", "1"))
+# Interval used around the predicted finish, and the cap of the backoff elsewhere
+POLL_MIN_INTERVAL_SECONDS = float(os.environ.get("POLL_MIN_INTERVAL_SECONDS", "0.25"))
+POLL_MAX_INTERVAL_SECONDS = float(os.environ.get("POLL_MAX_INTERVAL_SECONDS", "5"))
+# Completed analyses remembered per model for the prediction
+POLL_HISTORY_SIZE = int(os.environ.get("POLL_HISTORY_SIZE", "50"))
+# Analyses a model needs before its durations are predicted
+MIN_HISTORY = 3
+# Dense polling covers the prediction +/- this many standard errors
+WINDOW_WIDTH = 2.0
+
+
+class CompletionPredictor:
+    """
+    Predicts how long the service takes to analyze a document from the recent
+    analyses of the same model: a least-squares fit of duration against page
+    count, so both a per-request overhead and a per-page cost are learned.
+    """
+
+    def __init__(self, history_size=POLL_HISTORY_SIZE):
+        self._history = {}  # model_id -> deque of (pages, seconds)
+        self._history_size = history_size
+        self._lock = threading.Lock()
+
+    def record(self, model_id, pages, seconds) -> None:
+        with self._lock:
+            history = self._history.setdefault(model_id, deque(maxlen=self._history_size))
+            history.append((max(1, pages or 1), seconds))
+
+    def predict(self, model_id, pages):
+        """
+        Returns (expected seconds, standard error) for an analysis, or None while
+        the model has too little history. An unknown page count uses the mean.
+        """
+        with self._lock:
+            samples = list(self._history.get(model_id, ()))
+        if len(samples) < MIN_HISTORY:
+            return None
+
+        n = len(samples)
+        mean_pages = sum(p for p, _ in samples) / n
+        mean_seconds = sum(s for _, s in samples) / n
+        variance = sum((p - mean_pages) ** 2 for p, _ in samples)
+        slope = 0.0
+        if variance > 0:
+            slope = max(0.0, sum((p - mean_pages) * (s - mean_seconds) for p, s in samples) / variance)
+        intercept = mean_seconds - slope * mean_pages
+        residual = math.sqrt(sum((s - intercept - slope * p) ** 2 for p, s in samples) / n)
+
+        expected = intercept + slope * (pages if pages else mean_pages)
+        return max(0.0, expected), max(POLL_MIN_INTERVAL_SECONDS, residual)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {model_id: len(history) for model_id, history in self._history.items()}
+
+
+# Shared by every analysis in the process
+completion_predictor = CompletionPredictor()
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _AdaptiveSchedule:
+    """
+    Delay logic shared by the sync and async polling methods. The first status
+    poll goes out right away (as with the SDK poller); after that the poller
+    sleeps until shortly before the predicted finish, polls every
+    POLL_MIN_INTERVAL_SECONDS around it and backs off exponentially once the
+    prediction has been overrun. Without a prediction it polls at the fixed
+    POLL_INTERVAL_SECONDS. Retry-After hints on running operations are ignored;
+    a 429 is still retried (with its Retry-After) by the pipeline's RetryPolicy.
+    """
+
+    def _setup(self, model_id, pages, predictor):
+        self._model_id = model_id
+        self._pages = pages
+        self._predictor = predictor or completion_predictor
+        self._prediction = self._predictor.predict(model_id, pages)
+        self._started = None
+        self._last_poll = None
+        self._polls = 0
+        self._overrun_polls = 0
+
+    def initialize(self, client, initial_response, deserialization_callback):
+        # The operation was created when the analyze request returned
+        self._started = time.monotonic()
+        super().initialize(client, initial_response, deserialization_callback)
+
+    def _next_delay(self, elapsed):
+        if self._prediction is None:
+            return POLL_INTERVAL_SECONDS
+        expected, error = self._prediction
+        window_start = expected - WINDOW_WIDTH * error
+        window_end = expected + WINDOW_WIDTH * error
+        if elapsed < window_start:
+            return min(max(window_start - elapsed, POLL_MIN_INTERVAL_SECONDS), POLL_MAX_INTERVAL_SECONDS)
+        if elapsed <= window_end:
+            return POLL_MIN_INTERVAL_SECONDS
+        self._overrun_polls += 1
+        return min(POLL_MIN_INTERVAL_SECONDS * 2 ** self._overrun_polls, POLL_MAX_INTERVAL_SECONDS)
+
+    def _extract_delay(self):
+        # Called before every poll but the first; the poll goes out when the delay ends
+        now = time.monotonic()
+        delay = self._next_delay(now - self._started)
+        self._last_poll = now + delay
+        self._polls += 1
+        return delay
+
+    def _start_polling(self):
+        # The SDK's poll loop sends its first status request without a delay
+        self._last_poll = time.monotonic()
+        self._polls += 1
+
+    def _finish_polling(self):
+        """Learns from the finished analysis and reports the polling latency it saved."""
+        if self._started is None or self.status().lower() != "succeeded":
+            return
+        body = self._pipeline_response.http_response.json()  # cached by the response
+        detected = self._last_poll - self._started
+        created = _parse_time(body.get("createdDateTime"))
+        updated = _parse_time(body.get("lastUpdatedDateTime"))
+        # The service's own timestamps tell when the analysis really finished
+        finished = (updated - created).total_seconds() if created and updated else detected
+        finished = min(max(0.0, finished), detected)
+        pages = len((body.get("analyzeResult") or {}).get("pages") or []) or self._pages
+        self._predictor.record(self._model_id, pages, finished)
+
+        # A fixed-interval poller polls at 0, T, 2T, ... and notices the first poll after the finish
+        fixed_polls = math.ceil(finished / POLL_INTERVAL_SECONDS)
+        fixed_detected = fixed_polls * POLL_INTERVAL_SECONDS
+        saved = fixed_detected - detected
+        metrics.record_polling(self._model_id, self._polls, detected - finished, saved)
+        logger.info(f"Analysis ({self._model_id}, {pages} pages) finished after {finished:.2f}s, "
+                    f"seen after {detected:.2f}s with {self._polls} polls; fixed {POLL_INTERVAL_SECONDS:g}s "
+                    f"polling: {fixed_detected:.2f}s with {fixed_polls + 1} polls (saved {saved:+.2f}s)")
+
+
+class AdaptivePolling(_AdaptiveSchedule, LROBasePolling):
+    """
+    LRO polling method for DocumentIntelligenceClient.begin_analyze_document that
+    polls around the predicted completion time (see _AdaptiveSchedule).
+    Args:
+        model_id: The analysis model; durations are learned per model.
+        pages: Page count of the document (or of the requested range), if known.
+        predictor: CompletionPredictor to use; defaults to the process-wide one.
+    """
+
+    def __init__(self, model_id, pages=None, predictor=None, **kwargs):
+        super().__init__(POLL_INTERVAL_SECONDS, **kwargs)
+        self._setup(model_id, pages, predictor)
+
+    def run(self) -> None:
+        self._start_polling()
+        super().run()
+        self._finish_polling()
+
+
+class AsyncAdaptivePolling(_AdaptiveSchedule, AsyncLROBasePolling):
+    """Async counterpart of AdaptivePolling for the aio client."""
+
+    def __init__(self, model_id, pages=None, predictor=None, **kwargs):
+        super().__init__(POLL_INTERVAL_SECONDS, **kwargs)
+        self._setup(model_id, pages, predictor)
+
+    async def run(self) -> None:
+        self._start_polling()
+        await super().run()
+        self._finish_polling()
+
+
+def adaptive_polling(model_id, pages=None):
+    """Value for begin_analyze_document(polling=...): an AdaptivePolling, or True (the SDK poller) when disabled."""
+    return AdaptivePolling(model_id, pages) if ADAPTIVE_POLLING else True
+
+
+def adaptive_polling_async(model_id, pages=None):
+    """Async counterpart of adaptive_polling for the aio client."""
+    return AsyncAdaptivePolling(model_id, pages) if ADAPTIVE_POLLING else True
@@ -1,19 +1,64 @@
 import os
 import sys
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+import json
+import asyncio
+import time
+import zipfile
+import functools
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
 from dotenv import load_dotenv
 import uvicorn
-from typing import Dict, Any, List
-import tempfile
+from typing import Dict, Any, List, Optional
+import orjson
+import columnar
+import metrics
+from spatial_index import DocumentIndex
+from extract_text_with_coords import extract_page_lines, extract_page_words, extract_text_and_coords, extract_words_and_coords
+from chunked_analysis import analyze_in_chunks_async, analyze_service, count_pages, pages_in_spec, should_chunk
+from adaptive_polling import adaptive_polling_async
+import incremental_analysis
+from rate_limiter import BULK, INTERACTIVE
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile as FormFile
+from document_client import get_azure_credentials, get_client, get_async_client, close_clients, close_async_clients
+from page_store import page_store
+from result_cache import analysis_cache, cache_key
+from search_index import SEARCH_MAX_RESULTS, text_index
+from single_flight import AsyncSingleFlight
+import text_layer
+from text_layer import analyze_with_text_layer
+from model_router import TEXT, model_router
+from job_store import JobStore, JobRunner, JOB_RETRY_AFTER_SECONDS, FAILED, SUCCEEDED, job_etag, job_status_body, is_finished
+from upload_spool import InvalidContentLength, UploadTooLarge, UPLOAD_CHUNK_BYTES, check_content_length, spool_chunks, spool_stream
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
-app = FastAPI(title="Document Intelligence API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the pooled connections of the shared clients on shutdown
+    await close_async_clients()
+    job_runner.shutdown()
+    text_index.close()
+    close_clients()
+
+app = FastAPI(title="Document Intelligence API", lifespan=lifespan)
+
+# Maximum number of analyses in flight against Azure at the same time (per worker).
+# Requests beyond the cap wait for a free slot instead of being rejected.
+MAX_CONCURRENT_ANALYSES = int(os.environ.get("MAX_CONCURRENT_ANALYSES", "8"))
+analysis_slots = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+# Number of finished jobs whose spatial index is kept in memory for hit-test queries
+SPATIAL_INDEX_CACHE_SIZE = int(os.environ.get("SPATIAL_INDEX_CACHE_SIZE", "32"))
+
+# Number of documents of a single batch request that are spooled/analyzed at once
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
 
 # Add CORS middleware to allow cross-origin requests
 app.add_middleware(
@@ -22,110 +67,552 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Document-Id"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from their Content-Length before any of the body is read
+    try:
+        check_content_length(request.headers.get("content-length"))
+    except InvalidContentLength as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"detail": str(e)})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Outermost middleware: times every request and exposes the timer to the stage helpers
+    timer = metrics.start_request("fastapi", request.url.path)
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        metrics.record_error(e)
+        timer.finish(500)
+        raise
+    route = request.scope.get("route")
+    # Label by route template (e.g. /jobs/{job_id}) to keep the label set small
+    timer.endpoint = route.path if route is not None else "unmatched"
+    content_length = response.headers.get("content-length")
+    timer.response_bytes = int(content_length) if content_length else None
+    timer.finish(response.status_code)
+    return response
+
 class AnalysisResponse(BaseModel):
-    words: List[Dict[str, Any]]
-    lines: List[Dict[str, Any]]
-
-def get_azure_credentials():
-    endpoint = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-    key = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_KEY")
-    if not endpoint or not key:
-        raise ValueError("Azure Document Intelligence credentials not found.")
-    return endpoint, key
-
-def analyze_document(endpoint, key, file_path, model_id="prebuilt-layout"):
-    document_intelligence_client = DocumentIntelligenceClient(
-        endpoint=endpoint,
-        credential=AzureKeyCredential(key)
-    )
-    with open(file_path, "rb") as f:
-        poller = document_intelligence_client.begin_analyze_document(
-            model_id,
-            body=f
-        )
-    result = poller.result()
+    # Either list is left out when it was not requested with ?include=
+    words: Optional[List[Dict[str, Any]]] = None
+    lines: Optional[List[Dict[str, Any]]] = None
+
+# Parts of the words/lines payload that ?include= can select
+ANALYSIS_PARTS = ("words", "lines")
+
+async def analyze_document_async(endpoint, key, document, model_id="prebuilt-layout", chunk_pages=None, parallelism=None,
+                                 priority=INTERACTIVE, pages=None):
+    # Pages with a usable PDF text layer are read locally (see text_layer.py); only the rest are sent
+    plan = await run_in_threadpool(text_layer.preflight, document, model_id, pages)
+    if not plan.local:
+        return await analyze_service_async(endpoint, key, document, model_id, chunk_pages, parallelism, priority, pages)
+    analyzed = None
+    if plan.needs_service:
+        analyzed = await analyze_service_async(endpoint, key, document, model_id, priority=priority, pages=plan.pages)
+    return await run_in_threadpool(plan.finish, analyzed)
+
+async def analyze_service_async(endpoint, key, document, model_id="prebuilt-layout", chunk_pages=None, parallelism=None,
+                                priority=INTERACTIVE, pages=None):
+    # Uses the aio client and async poller so waiting on Azure never blocks the event loop.
+    # `document` may be bytes or a seekable binary file object (streamed to the service).
+    # `priority` picks the rate limiter lane (see rate_limiter.py).
+    # `pages` (e.g. "2,5-6") analyzes only those pages, in a single request.
+    async with analysis_slots:
+        document_intelligence_client = get_async_client(endpoint, key)
+        started = time.perf_counter()
+        if should_chunk(model_id, chunk_pages) and not pages:
+            # Chunk requests run concurrently, so each needs the whole PDF as bytes
+            if not isinstance(document, bytes):
+                document = await run_in_threadpool(document.read)
+            result = await analyze_in_chunks_async(
+                document_intelligence_client, model_id, document, chunk_pages, parallelism,
+                analysis_priority=priority)
+            model_router.record_analysis(model_id, result, time.perf_counter() - started)
+            return result
+        page_count = pages_in_spec(pages) if pages else await run_in_threadpool(count_pages, document)
+        with metrics.stage(metrics.SERVICE_SUBMIT):
+            poller = await document_intelligence_client.begin_analyze_document(
+                model_id,
+                body=document,
+                pages=pages,
+                content_type="application/octet-stream",
+                analysis_priority=priority,
+                # Polls around the completion time predicted from the page count
+                polling=adaptive_polling_async(model_id, page_count)
+            )
+        with metrics.stage(metrics.POLLING_WAIT):
+            result = await poller.result()
+    # Per-model durations show whether the routing pays off (see model_router.py)
+    model_router.record_analysis(model_id, result, time.perf_counter() - started)
     return result
 
-def extract_text_and_coords(result):
-    output = []
-    for page in result.pages:
-        page_number = page.page_number
-        if hasattr(page, 'lines') and page.lines:
-            for idx, line in enumerate(page.lines):
-                text = line.content
-                # Each line has a polygon (list of 8 floats: 4 points)
-                polygon = line.polygon
-                output.append({
-                    'page': page_number,
-                    'line_index' : idx,
-                    'text': text,
-                    'polygon': polygon
-                })
-    print(len(output))
-    return output
-
-def extract_words_and_coords(result):
-    output = []
-    for page in result.pages:
-        page_number = page.page_number
-        if hasattr(page, 'words') and page.words:
-            for idx, word in enumerate(page.words):
-                text = word.content
-                polygon = word.polygon
-                output.append({
-                    'page': page_number,
-                    'word_index': idx,
-                    'text': text,
-                    'polygon': polygon
-                })
-    print(len(output))
-    return output
+def analyze_job_document(document, model_id="prebuilt-layout"):
+    # Runs on the job worker threads, so it uses the shared synchronous client.
+    # Jobs are bulk work: interactive requests are dispatched ahead of them.
+    analyze = functools.partial(analyze_service, get_client(), model_id, document, analysis_priority=BULK)
+    # Pages with a usable PDF text layer are read locally (see text_layer.py)
+    return analyze_with_text_layer(document, model_id, analyze)
+
+# Background analysis jobs; state and results are persisted in SQLite
+job_runner = JobRunner(JobStore(), analyze_job_document)
+
+def iter_page_records(result, include=ANALYSIS_PARTS):
+    """Yields one {page, width, height, unit, lines, words} record per page, extracted lazily."""
+    for page in result.pages or []:
+        record = {
+            'page': page.page_number,
+            'width': page.width,
+            'height': page.height,
+            'unit': page.unit
+        }
+        # Only the requested collections are walked
+        if 'lines' in include:
+            record['lines'] = extract_page_lines(page)
+        if 'words' in include:
+            record['words'] = extract_page_words(page)
+        yield record
+
+def iter_ndjson_pages(result, include=ANALYSIS_PARTS, timer=None):
+    # Each page is encoded and sent as soon as it is extracted; no pydantic validation.
+    # The stream outlives the request handler, so its stage times go to `timer` directly.
+    extraction = serialization = 0.0
+    records = iter_page_records(result, include)
+    while True:
+        started = time.perf_counter()
+        record = next(records, None)
+        extracted = time.perf_counter()
+        extraction += extracted - started
+        if record is None:
+            break
+        line = orjson.dumps(record) + b"\n"
+        serialization += time.perf_counter() - extracted
+        yield line
+    if timer is not None:
+        timer.add(metrics.EXTRACTION, extraction)
+        timer.add(metrics.SERIALIZATION, serialization)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def negotiate_format(request: Request, response_format: Optional[str]):
+    """Picks the response format from ?format= or, failing that, the Accept header."""
+    if response_format:
+        if response_format not in ("json", "ndjson", "columnar"):
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {response_format}")
+        return response_format
+    accept = request.headers.get("accept", "")
+    if NDJSON_MEDIA_TYPE in accept:
+        return "ndjson"
+    if columnar.MEDIA_TYPE in accept:
+        return "columnar"
+    return "json"
+
+def parse_include(include: Optional[str]):
+    """Parses ?include=words,lines into a tuple of ANALYSIS_PARTS (all of them when empty)."""
+    parts = tuple(p.strip() for p in (include or "").split(",") if p.strip())
+    unknown = [p for p in parts if p not in ANALYSIS_PARTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include value(s): {', '.join(unknown)}")
+    return parts or ANALYSIS_PARTS
+
+def build_analysis_response(result, response_format="json", include=ANALYSIS_PARTS):
+    """
+    Builds the words/lines payload as one AnalysisResponse, a per-page NDJSON stream,
+    or the packed binary layout described in columnar.py. `include` limits the JSON
+    and NDJSON payloads to words or lines; the columnar layout always carries both.
+    """
+    metrics.record_document(result)
+    if response_format == "ndjson":
+        return StreamingResponse(iter_ndjson_pages(result, include, metrics.current_timer()),
+                                 media_type=NDJSON_MEDIA_TYPE)
+    if response_format == "columnar":
+        with metrics.stage(metrics.SERIALIZATION):
+            content = columnar.encode_columnar(result)
+        return Response(content=content, media_type=columnar.MEDIA_TYPE)
+    with metrics.stage(metrics.EXTRACTION):
+        payload = {}
+        if 'words' in include:
+            payload['words'] = extract_words_and_coords(result)
+        if 'lines' in include:
+            payload['lines'] = extract_text_and_coords(result)
+    # Encoded here rather than by FastAPI so serialization can be timed on its own
+    # (and skips re-validating every word against AnalysisResponse)
+    with metrics.stage(metrics.SERIALIZATION):
+        content = orjson.dumps(payload)
+    return Response(content=content, media_type="application/json")
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to Document Intelligence API"}
 
-@app.post("/analyze-pdf", response_model=AnalysisResponse)
-async def analyze_pdf(file: UploadFile = File(...)):
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics of this worker process."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**analysis_cache.stats(), "coalesced": analysis_flights.stats(),
+            "incremental": incremental_analysis.stats(), "text_layer": text_layer.stats(),
+            "page_store": page_store.stats(), "routing": model_router.stats()}
+
+@app.get("/search")
+async def search(q: str, limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS)):
+    """
+    Full-text search over every analyzed document (see search_index.py), answered from
+    the local index. Quoted "phrases" match consecutive words; all parts must match.
+    Each hit carries the polygons of the matched words, in the page's unit.
+    """
     try:
-        # Get Azure credentials
-        endpoint, key = get_azure_credentials()
+        return await run_in_threadpool(text_index.search, q, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Save the uploaded file to a temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(await file.read())
-            temp_file_path = temp_file.name
+@app.get("/documents/{document_id}/pages/{page_number}")
+async def get_document_page(document_id: str, page_number: int, request: Request):
+    """
+    Returns the words and lines of one page of an analyzed document (the X-Document-Id of
+    /analyze-pdf, or a /search hit's `document`), read from the page store without
+    loading the rest of the result.
+    """
+    page = await run_in_threadpool(page_store.page, document_id, page_number)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Document or page not found")
+    etag = f'"{document_id}-{page_number}"'
+    # A document id is a content hash, so a page never changes
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=orjson.dumps(page), media_type="application/json", headers={"ETag": etag})
 
-        try:
-            # Process the document
-            result = analyze_document(endpoint, key, temp_file_path)
+async def read_upload_chunks(file: UploadFile):
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
 
-            # Extract words and lines with coordinates
-            lines_coords = extract_text_and_coords(result)
-            words_coords = extract_words_and_coords(result)
+# Coalesces concurrent analyses of the same document and model (keyed like the cache)
+analysis_flights = AsyncSingleFlight()
 
-            # Create a proper response object that matches our model
-            response = AnalysisResponse(
-                words=words_coords,
-                lines=lines_coords
-            )
+def route_model(model: Optional[str] = None):
+    """
+    Model for a words/lines request: the cheapest one that returns text and
+    coordinates (prebuilt-read), or the one named by ?model= (see model_router.py).
+    """
+    try:
+        return model_router.route({TEXT}, model, default="prebuilt-layout").model_id
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def document_id(upload, model_id):
+    """Id of an upload's analysis: its cache key, as used by the page store and /search."""
+    return cache_key(upload.sha256, model_id)
+
+async def analyze_upload(upload, model_id, priority=INTERACTIVE):
+    """Analyzes a spooled upload (or serves it from the cache) and returns the AnalyzeResult."""
+    # Get Azure credentials
+    endpoint, key = get_azure_credentials()
+    result_key = document_id(upload, model_id)
 
-            return response
+    # Byte-identical re-submissions are served from the cache
+    result = await run_in_threadpool(analysis_cache.get, result_key)
+    if result is None:
+        async def analyze_and_cache():
+            # A revision of a cached document only sends its changed pages
+            revision = await run_in_threadpool(incremental_analysis.plan_revision, upload.file, model_id, result_key)
+            analyzed = None
+            if revision.needs_service:
+                # Stream the spooled upload to the service without blocking the event loop
+                analyzed = await analyze_document_async(endpoint, key, upload.file, model_id=model_id,
+                                                        priority=priority, pages=revision.pages)
+            result = await run_in_threadpool(revision.finish, analyzed)
+            await run_in_threadpool(analysis_cache.put, result_key, result)
+            await run_in_threadpool(page_store.put, result_key, result)
+            await run_in_threadpool(revision.remember, result)
+            # Indexed for /search on a background thread
+            text_index.add_async(result_key, result)
+            return result
 
-        finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        def start_analysis():
+            # The shared task keeps the upload open even if this request goes away first
+            upload.retain()
+            task = asyncio.ensure_future(analyze_and_cache())
+            task.add_done_callback(lambda _: upload.close())
+            return task
+
+        # Identical uploads arriving while this one is analyzed wait for the same result
+        result = await analysis_flights.do(result_key, start_analysis)
+    return result
 
+@app.post("/analyze-pdf", response_model=AnalysisResponse, response_model_exclude_none=True)
+async def analyze_pdf(request: Request, file: UploadFile = File(...),
+                      response_format: Optional[str] = Query(None, alias="format"),
+                      include: Optional[str] = None, model: Optional[str] = None):
+    """
+    Returns the words and lines of a PDF with their polygons.
+    With ?format=ndjson (or Accept: application/x-ndjson) the response is streamed
+    as one JSON record per page instead of a single AnalysisResponse; ?format=columnar
+    (or Accept: application/vnd.docintel.columnar) returns the binary layout from columnar.py.
+    ?include=words or ?include=lines returns (and extracts) only that collection.
+    Documents are analyzed with prebuilt-read unless ?model= names another model.
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    response_format = negotiate_format(request, response_format)
+    include = parse_include(include)
+    model_id = route_model(model)
+
+    try:
+        # Copy the upload in bounded chunks; it only touches disk above UPLOAD_SPILL_BYTES
+        with await spool_chunks(read_upload_chunks(file)) as upload:
+            metrics.record_upload(upload)
+            result = await analyze_upload(upload, model_id)
+        response = build_analysis_response(result, response_format, include)
+        response.headers["X-Document-Id"] = document_id(upload, model_id)
+        return response
+
+    except UploadTooLarge as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+@app.post("/analyze-pdf/stream", response_model=AnalysisResponse, response_model_exclude_none=True)
+async def analyze_pdf_stream(request: Request, response_format: Optional[str] = Query(None, alias="format"),
+                             include: Optional[str] = None, model: Optional[str] = None):
+    """
+    Streaming upload mode: the request body is the raw PDF (Content-Type: application/pdf).
+    The body is read as it arrives, without multipart parsing, and passed through to the service.
+    Supports the same response formats, ?include= projection and ?model= as /analyze-pdf.
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/pdf":
+        raise HTTPException(status_code=415, detail="Request body must be application/pdf")
+    response_format = negotiate_format(request, response_format)
+    include = parse_include(include)
+    model_id = route_model(model)
+
+    try:
+        with await spool_chunks(request.stream()) as upload:
+            metrics.record_upload(upload)
+            if upload.size == 0:
+                raise HTTPException(status_code=400, detail="Empty request body")
+            result = await analyze_upload(upload, model_id)
+        response = build_analysis_response(result, response_format, include)
+        response.headers["X-Document-Id"] = document_id(upload, model_id)
+        return response
+
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+def collect_batch_items(files, archives):
+    """
+    Expands the uploaded files into (filename, open_stream) pairs.
+    PDFs are taken as-is and every .pdf member of a .zip archive becomes its own item;
+    streams are opened lazily so only the documents currently being analyzed are buffered.
+    """
+    items = []
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith('.zip'):
+            archive = zipfile.ZipFile(file.file)
+            archives.append(archive)
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.lower().endswith('.pdf'):
+                    items.append((member.filename, lambda archive=archive, member=member: archive.open(member)))
+        else:
+            items.append((name, lambda file=file: file.file))
+    return items
+
+async def close_batch_inputs(archives, form):
+    for archive in archives:
+        archive.close()
+    await form.close()
+
+async def analyze_batch_item(index, filename, open_stream, slots, model_id):
+    """Analyzes one batch document; failures are returned as an error record instead of raised."""
+    record = {"index": index, "filename": filename}
+    async with slots:
+        try:
+            if not filename.lower().endswith('.pdf'):
+                raise ValueError("Only PDF files are supported")
+            stream = open_stream()
+            upload = await run_in_threadpool(spool_stream, stream)
+            with upload:
+                result = await analyze_upload(upload, model_id, priority=BULK)
+            record.update(status="ok", document=document_id(upload, model_id), words=extract_words_and_coords(result),
+                          lines=extract_text_and_coords(result))
+        except (UploadTooLarge, ValueError) as e:
+            record.update(status="error", error=str(e))
+        except Exception as e:
+            record.update(status="error", error=f"An error occurred: {str(e)}")
+    return record
+
+async def stream_batch_results(items, archives, form, model_id):
+    """Yields one NDJSON line per document, in completion order."""
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(analyze_batch_item(index, filename, open_stream, slots, model_id))
+        for index, (filename, open_stream) in enumerate(items)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            record = await next_done
+            yield json.dumps(record) + "\n"
+    finally:
+        # Client went away or we finished: stop any remaining work
+        for task in tasks:
+            task.cancel()
+        await close_batch_inputs(archives, form)
+
+@app.post("/analyze-pdf/batch")
+async def analyze_pdf_batch(request: Request):
+    """
+    Analyzes many PDFs (and/or .zip archives of PDFs) sent as multipart `files` parts.
+    The response is NDJSON: one record per document, written as soon as that document
+    finishes, so records arrive in completion order. Each record carries the document's
+    submission `index` and `filename`, plus either its `document` id and `words`/`lines`
+    or an inline `error`. ?model= applies to every document.
+    """
+    model_id = route_model(request.query_params.get("model"))
+    # The form is parsed here instead of through File(...) parameters because FastAPI
+    # closes those files when the handler returns, before the response has streamed.
+    form = await request.form()
+    files = [value for value in form.getlist("files") if isinstance(value, FormFile)]
+    archives = []
+    try:
+        items = collect_batch_items(files, archives)
+    except zipfile.BadZipFile as e:
+        await close_batch_inputs(archives, form)
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive: {str(e)}")
+    if not items:
+        await close_batch_inputs(archives, form)
+        raise HTTPException(status_code=400, detail="No PDF files found in the request")
+
+    return StreamingResponse(stream_batch_results(items, archives, form, model_id), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), model: Optional[str] = None):
+    """Queues a PDF for background analysis and returns the job id immediately."""
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    model_id = route_model(model)
+
+    try:
+        upload = await spool_chunks(read_upload_chunks(file))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    job_id = await run_in_threadpool(job_runner.submit, upload, file.filename, model_id)
+    return JSONResponse(
+        status_code=202,
+        content={"id": job_id, "status": "queued"},
+        headers={"Location": f"/jobs/{job_id}", "Retry-After": str(JOB_RETRY_AFTER_SECONDS)}
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Returns the job status. Supports If-None-Match; unfinished jobs carry a Retry-After hint."""
+    job = await run_in_threadpool(job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    headers = {"ETag": job_etag(job)}
+    if not is_finished(job):
+        headers["Retry-After"] = str(JOB_RETRY_AFTER_SECONDS)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=job_status_body(job), headers=headers)
+
+@app.get("/jobs/{job_id}/result", response_model=AnalysisResponse)
+async def get_job_result(job_id: str, request: Request, response_format: Optional[str] = Query(None, alias="format")):
+    """Returns the words and lines of a finished job (202 with Retry-After while it is still running)."""
+    response_format = negotiate_format(request, response_format)
+    job = await run_in_threadpool(job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not is_finished(job):
+        return JSONResponse(
+            status_code=202,
+            content=job_status_body(job),
+            headers={"Location": f"/jobs/{job_id}", "Retry-After": str(JOB_RETRY_AFTER_SECONDS)}
+        )
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+
+    # A succeeded job's result never changes, so the ETag only depends on the id and format
+    etag = f'"{job_id}-result-{response_format}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    result = await run_in_threadpool(job_runner.store.get_result, job_id)
+    response = build_analysis_response(result, response_format)
+    response.headers["ETag"] = etag
+    return response
+
+def build_document_index(result):
+    """Builds the per-page word/line spatial index of an analysis."""
+    return DocumentIndex(
+        (page.page_number, page.width, page.height, extract_page_words(page), extract_page_lines(page))
+        for page in result.pages or []
+    )
+
+@functools.lru_cache(maxsize=SPATIAL_INDEX_CACHE_SIZE)
+def load_job_index(job_id):
+    # Only called for succeeded jobs, whose results never change, so caching by id is safe
+    return build_document_index(job_runner.store.get_result(job_id))
+
+async def get_job_page_index(job_id, page_number):
+    job = await run_in_threadpool(job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    index = await run_in_threadpool(load_job_index, job_id)
+    if index.page(page_number) is None:
+        raise HTTPException(status_code=404, detail=f"Page {page_number} not found")
+    return index
+
+@app.get("/jobs/{job_id}/pages/{page_number}/hit")
+async def hit_test(job_id: str, page_number: int, x: float, y: float):
+    """Returns the word and line at point (x, y) of a page, in the page's unit (inches for PDFs)."""
+    index = await get_job_page_index(job_id, page_number)
+    return {
+        "page": page_number,
+        "x": x,
+        "y": y,
+        "word": index.word_at(page_number, x, y),
+        "line": index.line_at(page_number, x, y)
+    }
+
+@app.get("/jobs/{job_id}/pages/{page_number}/region")
+async def region_query(job_id: str, page_number: int, left: float, top: float, right: float, bottom: float):
+    """Returns all words and lines whose bounding box intersects the rectangle, in reading order."""
+    index = await get_job_page_index(job_id, page_number)
+    return {
+        "page": page_number,
+        "words": index.words_in_rect(page_number, left, top, right, bottom),
+        "lines": index.lines_in_rect(page_number, left, top, right, bottom)
+    }
+
 if __name__ == "__main__":
     uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
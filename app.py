@@ -1,13 +1,28 @@
 # Create app.py
 import os
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, make_response
 from flask_cors import CORS
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeResult
 from dotenv import load_dotenv
 import logging
 import io  # Import io module for reading stream
+import atexit
+import bisect
+import functools
+import re
+from collections.abc import Mapping
+from document_client import get_client, close_clients
+from page_store import page_store
+from result_cache import analysis_cache, cache_key
+from search_index import SEARCH_MAX_RESULTS, text_index
+from upload_spool import MAX_UPLOAD_BYTES, UploadTooLarge, spool_stream
+from job_store import JobStore, JobRunner, JOB_RETRY_AFTER_SECONDS, FAILED, job_etag, job_status_body, is_finished
+from rate_limiter import BULK, INTERACTIVE
+from single_flight import SingleFlight
+from chunked_analysis import analyze_service
+from model_router import FIELDS, KEY_VALUE_PAIRS, TABLES, TEXT, model_router
+import incremental_analysis
+import metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,6 +33,13 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes, allowing requests from the frontend
+# Werkzeug rejects requests whose Content-Length exceeds this before reading the body
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+# Release the pooled connections of the shared client when the server exits
+atexit.register(close_clients)
+# Finish queued search index writes first (atexit runs handlers last-in, first-out)
+atexit.register(text_index.close)
 
 # Get Azure credentials from environment variables
 AZURE_ENDPOINT = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
@@ -28,6 +50,37 @@ if not AZURE_ENDPOINT or not AZURE_KEY:
     # You might want to exit or handle this more gracefully depending on deployment
     # For now, the endpoint will return an error if credentials are missing
 
+# --- Metrics ---
+
+@app.before_request
+def start_request_metrics():
+    # Label by URL rule (e.g. /jobs/<job_id>) to keep the label set small
+    metrics.start_request("flask", request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def finish_request_metrics(response):
+    timer = metrics.current_timer()
+    if timer is not None:
+        if not response.is_streamed:
+            timer.response_bytes = response.content_length
+        timer.finish(response.status_code)
+    return response
+
+@app.teardown_request
+def fail_request_metrics(error):
+    # Only reached unfinished when a view raised an unhandled exception
+    timer = metrics.current_timer()
+    if timer is not None and not timer.finished:
+        if error is not None:
+            metrics.record_error(error)
+        timer.finish(500)
+
+@app.route('/metrics')
+def serve_metrics():
+    """Prometheus metrics of this process."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 # --- Static File Serving ---
 
 @app.route('/')
@@ -49,12 +102,16 @@ def serve_static_files(filename):
         logger.warning(f"Attempt to access disallowed file type: {filename}")
         return "File not found", 404 # Or handle as appropriate
 
-def analyze_document_stream(file_stream, model_id="prebuilt-document"):
+def analyze_document_stream(file_stream, model_id="prebuilt-document", priority=INTERACTIVE, pages=None, features=()):
     """
     Analyze a document stream using Azure Document Intelligence.
     Args:
         file_stream: The file-like object (stream) containing the document data.
+                     It is sent to the service as-is, without being read into memory first.
         model_id: The ID of the model to use.
+        priority: Rate limiter lane; the viewer's requests are INTERACTIVE, background jobs BULK.
+        pages: Optional `pages` parameter (e.g. "2,5-6") to analyze only those pages.
+        features: Add-on features to request, e.g. ("keyValuePairs",) (see model_router.py).
     Returns:
         AnalyzeResult object or raises an exception on error.
     """
@@ -63,127 +120,362 @@ def analyze_document_stream(file_stream, model_id="prebuilt-document"):
 
     logger.info(f"Analyzing document using model: {model_id}")
     try:
-        document_intelligence_client = DocumentIntelligenceClient(
-            endpoint=AZURE_ENDPOINT,
-            credential=AzureKeyCredential(AZURE_KEY)
-        )
-
-        # Read the stream content into bytes
-        file_bytes = file_stream.read()
-        logger.info(f"Read {len(file_bytes)} bytes from stream.")
-
-        poller = document_intelligence_client.begin_analyze_document(
-            model_id,
-            body=file_bytes, # Pass the actual bytes
-            content_type="application/octet-stream"
-        )
-        result = poller.result()
+        # Shared client: connections are reused across requests
+        document_intelligence_client = get_client(AZURE_ENDPOINT, AZURE_KEY)
+
+        # Streamed to the service in chunks (or as page-range chunks, see chunked_analysis.py);
+        # waits for the shared rate limiter and polls around the predicted finish
+        result = analyze_service(document_intelligence_client, model_id, file_stream, pages,
+                                 features=list(features) or None, analysis_priority=priority)
         logger.info("Analysis successful.")
         return result
     except Exception as e:
         logger.error(f"Error during Document Intelligence analysis: {e}", exc_info=True)
         raise # Re-raise the exception to be caught by the route handler
 
-def convert_analyze_result_to_dict(analyze_result: AnalyzeResult) -> dict:
+# Coalesces concurrent analyses of the same document and model (keyed like the cache)
+analysis_flights = SingleFlight()
+
+# Background analysis jobs; state and results are persisted in SQLite
+job_runner = JobRunner(JobStore(), functools.partial(analyze_document_stream, priority=BULK))
+atexit.register(job_runner.shutdown)
+
+# Top-level parts of the converted result; ?include= selects a subset of them
+RESULT_PARTS = ("content", "pages", "tables", "key_value_pairs", "styles", "languages", "documents")
+
+# Wire-format key of each top-level part
+_PART_KEYS = {
+    "content": "content",
+    "pages": "pages",
+    "tables": "tables",
+    "key_value_pairs": "keyValuePairs",
+    "styles": "styles",
+    "languages": "languages",
+    "documents": "documents",
+}
+
+# What the model has to return for each part (see model_router.py)
+_PART_NEEDS = {
+    "content": TEXT,
+    "pages": TEXT,
+    "tables": TABLES,
+    "key_value_pairs": KEY_VALUE_PAIRS,
+    "styles": TEXT,
+    "languages": TEXT,
+    "documents": FIELDS,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _snake_case(name):
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+def _snake_case_keys(value):
+    """Recursively renames the camelCase keys of a wire-format value to snake_case."""
+    if isinstance(value, Mapping):
+        return {_snake_case(k): _snake_case_keys(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_snake_case_keys(item) for item in value]
+    return value
+
+
+def _serialize_spans(spans):
+    return [{"offset": span["offset"], "length": span["length"]} for span in spans] if spans else []
+
+
+def page_sizes(analyze_result) -> dict:
+    """Maps page numbers to (width, height) in the result's unit, for normalizing polygons."""
+    return {page["pageNumber"]: (page.get("width") or 0, page.get("height") or 0)
+            for page in analyze_result.get("pages") or []}
+
+
+def _normalize_polygon(polygon, size):
+    # Page-relative 0..1 coordinates, so the viewer only multiplies by its canvas size
+    width, height = size
+    if not width or not height:
+        return None
+    return [round(v / (height if i % 2 else width), 6) for i, v in enumerate(polygon)]
+
+
+def _serialize_regions(regions, sizes=None):
+    if not regions:
+        return []
+    serialized = []
+    for region in regions:
+        entry = {"page_number": region["pageNumber"], "polygon": region["polygon"]}
+        size = sizes.get(region["pageNumber"]) if sizes else None
+        if size:
+            entry["normalized_polygon"] = _normalize_polygon(region["polygon"], size)
+        serialized.append(entry)
+    return serialized
+
+
+def serialize_field(field, sizes=None) -> dict:
+    """
+    Serializes one DocumentField, recursing into array and object values.
+    `sizes` (see page_sizes) adds page-relative `normalized_polygon`s to the bounding regions.
+    """
+    field_type = field.get("type")
+    value_key, convert = FIELD_VALUE_SERIALIZERS.get(field_type, (None, None))
+    value = field.get(value_key) if value_key else None
+    if value is not None and convert:
+        value = convert(value, sizes)
+    return {
+        "type": field_type,
+        "value": value,
+        "content": field.get("content"),
+        "bounding_regions": _serialize_regions(field.get("boundingRegions"), sizes),
+        "spans": _serialize_spans(field.get("spans")),
+        "confidence": field.get("confidence")
+    }
+
+
+def _snake_case_value(value, sizes):
+    return _snake_case_keys(value)
+
+
+# DocumentField.type -> (wire-format key of its value, converter(value, sizes) or None).
+# Dates and times are already ISO 8601 strings on the wire.
+FIELD_VALUE_SERIALIZERS = {
+    "string": ("valueString", None),
+    "date": ("valueDate", None),
+    "time": ("valueTime", None),
+    "phoneNumber": ("valuePhoneNumber", None),
+    "number": ("valueNumber", None),
+    "integer": ("valueInteger", None),
+    "boolean": ("valueBoolean", None),
+    "selectionMark": ("valueSelectionMark", None),
+    "selectionGroup": ("valueSelectionGroup", None),
+    "countryRegion": ("valueCountryRegion", None),
+    "signature": ("valueSignature", None),
+    "currency": ("valueCurrency", _snake_case_value),
+    "address": ("valueAddress", _snake_case_value),
+    "array": ("valueArray", lambda items, sizes: [serialize_field(item, sizes) for item in items]),
+    "object": ("valueObject", lambda fields, sizes: {name: serialize_field(f, sizes) for name, f in fields.items()}),
+}
+
+
+def _serialize_page(page):
+    # Basic page info; words and lines are served by api.py
+    return {
+        "page_number": page.get("pageNumber"),
+        "angle": page.get("angle"),
+        "width": page.get("width"),
+        "height": page.get("height"),
+        "unit": page.get("unit")
+    }
+
+
+def page_word_offsets(analyze_result, page_numbers) -> dict:
+    """
+    Maps each of `page_numbers` to the content offsets of its words, in page order, so
+    the words inside a span are found by bisection; positions are api.py's `word_index`.
+    """
+    return {page["pageNumber"]: [word["span"]["offset"] for word in page.get("words") or []]
+            for page in analyze_result.get("pages") or [] if page["pageNumber"] in page_numbers}
+
+
+def _serialize_table(table, sizes, word_offsets):
+    """
+    Serializes a table column-wise in one pass over its cells:
+    - `columns`: one array per column with the content of the cell anchored at each row
+      (None where a merged cell covers the position), and `header_rows`;
+    - `merged_cells`: [row, column, row_span, column_span] of cells spanning several;
+    - `cells`: parallel arrays in cell order - row, column, kind, page, and `polygon`,
+      `normalized_polygon` and `words` packed flat (8 floats / 2 integers per cell).
+      `words` is [first word_index on the cell's page, word count], so a cell's words
+      can be highlighted without scanning the page.
+    """
+    row_count, column_count = table["rowCount"], table["columnCount"]
+    columns = [[None] * row_count for _ in range(column_count)]
+    header_rows = set()
+    merged = []
+    rows, cols, kinds, pages, polygons, normalized, words = [], [], [], [], [], [], []
+    for cell in table.get("cells") or []:
+        row, column = cell["rowIndex"], cell["columnIndex"]
+        kind = cell.get("kind") or "content"
+        columns[column][row] = cell.get("content")
+        if kind == "columnHeader":
+            header_rows.add(row)
+        row_span, column_span = cell.get("rowSpan") or 1, cell.get("columnSpan") or 1
+        if row_span > 1 or column_span > 1:
+            merged.append([row, column, row_span, column_span])
+
+        regions = cell.get("boundingRegions") or []
+        page = regions[0]["pageNumber"] if regions else None
+        polygon = list(regions[0]["polygon"])[:8] if regions else []
+        polygon += [0.0] * (8 - len(polygon))
+        size = sizes.get(page)
+        rows.append(row)
+        cols.append(column)
+        kinds.append(kind)
+        pages.append(page)
+        polygons.extend(polygon)
+        normalized.extend(_normalize_polygon(polygon, size) if size else [0.0] * 8)
+
+        offsets = word_offsets.get(page) or []
+        spans = cell.get("spans") or []
+        if spans and offsets:
+            first = bisect.bisect_left(offsets, min(span["offset"] for span in spans))
+            end = bisect.bisect_left(offsets, max(span["offset"] + span["length"] for span in spans))
+            words.extend((first, end - first))
+        else:
+            words.extend((0, 0))
+
+    caption = table.get("caption")
+    return {
+        "row_count": row_count,
+        "column_count": column_count,
+        "caption": caption.get("content") if caption else None,
+        "bounding_regions": _serialize_regions(table.get("boundingRegions"), sizes),
+        "spans": _serialize_spans(table.get("spans")),
+        "header_rows": sorted(header_rows),
+        "columns": columns,
+        "merged_cells": merged,
+        "cells": {
+            "row": rows,
+            "column": cols,
+            "kind": kinds,
+            "page": pages,
+            "polygon": polygons,
+            "normalized_polygon": normalized,
+            "words": words,
+        },
+    }
+
+
+def _serialize_document(doc, field_names=None, sizes=None):
+    doc_fields = doc.get("fields") or {}
+    names = doc_fields.keys() if field_names is None else [n for n in field_names if n in doc_fields]
+    return {
+        "doc_type": doc.get("docType"),
+        "bounding_regions": _serialize_regions(doc.get("boundingRegions"), sizes),
+        "spans": _serialize_spans(doc.get("spans")),
+        "confidence": doc.get("confidence"),
+        "fields": {name: serialize_field(doc_fields[name], sizes) for name in names}
+    }
+
+
+def parse_projection(include=None, fields=None):
+    """
+    Parses the comma-separated ?include= and ?fields= query parameters.
+    Args:
+        include: Names from RESULT_PARTS; all parts when empty.
+        fields: Document field names (e.g. "InvoiceTotal,VendorName"); all fields when empty.
+                Selecting fields implies including "documents"; on their own they select
+                nothing else.
+    Returns:
+        (parts, field_names) for convert_analyze_result_to_dict.
+    Raises:
+        ValueError: For an unknown part name.
+    """
+    parts = [p.strip() for p in (include or "").split(",") if p.strip()]
+    unknown = [p for p in parts if p not in RESULT_PARTS]
+    if unknown:
+        raise ValueError(f"Unknown include value(s): {', '.join(unknown)}. Expected: {', '.join(RESULT_PARTS)}")
+    field_names = [f.strip() for f in (fields or "").split(",") if f.strip()] or None
+    if not parts:
+        parts = ["documents"] if field_names else list(RESULT_PARTS)
+    elif field_names and "documents" not in parts:
+        parts.append("documents")
+    return tuple(parts), field_names
+
+
+def analysis_needs(parts, add_ons=True) -> set:
+    """
+    What an analysis has to return for the given RESULT_PARTS.
+    Args:
+        parts: Parts from parse_projection.
+        add_ons: Whether parts that cost an add-on feature (key-value pairs) count. Requests
+                 that did not name their parts get what the chosen model returns by itself.
+    """
+    return {_PART_NEEDS[part] for part in parts if add_ons or _PART_NEEDS[part] != KEY_VALUE_PAIRS}
+
+
+def convert_analyze_result_to_dict(analyze_result: AnalyzeResult, include=RESULT_PARTS, fields=None) -> dict:
     """
     Converts the AnalyzeResult object to a JSON-serializable dictionary.
-    Handles potential complexities like nested objects and non-serializable types.
+    Only the requested parts are traversed; values are read straight from the
+    result's wire-format mapping instead of through the SDK's typed attributes.
+    Document and field bounding regions also carry a page-relative `normalized_polygon`,
+    and tables are serialized column-wise (see _serialize_table).
+    Args:
+        analyze_result: The AnalyzeResult to convert.
+        include: Parts of RESULT_PARTS to return.
+        fields: Names of the document fields to return, or None for all of them.
     """
     if not analyze_result:
         return {}
 
-    # Basic serialization - you might need to expand this based on the fields you use
-    # This example focuses on documents and their fields/bounding regions
     output = {
-        "api_version": analyze_result.api_version,
-        "model_id": analyze_result.model_id,
-        "content": analyze_result.content, # Be mindful of large content size
-        "pages": [],
-        "tables": [],
-        "key_value_pairs": [],
-        "styles": [],
-        "languages": [],
-        "documents": []
+        "api_version": analyze_result.get("apiVersion"),
+        "model_id": analyze_result.get("modelId"),
     }
+    for part in include:
+        value = analyze_result.get(_PART_KEYS[part])
+        if part == "content":
+            output["content"] = value  # Be mindful of large content size
+        elif part == "pages":
+            output["pages"] = [_serialize_page(page) for page in value or []]
+        elif part == "documents":
+            sizes = page_sizes(analyze_result)
+            output["documents"] = [_serialize_document(doc, fields, sizes) for doc in value or []]
+        elif part == "tables":
+            sizes = page_sizes(analyze_result)
+            # Only the pages that tables are on are read for the cell -> words index
+            table_pages = {region["pageNumber"] for table in value or [] for region in table.get("boundingRegions") or []}
+            word_offsets = page_word_offsets(analyze_result, table_pages)
+            output["tables"] = [_serialize_table(table, sizes, word_offsets) for table in value or []]
+        else:
+            output[part] = _snake_case_keys(value or [])
+    return output
 
-    # Serialize pages (basic info)
-    if analyze_result.pages:
-        for page in analyze_result.pages:
-             output["pages"].append({
-                 "page_number": page.page_number,
-                 "angle": page.angle,
-                 "width": page.width,
-                 "height": page.height,
-                 "unit": page.unit,
-                 # Add lines, words if needed, carefully handling bounding boxes
-             })
-
-    # Serialize documents and their fields
-    if analyze_result.documents:
-        for doc in analyze_result.documents:
-            doc_dict = {
-                "doc_type": doc.doc_type,
-                "bounding_regions": [],
-                "spans": [{"offset": span.offset, "length": span.length} for span in doc.spans] if doc.spans else [],
-                "confidence": doc.confidence,
-                "fields": {}
-            }
-            if doc.bounding_regions:
-                 for region in doc.bounding_regions:
-                     doc_dict["bounding_regions"].append({
-                         "page_number": region.page_number,
-                         "polygon": region.polygon # Already a list of numbers
-                     })
-
-            if doc.fields:
-                for name, field in doc.fields.items():
-                    field_dict = {
-                        "type": field.type,
-                        "value": None, # Placeholder
-                        "content": field.content,
-                        "bounding_regions": [],
-                        "spans": [{"offset": span.offset, "length": span.length} for span in field.spans] if field.spans else [],
-                        "confidence": field.confidence
-                    }
-                    # Handle different field value types
-                    if field.type == "string":
-                        field_dict["value"] = field.value_string
-                    elif field.type == "date":
-                        field_dict["value"] = field.value_date.isoformat() if field.value_date else None
-                    elif field.type == "time":
-                        field_dict["value"] = field.value_time.isoformat() if field.value_time else None
-                    elif field.type == "phone_number":
-                         field_dict["value"] = field.value_phone_number
-                    elif field.type == "number":
-                         field_dict["value"] = field.value_number
-                    elif field.type == "integer":
-                         field_dict["value"] = field.value_integer
-                    elif field.type == "selection_mark":
-                         field_dict["value"] = field.value_selection_mark
-                    elif field.type == "country_region":
-                         field_dict["value"] = field.value_country_region
-                    elif field.type == "signature":
-                         field_dict["value"] = field.value_signature
-                    elif field.type == "list":
-                         # Recursively convert list items if they are complex
-                         field_dict["value"] = [item.content for item in field.value_list] # Simple example
-                    elif field.type == "dictionary":
-                         # Recursively convert dictionary items if they are complex
-                         field_dict["value"] = {k: v.content for k, v in field.value_dictionary.items()} # Simple example
-                    # Add other types as needed (currency, address, boolean, etc.)
-
-                    if field.bounding_regions:
-                        for region in field.bounding_regions:
-                            field_dict["bounding_regions"].append({
-                                "page_number": region.page_number,
-                                "polygon": region.polygon
-                            })
-                    doc_dict["fields"][name] = field_dict
-            output["documents"].append(doc_dict)
-
-    # Add serialization for tables, key_value_pairs, styles, languages if needed
 
-    return output
+@app.errorhandler(413)
+def handle_request_too_large(e):
+    """Returns a JSON error when an upload exceeds MAX_UPLOAD_BYTES."""
+    logger.warning("Rejected upload larger than the configured maximum.")
+    return jsonify({"error": f"Upload exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes."}), 413
+
+
+@app.route('/cache/stats', methods=['GET'])
+def handle_cache_stats():
+    """Returns the analysis cache hit/miss counters, coalesced requests, reused pages and model routing."""
+    return jsonify({**analysis_cache.stats(), "coalesced": analysis_flights.stats(),
+                    "incremental": incremental_analysis.stats(), "page_store": page_store.stats(),
+                    "routing": model_router.stats()})
+
+
+@app.route('/search', methods=['GET'])
+def handle_search():
+    """
+    Full-text search over every analyzed document, e.g. /search?q="amount due"&limit=10.
+    Returns the matching documents with the polygons of the matched words (see search_index.py).
+    """
+    limit = request.args.get('limit', 20, type=int)
+    try:
+        return jsonify(text_index.search(request.args.get('q', ''), max(1, min(limit, SEARCH_MAX_RESULTS))))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/documents/<document_id>/pages/<int:page_number>', methods=['GET'])
+def handle_document_page(document_id, page_number):
+    """
+    Returns the words and lines of one page of an analyzed document (`document_id` from
+    /analyze or /search), read from the page store without loading the rest of the result.
+    """
+    page = page_store.page(document_id, page_number)
+    if page is None:
+        return jsonify({"error": "Document or page not found"}), 404
+    etag = f'"{document_id}-{page_number}"'
+    # A document id is a content hash, so a page never changes
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag}
+    response = jsonify(page)
+    response.headers['ETag'] = etag
+    return response
 
 
 @app.route('/analyze', methods=['POST'])
@@ -191,7 +483,18 @@ def handle_analyze():
     """
     Flask route to handle document analysis requests.
     Expects a POST request with a file part named 'document'.
+    Optional query parameters project the response, e.g.
+    ?include=documents&fields=InvoiceTotal,VendorName (see parse_projection).
+    The model is the cheapest one that returns the requested parts (see model_router.py);
+    ?model= names one instead.
     """
+    try:
+        include, fields = parse_projection(request.args.get('include'), request.args.get('fields'))
+        needs = analysis_needs(include, add_ons=bool(request.args.get('include')))
+        route = model_router.route(needs, request.args.get('model'), default="prebuilt-invoice")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if 'document' not in request.files:
         logger.warning("No 'document' file part in the request.")
         return jsonify({"error": "No file part named 'document' found"}), 400
@@ -204,25 +507,58 @@ def handle_analyze():
 
     if file:
         try:
-            # --- CHOOSE MODEL ID ---
-            # You could pass this from the frontend if needed, e.g., via query param or another form field
-            # model_id = request.args.get('modelId', 'prebuilt-invoice')
-            model_id = "prebuilt-invoice" # Defaulting to invoice for now
-            # ---------------------
+            model_id = route.model_id
 
-            # Pass the file stream directly
-            analyze_result = analyze_document_stream(file.stream, model_id=model_id)
+            # Copy the upload in bounded chunks (hashing as we go); it only
+            # touches disk above UPLOAD_SPILL_BYTES
+            with spool_stream(file.stream) as upload:
+                logger.info(f"Received {upload.size} bytes (spilled to disk: {upload.spilled}).")
+                metrics.record_upload(upload)
+
+                # Byte-identical re-submissions are served from the cache
+                result_key = cache_key(upload.sha256, route.key)
+                analyze_result = analysis_cache.get(result_key)
+                if analyze_result is None:
+                    def analyze_and_cache():
+                        # A revision of a cached document only sends its changed pages
+                        revision = incremental_analysis.plan_revision(upload.file, route.key, result_key)
+                        analyzed = None
+                        if revision.needs_service:
+                            analyzed = analyze_document_stream(upload.file, model_id=model_id, pages=revision.pages,
+                                                               features=route.features)
+                        result = revision.finish(analyzed)
+                        analysis_cache.put(result_key, result)
+                        page_store.put(result_key, result)
+                        revision.remember(result)
+                        # Indexed for /search on a background thread
+                        text_index.add_async(result_key, result)
+                        return result
+                    # A concurrent identical upload (e.g. a double-click) waits for the same analysis
+                    analyze_result = analysis_flights.do(result_key, analyze_and_cache)
+                else:
+                    logger.info(f"Serving cached analysis for model: {model_id}")
 
             # Convert the result object to a JSON-serializable dictionary
-            result_dict = convert_analyze_result_to_dict(analyze_result)
+            metrics.record_document(analyze_result)
+            with metrics.stage(metrics.EXTRACTION):
+                result_dict = convert_analyze_result_to_dict(analyze_result, include, fields)
+                # For GET /documents/<id>/pages/<n> and matching /search hits
+                result_dict["document_id"] = result_key
 
-            return jsonify(result_dict)
+            with metrics.stage(metrics.SERIALIZATION):
+                return jsonify(result_dict)
 
+        except UploadTooLarge as e:
+            logger.warning(f"Rejected upload: {e}")
+            metrics.record_error(e)
+            return jsonify({"error": str(e)}), 413
         except ValueError as ve: # Catch specific error for missing credentials
              logger.error(f"Configuration error: {ve}")
+             metrics.record_error(ve)
              return jsonify({"error": str(ve)}), 500
         except Exception as e:
             logger.error(f"An error occurred during analysis: {e}", exc_info=True)
+            metrics.record_error(e)
             # Return a generic error message to the client for security
             return jsonify({"error": "An internal server error occurred during analysis."}), 500
     else:
@@ -230,6 +566,81 @@ def handle_analyze():
         logger.warning("File object was present but invalid.")
         return jsonify({"error": "Invalid file"}), 400
 
+@app.route('/jobs', methods=['POST'])
+def handle_submit_job():
+    """
+    Queues a document for background analysis and returns the job id immediately.
+    Expects a POST request with a file part named 'document'; ?model= overrides the routed model.
+    """
+    try:
+        # Job results are returned with every part
+        route = model_router.route(analysis_needs(RESULT_PARTS, add_ons=False), request.args.get('model'),
+                                   default="prebuilt-invoice")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    file = request.files.get('document')
+    if not file or file.filename == '':
+        logger.warning("No 'document' file part in the job request.")
+        return jsonify({"error": "No file part named 'document' found"}), 400
+
+    try:
+        upload = spool_stream(file.stream)
+    except UploadTooLarge as e:
+        logger.warning(f"Rejected upload: {e}")
+        return jsonify({"error": str(e)}), 413
+
+    job_id = job_runner.submit(upload, file.filename, route.model_id)
+    logger.info(f"Queued job {job_id} for {file.filename}")
+    response = jsonify({"id": job_id, "status": "queued"})
+    response.status_code = 202
+    response.headers['Location'] = f"/jobs/{job_id}"
+    response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def handle_get_job(job_id):
+    """Returns the job status. Supports If-None-Match; unfinished jobs carry a Retry-After hint."""
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    etag = job_etag(job)
+    if request.headers.get('If-None-Match') == etag:
+        response = make_response('', 304)
+    else:
+        response = jsonify(job_status_body(job))
+    response.headers['ETag'] = etag
+    if not is_finished(job):
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def handle_get_job_result(job_id):
+    """Returns the converted analysis of a finished job (202 with Retry-After while it is still running)."""
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not is_finished(job):
+        response = jsonify(job_status_body(job))
+        response.status_code = 202
+        response.headers['Location'] = f"/jobs/{job_id}"
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+        return response
+    if job["status"] == FAILED:
+        return jsonify({"error": f"Job failed: {job['error']}"}), 409
+
+    # A succeeded job's result never changes, so the ETag only depends on the id
+    etag = f'"{job_id}-result"'
+    if request.headers.get('If-None-Match') == etag:
+        response = make_response('', 304)
+    else:
+        response = jsonify(convert_analyze_result_to_dict(job_runner.store.get_result(job_id)))
+    response.headers['ETag'] = etag
+    return response
+
 if __name__ == '__main__':
     # Use host='0.0.0.0' to make it accessible on your network if needed
     # Debug=True is helpful during development but should be False in production
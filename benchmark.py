@@ -0,0 +1,239 @@
+"""
+Load-test benchmark for app.py and api.py against the local fake service.
+
+Each endpoint gets a fresh server process (so its peak RSS is its own) that is
+pointed at an in-process fake_document_intelligence server, then driven with
+--concurrency parallel clients for --requests requests. No Azure resource or
+network access is needed.
+
+    python benchmark.py --requests 200 --concurrency 16 --latency 1.0
+    python benchmark.py --endpoints api:/analyze-pdf --same-document --json results.json
+    python benchmark.py --document corpus --endpoints api:/analyze-pdf   # generate_invoices.py corpus
+    python benchmark.py --endpoints flask:/analyze --model prebuilt-invoice   # pin a model instead of routing
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from pypdf import PdfReader
+
+from fake_document_intelligence import FakeService, start_server
+
+# name -> (server kind, path, how the document is sent)
+ENDPOINTS = {
+    "api:/analyze-pdf": ("api", "/analyze-pdf", "multipart:file"),
+    "api:/analyze-pdf/stream": ("api", "/analyze-pdf/stream", "raw"),
+    "flask:/analyze": ("flask", "/analyze", "multipart:document"),
+}
+SERVER_START_TIMEOUT_SECONDS = 30
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_rss_bytes(pid):
+    """Peak resident set size of a process (Linux /proc only), or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_app(kind, port, env):
+    if kind == "api":
+        command = [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1",
+                   "--port", str(port), "--no-reload", "--no-debugger", "--with-threads"]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with code {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start within {SERVER_START_TIMEOUT_SECONDS}s")
+
+
+def load_documents(path):
+    """
+    Returns [(bytes, page count)] of the PDF at `path`, or of every PDF in a
+    directory (e.g. a corpus from generate_invoices.py), sent in turn.
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(".pdf")]
+    else:
+        paths = [path]
+    documents = []
+    for document_path in paths:
+        with open(document_path, "rb") as f:
+            document = f.read()
+        documents.append((document, len(PdfReader(io.BytesIO(document)).pages)))
+    return documents
+
+
+def document_for(base, index, same_document):
+    # A trailing PDF comment makes every upload unique so the result cache is not measured
+    return base if same_document else base + f"\n%benchmark-{index}\n".encode("ascii")
+
+
+def send(session, url, mode, document):
+    if mode == "raw":
+        return session.post(url, data=document, headers={"Content-Type": "application/pdf"})
+    field = mode.split(":", 1)[1]
+    return session.post(url, files={field: ("document.pdf", document, "application/pdf")})
+
+
+def run_endpoint(name, args, documents, service_url):
+    kind, path, mode = ENDPOINTS[name]
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT=service_url,
+            AZURE_DOCUMENT_INTELLIGENCE_KEY="benchmark",
+            ANALYSIS_CACHE_DIR=os.path.join(workdir, "cache"),
+            JOB_DB_PATH=os.path.join(workdir, "jobs.sqlite3"),
+        )
+        process = start_app(kind, port, env)
+        url = f"http://127.0.0.1:{port}{path}" + (f"?model={args.model}" if args.model else "")
+        local = threading.local()
+
+        def one(index):
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            base_document, pages = documents[index % len(documents)]
+            started = time.perf_counter()
+            try:
+                response = send(local.session, url, mode, document_for(base_document, index, args.same_document))
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok, pages
+
+        try:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(one, range(-args.warmup, 0)))
+                started = time.perf_counter()
+                samples = list(executor.map(one, range(args.requests)))
+                elapsed = time.perf_counter() - started
+            rss = peak_rss_bytes(process.pid)
+            # Which models served the run, and how long their analyses took (see model_router.py)
+            routing = requests.get(f"http://127.0.0.1:{port}/cache/stats", timeout=10).json().get("routing", {})
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    latencies = sorted(latency for latency, ok, _ in samples if ok)
+    return {
+        "endpoint": name,
+        "requests": len(samples),
+        "errors": sum(1 for _, ok, _ in samples if not ok),
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "pages_per_s": round(sum(pages for _, ok, pages in samples if ok) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(rss / (1024 * 1024), 1) if rss else None,
+        "models": ",".join(sorted(routing.get("decisions", {}))) or None,
+        "routing": routing,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def print_table(rows):
+    columns = ["endpoint", "requests", "errors", "p50_ms", "p95_ms", "p99_ms", "rps", "pages_per_s", "peak_rss_mb",
+               "models"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app.py and api.py against the fake Document Intelligence service")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--document", default="sample_invoice.pdf",
+                        help="PDF to upload, or a directory of PDFs (e.g. a generate_invoices.py corpus) sent in turn")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests sent first")
+    parser.add_argument("--same-document", action="store_true",
+                        help="Send identical bytes every time (exercises the cache and coalescing)")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake service analysis latency (seconds)")
+    parser.add_argument("--latency-per-page", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of analyze calls answered with 429")
+    parser.add_argument("--max-tps", type=float, default=0.0, help="Fake service quota (0 = unlimited)")
+    parser.add_argument("--model", help="Send ?model= with every request instead of letting the server route")
+    parser.add_argument("--recordings", default="recordings")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.endpoints.split(",") if n.strip()]
+    unknown = [n for n in names if n not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoint(s): {', '.join(unknown)}")
+
+    documents = load_documents(args.document)
+    if not documents:
+        parser.error(f"No PDFs in {args.document}")
+
+    service = FakeService(args.recordings, args.latency, args.latency_per_page, args.jitter,
+                          args.throttle_rate, args.max_tps)
+    server = start_server(service)
+    service_url = f"http://127.0.0.1:{server.server_port}"
+
+    rows = []
+    for name in names:
+        print(f"Benchmarking {name} ({args.requests} requests, concurrency {args.concurrency})...", flush=True)
+        rows.append(run_endpoint(name, args, documents, service_url))
+    server.shutdown()
+
+    print()
+    print_table(rows)
+    print(f"\nFake service: {service.stats}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": rows, "service": service.stats}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
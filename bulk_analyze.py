@@ -0,0 +1,347 @@
+"""
+Resumable bulk analysis of a directory tree of documents.
+
+Every matching file under the input directory is analyzed by a pool of worker
+threads sharing one client (so the rate limiter's BULK lane and the pooled
+connections apply), and one JSON record per document is appended to the output
+file:
+
+    {"path": "2024/03/inv-1.pdf", "sha256": "...", "model_id": "prebuilt-read",
+     "pages": 2, "words": [...], "lines": [...]}
+
+A SQLite manifest next to the output checkpoints every finished file (size,
+mtime, outcome and where its record ends in the output). Running the same
+command again skips the files that already succeeded and are unchanged, retries
+failed ones, and first cuts the output back to the last checkpoint, so records
+written after it by an interrupted run are not duplicated. A file that changed
+since it was analyzed gets a new record after its old one.
+
+    python bulk_analyze.py invoices/ --output invoices.jsonl --workers 16
+"""
+import argparse
+import functools
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import orjson
+from dotenv import load_dotenv
+
+from chunked_analysis import analyze_service
+from document_client import close_clients, get_client
+from extract_text_with_coords import extract_text_and_coords, extract_words_and_coords
+from rate_limiter import BULK
+from text_layer import analyze_with_text_layer
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+FAILED = "failed"
+
+# Parts of a document record that --include can select
+RECORD_PARTS = ("words", "lines", "result")
+# Finished files behind the throughput (and so the ETA) estimate
+THROUGHPUT_WINDOW = 200
+# Checkpoint at least this often; a crash loses at most this much finished work
+CHECKPOINT_SECONDS = 2.0
+# Read size when hashing input files
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class Manifest:
+    """
+    SQLite checkpoint of a bulk run: one row per input file with the size and
+    mtime it had when processed, the outcome and, for successes, the offset at
+    which its record ends in the output file. Used from one thread only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    sha256 TEXT,
+                    pages INTEGER,
+                    output_end INTEGER,
+                    error TEXT,
+                    finished_at REAL NOT NULL
+                )
+                """
+            )
+
+    def succeeded(self) -> dict:
+        """Returns {path: (size, mtime_ns)} of the files whose record is in the output."""
+        rows = self._conn.execute("SELECT path, size, mtime_ns FROM files WHERE status = ?", (OK,))
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def output_bytes(self) -> int:
+        """Length of the output file covered by the checkpoint."""
+        row = self._conn.execute("SELECT MAX(output_end) FROM files WHERE status = ?", (OK,)).fetchone()
+        return row[0] or 0
+
+    def record(self, path, size, mtime_ns, status, sha256=None, pages=None, output_end=None, error=None) -> None:
+        """Records a finished file; it is checkpointed by the next commit()."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, status, sha256, pages, output_end, error, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, status, sha256, pages, output_end, error, time.time())
+        )
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def reset(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM files")
+
+    def failures(self, limit=10):
+        """Returns [(path, error)] of failed files, most recent first."""
+        return self._conn.execute(
+            "SELECT path, error FROM files WHERE status = ? ORDER BY finished_at DESC LIMIT ?", (FAILED, limit)
+        ).fetchall()
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+
+class Progress:
+    """Counts finished files and estimates throughput and ETA over the last THROUGHPUT_WINDOW of them."""
+
+    def __init__(self, total, window=THROUGHPUT_WINDOW):
+        self.total = total
+        self.ok = 0
+        self.failed = 0
+        self.pages = 0
+        self.started = time.monotonic()
+        self._recent = deque(maxlen=window)  # (finished at, pages)
+
+    def finished(self, ok, pages=0) -> None:
+        if ok:
+            self.ok += 1
+            self.pages += pages
+        else:
+            self.failed += 1
+        self._recent.append((time.monotonic(), pages))
+
+    def rates(self):
+        """Returns (files/s, pages/s) over the recent window (since the start while it fills)."""
+        now = time.monotonic()
+        if not self._recent:
+            return 0.0, 0.0
+        since = self._recent[0][0] if len(self._recent) == self._recent.maxlen else self.started
+        elapsed = max(now - since, 1e-9)
+        return len(self._recent) / elapsed, sum(pages for _, pages in self._recent) / elapsed
+
+    def line(self) -> str:
+        done = self.ok + self.failed
+        files_per_second, pages_per_second = self.rates()
+        remaining = self.total - done
+        eta = _duration(remaining / files_per_second) if files_per_second and remaining else "-"
+        percent = 100.0 * done / self.total if self.total else 100.0
+        return (f"{done}/{self.total} files ({percent:.1f}%), {self.failed} failed | "
+                f"{files_per_second:.2f} files/s, {pages_per_second:.1f} pages/s | "
+                f"elapsed {_duration(time.monotonic() - self.started)}, ETA {eta}")
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def find_documents(root, extensions):
+    """Returns the relative paths of the files under `root` with one of `extensions`, sorted."""
+    paths = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return paths
+
+
+def analyze_file_document(document, model_id):
+    # Bulk work: the rate limiter dispatches interactive requests ahead of it
+    analyze = functools.partial(analyze_service, get_client(), model_id, document, analysis_priority=BULK)
+    # Pages with a usable PDF text layer are read locally; only the rest are sent
+    return analyze_with_text_layer(document, model_id, analyze)
+
+
+def file_sha256(f) -> str:
+    """Hex SHA-256 of an open binary file, read in chunks; the position is left at the end."""
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def analyze_file(root, path, model_id, include, index):
+    """
+    Analyzes one file on a worker thread.
+    Returns:
+        (encoded JSONL record, sha256, page count).
+    """
+    with open(os.path.join(root, path), "rb") as f:
+        sha256 = file_sha256(f)
+        f.seek(0)
+        result = analyze_file_document(f, model_id)
+    pages = len(result.pages or [])
+    record = {"path": path, "sha256": sha256, "model_id": model_id, "pages": pages}
+    if "words" in include:
+        record["words"] = extract_words_and_coords(result)
+    if "lines" in include:
+        record["lines"] = extract_text_and_coords(result)
+    if "result" in include:
+        record["result"] = result.as_dict()
+    if index:
+        # Imported here so runs without --index do not open the search database
+        from result_cache import cache_key
+        from search_index import text_index
+        text_index.add(cache_key(sha256, model_id), result, path)
+    return orjson.dumps(record) + b"\n", sha256, pages
+
+
+def open_output(path, manifest):
+    """Opens the output for appending after the last checkpointed record."""
+    committed = manifest.output_bytes()
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size < committed:
+        # The output was replaced or truncated: its checkpoint no longer describes it
+        logger.warning(f"{path} is shorter than its checkpoint; starting over")
+        manifest.reset()
+        committed = 0
+    output = open(path, "r+b" if os.path.exists(path) else "wb")
+    if size > committed:
+        logger.info(f"Dropping {size - committed} bytes written after the last checkpoint")
+    output.truncate(committed)
+    output.seek(committed)
+    return output
+
+
+def run(args) -> int:
+    """Analyzes every pending file under args.input; returns the process exit code."""
+    extensions = tuple(e.strip().lower() for e in args.extensions.split(",") if e.strip())
+    manifest = Manifest(args.manifest or f"{args.output}.manifest.sqlite3")
+    output = open_output(args.output, manifest)
+
+    succeeded = manifest.succeeded()
+    todo = []
+    skipped = 0
+    for path in find_documents(args.input, extensions):
+        stat = os.stat(os.path.join(args.input, path))
+        if succeeded.get(path) == (stat.st_size, stat.st_mtime_ns):
+            skipped += 1
+        else:
+            todo.append((path, stat.st_size, stat.st_mtime_ns))
+    logger.info(f"{len(todo)} files to analyze ({skipped} already done) with {args.workers} workers")
+
+    progress = Progress(len(todo))
+    pending = iter(todo)
+    in_flight = {}  # future -> (path, size, mtime_ns)
+    last_checkpoint = last_report = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="bulk-analysis")
+
+    def checkpoint():
+        # Records must be on disk before the manifest points past them
+        output.flush()
+        os.fsync(output.fileno())
+        manifest.commit()
+
+    try:
+        while True:
+            # Only a bounded number of files are queued, so 100k paths do not become 100k futures
+            while len(in_flight) < args.workers * 2:
+                item = next(pending, None)
+                if item is None:
+                    break
+                future = executor.submit(analyze_file, args.input, item[0], args.model, args.include, args.index)
+                in_flight[future] = item
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, timeout=args.progress_seconds, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, size, mtime_ns = in_flight.pop(future)
+                try:
+                    line, sha256, pages = future.result()
+                except Exception as e:
+                    logger.warning(f"Failed to analyze {path}: {e}")
+                    manifest.record(path, size, mtime_ns, FAILED, error=str(e))
+                    progress.finished(False)
+                    continue
+                output.write(line)
+                manifest.record(path, size, mtime_ns, OK, sha256, pages, output.tell())
+                progress.finished(True, pages)
+
+            now = time.monotonic()
+            if now - last_checkpoint >= CHECKPOINT_SECONDS:
+                checkpoint()
+                last_checkpoint = now
+            if now - last_report >= args.progress_seconds:
+                logger.info(progress.line())
+                last_report = now
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted; {len(in_flight)} unfinished files will be analyzed on the next run")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    finally:
+        checkpoint()
+        output.close()
+        logger.info(progress.line())
+        for path, error in manifest.failures():
+            logger.info(f"Failed: {path}: {error}")
+        manifest.close()
+    executor.shutdown()
+    return 1 if progress.failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory tree of documents into a JSONL file (resumable)")
+    parser.add_argument("input", help="Directory to walk")
+    parser.add_argument("--output", default="bulk_results.jsonl", help="JSONL file, one record per document")
+    parser.add_argument("--manifest", help="Checkpoint database (default: <output>.manifest.sqlite3)")
+    parser.add_argument("--model", default="prebuilt-read", help="Model to analyze with (prebuilt-read returns the words and lines)")
+    parser.add_argument("--workers", type=int, default=8, help="Documents analyzed at the same time")
+    parser.add_argument("--extensions", default=".pdf", help="Comma-separated file extensions to analyze")
+    parser.add_argument("--include", default="words,lines",
+                        help=f"Comma-separated record parts: {', '.join(RECORD_PARTS)}")
+    parser.add_argument("--index", action="store_true", help="Also add every analysis to the search index")
+    parser.add_argument("--progress-seconds", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    args.include = tuple(p.strip() for p in args.include.split(",") if p.strip())
+    unknown = [p for p in args.include if p not in RECORD_PARTS]
+    if unknown:
+        parser.error(f"Unknown --include value(s): {', '.join(unknown)}")
+    if not os.path.isdir(args.input):
+        parser.error(f"{args.input} is not a directory")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", stream=sys.stderr)
+    # The SDK logs every HTTP request and adaptive_polling every analysis at INFO
+    logging.getLogger("azure").setLevel(logging.WARNING)
+    logging.getLogger("adaptive_polling").setLevel(logging.WARNING)
+    logging.getLogger("text_layer").setLevel(logging.WARNING)
+    try:
+        sys.exit(run(args))
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import io
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+from pypdf import PdfReader
+from pypdf.errors import PdfReadError
+
+import metrics
+from adaptive_polling import adaptive_polling, adaptive_polling_async
+from model_router import model_router
+
+logger = logging.getLogger(__name__)
+
+# Opt-in page chunking: 0 disables it. Documents with more pages than this are split
+# into page ranges that are analyzed concurrently and merged back into one result.
+ANALYZE_CHUNK_PAGES = int(os.environ.get("ANALYZE_CHUNK_PAGES", "0"))
+ANALYZE_CHUNK_PARALLELISM = int(os.environ.get("ANALYZE_CHUNK_PARALLELISM", "4"))
+# Models whose results are page-local and can be merged from chunks; others (e.g.
+# prebuilt-invoice, whose fields span pages) are always analyzed in one request
+CHUNK_MODELS = os.environ.get("CHUNK_MODELS", "prebuilt-read,prebuilt-layout").split(",")
+
+# Pages are separated by a single newline in the top-level content of a single-shot analysis
+PAGE_SEPARATOR = "\n"
+
+# Top-level collections whose items are concatenated across chunks
+_MERGED_LISTS = ("pages", "paragraphs", "tables", "figures", "sections", "keyValuePairs",
+                 "styles", "languages", "documents", "warnings")
+# JSON-pointer style cross references such as "/paragraphs/12" in sections/figures/tables
+_ELEMENT_REF = re.compile(r"^/(paragraphs|tables|figures|sections|keyValuePairs)/(\d+)$")
+
+
+def count_pages(document) -> int:
+    """
+    Returns the number of pages in a PDF; other inputs (images) count as one page.
+    `document` is bytes or a seekable binary file, whose position is left unchanged.
+    """
+    if isinstance(document, (bytes, bytearray)):
+        head, source, position = document[:1024], io.BytesIO(document), None
+    else:
+        position = document.tell()
+        head, source = document.read(1024), document
+        document.seek(position)
+    if not head.lstrip().startswith(b"%PDF"):
+        return 1
+    try:
+        return len(PdfReader(source).pages)
+    except PdfReadError as e:
+        # Let the service decide what to do with a PDF we cannot parse
+        logger.warning(f"Could not count PDF pages, analyzing in one request: {e}")
+        return 1
+    finally:
+        if position is not None:
+            source.seek(position)
+
+
+def page_spec(page_numbers) -> str:
+    """Formats sorted 1-based page numbers as the service's `pages` parameter, e.g. "2,5-7"."""
+    runs = []
+    for number in page_numbers:
+        if runs and runs[-1][1] == number - 1:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
+    return ",".join(f"{a}" if a == b else f"{a}-{b}" for a, b in runs)
+
+
+def pages_from_spec(pages: str):
+    """Returns the sorted page numbers selected by a `pages` parameter such as "1-3,5"."""
+    numbers = set()
+    for part in pages.split(","):
+        first, _, last = part.strip().partition("-")
+        numbers.update(range(int(first), int(last or first) + 1))
+    return sorted(numbers)
+
+
+def pages_in_spec(pages: str) -> int:
+    """Counts the pages selected by a `pages` parameter such as "1-3,5"."""
+    count = 0
+    for part in pages.split(","):
+        first, _, last = part.strip().partition("-")
+        count += int(last or first) - int(first) + 1
+    return count
+
+
+def page_ranges(page_count, chunk_pages):
+    """Splits 1..page_count into (first, last) ranges of at most chunk_pages pages."""
+    return [(first, min(first + chunk_pages - 1, page_count))
+            for first in range(1, page_count + 1, chunk_pages)]
+
+
+def _shift(node, offset_delta, page_delta, ref_deltas):
+    """Recursively fixes span offsets, page numbers and element references of one chunk."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("span", "spans"):
+                for span in (value if isinstance(value, list) else [value]):
+                    span["offset"] += offset_delta
+            elif key == "pageNumber" and isinstance(value, int):
+                node[key] = value + page_delta
+            elif key == "elements" and isinstance(value, list):
+                node[key] = [_shift_ref(ref, ref_deltas) for ref in value]
+            else:
+                _shift(value, offset_delta, page_delta, ref_deltas)
+    elif isinstance(node, list):
+        for item in node:
+            _shift(item, offset_delta, page_delta, ref_deltas)
+
+
+def _shift_ref(ref, ref_deltas):
+    match = _ELEMENT_REF.match(ref) if isinstance(ref, str) else None
+    if not match:
+        return ref
+    kind, index = match.groups()
+    return f"/{kind}/{int(index) + ref_deltas.get(kind, 0)}"
+
+
+def _content_length(chunk):
+    # Measure the chunk in the service's own string index units (e.g. text elements)
+    # by looking at where its page spans end; fall back to the Python length.
+    ends = [span["offset"] + span["length"]
+            for page in chunk.get("pages", []) for span in page.get("spans", [])]
+    return max(ends) if ends else len(chunk.get("content", ""))
+
+
+def _merge_root_section(root, chunk_root):
+    root.setdefault("elements", []).extend(chunk_root.get("elements") or [])
+    spans = root.setdefault("spans", [])
+    for span in chunk_root.get("spans") or []:
+        last = spans[-1] if spans else None
+        # Spans separated only by the page separator become one, as in a single-shot result
+        if last and span["offset"] <= last["offset"] + last["length"] + len(PAGE_SEPARATOR):
+            last["length"] = span["offset"] + span["length"] - last["offset"]
+        else:
+            spans.append(span)
+
+
+def merge_results(chunks, first_pages):
+    """
+    Stitches per-chunk analyses into one AnalyzeResult.
+    Args:
+        chunks: AnalyzeResult objects or result dicts (whose lists are shifted in place), in page order.
+        first_pages: The first page number requested for each chunk.
+    Returns:
+        One AnalyzeResult whose content, spans, page numbers and element references
+        are the same as if the whole document had been analyzed at once.
+    """
+    merged = None
+    content_parts = []
+    offset = 0
+    for chunk_result, first_page in zip(chunks, first_pages):
+        # Dicts are used as they are: converting them to models and back costs more than the merge
+        chunk = chunk_result if isinstance(chunk_result, dict) else chunk_result.as_dict()
+        pages = chunk.get("pages") or []
+        # The service normally reports absolute page numbers for a page range;
+        # renumber only if this chunk came back numbered from 1.
+        page_delta = first_page - pages[0]["pageNumber"] if pages else 0
+        if merged is None:
+            merged = {key: value for key, value in chunk.items() if key not in _MERGED_LISTS}
+            for key in _MERGED_LISTS:
+                merged[key] = []
+        ref_deltas = {kind: len(merged.get(kind) or []) for kind in
+                      ("paragraphs", "tables", "figures", "sections", "keyValuePairs")}
+        # Every chunk starts with its own root section; later ones are folded into the first
+        fold_root = bool(merged["sections"] and chunk.get("sections"))
+        if fold_root:
+            ref_deltas["sections"] -= 1
+        chunk_content = chunk.get("content", "")
+        chunk_length = _content_length(chunk)
+        if content_parts:
+            content_parts.append(PAGE_SEPARATOR)
+            offset += len(PAGE_SEPARATOR)
+        for key in _MERGED_LISTS:
+            items = chunk.get(key) or []
+            _shift(items, offset, page_delta, ref_deltas)
+            if key == "sections" and fold_root:
+                _merge_root_section(merged["sections"][0], items.pop(0))
+            merged[key].extend(items)
+        content_parts.append(chunk_content)
+        offset += chunk_length
+
+    if merged is None:
+        return None
+    merged["content"] = "".join(content_parts)
+    for key in _MERGED_LISTS:
+        if not merged[key]:
+            del merged[key]
+    return AnalyzeResult(merged)
+
+
+def should_chunk(model_id, chunk_pages=None) -> bool:
+    """Whether analyses with `model_id` are split into page-range chunks."""
+    return bool(chunk_pages or ANALYZE_CHUNK_PAGES) and model_id in CHUNK_MODELS
+
+
+def analyze_in_chunks(client, model_id, document: bytes, chunk_pages=None, parallelism=None, **kwargs):
+    """
+    Analyzes a PDF as concurrent page-range requests on the synchronous client.
+    Falls back to a single request when the document fits in one chunk or the
+    model is not in CHUNK_MODELS.
+    Args:
+        client: DocumentIntelligenceClient.
+        model_id: The ID of the model to use.
+        document: The PDF bytes (every chunk request uploads the whole file with a `pages` range).
+        chunk_pages: Pages per chunk; defaults to ANALYZE_CHUNK_PAGES.
+        parallelism: Concurrent chunk requests; defaults to ANALYZE_CHUNK_PARALLELISM.
+        kwargs: Extra keyword arguments for begin_analyze_document.
+    """
+    chunk_pages = chunk_pages or ANALYZE_CHUNK_PAGES
+    parallelism = parallelism or ANALYZE_CHUNK_PARALLELISM
+    page_count = count_pages(document)
+    ranges = page_ranges(page_count, chunk_pages) if should_chunk(model_id, chunk_pages) else []
+
+    def analyze(first=1, last=page_count):
+        with metrics.stage(metrics.SERVICE_SUBMIT):
+            poller = client.begin_analyze_document(
+                model_id,
+                body=document,
+                pages=f"{first}-{last}" if len(ranges) > 1 else None,
+                content_type="application/octet-stream",
+                polling=adaptive_polling(model_id, last - first + 1),
+                **kwargs
+            )
+        with metrics.stage(metrics.POLLING_WAIT):
+            return poller.result()
+
+    if len(ranges) <= 1:
+        return analyze()
+
+    logger.info(f"Analyzing {ranges[-1][1]} pages as {len(ranges)} chunks of up to {chunk_pages} pages")
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        # Each chunk runs in a copy of the caller's context so its stages reach the request timer
+        futures = [executor.submit(contextvars.copy_context().run, analyze, first, last) for first, last in ranges]
+        results = [future.result() for future in futures]
+    return merge_results(results, [first for first, _ in ranges])
+
+
+def analyze_service(client, model_id, document, pages=None, chunk_pages=None, parallelism=None, **kwargs):
+    """
+    Analyzes a document on the synchronous client: as concurrent page-range chunks
+    when should_chunk() allows it and no `pages` are given, otherwise in one request.
+    The duration is recorded per model (see model_router.py).
+    Args:
+        client: DocumentIntelligenceClient.
+        model_id: The ID of the model to use.
+        document: Bytes or a seekable binary file, streamed to the service (read into memory only to chunk).
+        pages: Optional `pages` parameter (e.g. "2,5-6") to analyze only those pages.
+        chunk_pages: Pages per chunk; defaults to ANALYZE_CHUNK_PAGES.
+        parallelism: Concurrent chunk requests; defaults to ANALYZE_CHUNK_PARALLELISM.
+        kwargs: Extra keyword arguments for begin_analyze_document (e.g. analysis_priority, features).
+    """
+    started = time.perf_counter()
+    if should_chunk(model_id, chunk_pages) and not pages:
+        # Chunk requests run concurrently, so each needs the whole PDF as bytes
+        if not isinstance(document, (bytes, bytearray)):
+            document = document.read()
+        result = analyze_in_chunks(client, model_id, document, chunk_pages, parallelism, **kwargs)
+    else:
+        with metrics.stage(metrics.SERVICE_SUBMIT):
+            poller = client.begin_analyze_document(
+                model_id,
+                body=document,
+                pages=pages,
+                content_type="application/octet-stream",
+                # Polls around the completion time predicted from the page count
+                polling=adaptive_polling(model_id, pages_in_spec(pages) if pages else count_pages(document)),
+                **kwargs
+            )
+        with metrics.stage(metrics.POLLING_WAIT):
+            result = poller.result()
+    # Per-model durations show whether the routing pays off
+    model_router.record_analysis(model_id, result, time.perf_counter() - started)
+    return result
+
+
+async def analyze_in_chunks_async(client, model_id, document: bytes, chunk_pages=None, parallelism=None, **kwargs):
+    """Async counterpart of analyze_in_chunks for the aio DocumentIntelligenceClient."""
+    chunk_pages = chunk_pages or ANALYZE_CHUNK_PAGES
+    parallelism = parallelism or ANALYZE_CHUNK_PARALLELISM
+    page_count = await asyncio.to_thread(count_pages, document)
+    ranges = page_ranges(page_count, chunk_pages) if should_chunk(model_id, chunk_pages) else []
+    slots = asyncio.Semaphore(parallelism)
+
+    async def analyze(first=1, last=page_count):
+        async with slots:
+            with metrics.stage(metrics.SERVICE_SUBMIT):
+                poller = await client.begin_analyze_document(
+                    model_id,
+                    body=document,
+                    pages=f"{first}-{last}" if len(ranges) > 1 else None,
+                    content_type="application/octet-stream",
+                    polling=adaptive_polling_async(model_id, last - first + 1),
+                    **kwargs
+                )
+            with metrics.stage(metrics.POLLING_WAIT):
+                return await poller.result()
+
+    if len(ranges) <= 1:
+        return await analyze()
+
+    logger.info(f"Analyzing {ranges[-1][1]} pages as {len(ranges)} chunks of up to {chunk_pages} pages")
+    results = await asyncio.gather(*(analyze(first, last) for first, last in ranges))
+    return merge_results(results, [first for first, _ in ranges])
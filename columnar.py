@@ -0,0 +1,209 @@
+"""
+Compact columnar encoding of the words and lines of an analysis.
+
+Instead of one dict (with a list of 8 floats) per word, every word and line of
+the document is stored in a handful of flat arrays. The format is meant to be
+read in place - e.g. from an mmap - without building per-word Python objects.
+
+Binary layout (all integers and floats little-endian):
+
+    Header (88 bytes)
+        0   8s   magic  b"DICOLMN1"
+        8   u32  version (1)
+        12  u32  page_count
+        16  u32  word_count (W)
+        20  u32  line_count (L)
+        24  u64  offset of the page table
+        32  u64  offset of the word text offsets
+        40  u64  offset of the word text blob
+        48  u64  offset of the word polygons
+        56  u64  offset of the line text offsets
+        64  u64  offset of the line text blob
+        72  u64  offset of the line polygons
+        80  u64  total size in bytes
+
+    Page table: page_count entries of 32 bytes
+        u32 page_number, f32 width, f32 height, u32 unit (0 = inch, 1 = pixel, 2 = other),
+        u32 first_word, u32 word_count, u32 first_line, u32 line_count
+
+    Text offsets: (W + 1) u32 values; word i is blob[offsets[i]:offsets[i + 1]] (UTF-8)
+    Text blob:    the concatenated UTF-8 text, zero-padded to a multiple of 4 bytes
+    Polygons:     W x 8 f32 values (x1, y1, ... x4, y4) in the page's unit
+
+Lines use the same three sections. Polygons that do not have exactly four
+points are stored as their axis-aligned bounding box. Words and lines are
+numbered document-wide; the page table gives each page's slice.
+
+This module has no dependencies outside the standard library so consumers can
+copy ColumnarDocument as-is.
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"DICOLMN1"
+VERSION = 1
+MEDIA_TYPE = "application/vnd.docintel.columnar"
+
+_HEADER = struct.Struct("<8sIIII8Q")
+_PAGE = struct.Struct("<IffIIIII")
+_UNITS = {"inch": 0, "pixel": 1}
+_UNIT_NAMES = {0: "inch", 1: "pixel", 2: "other"}
+
+
+def _quad(polygon):
+    # Always store 4 points; fall back to the bounding box for other shapes
+    if polygon and len(polygon) == 8:
+        return polygon
+    if not polygon:
+        return [0.0] * 8
+    xs, ys = polygon[0::2], polygon[1::2]
+    left, top, right, bottom = min(xs), min(ys), max(xs), max(ys)
+    return [left, top, right, top, right, bottom, left, bottom]
+
+
+def _pack_column(items):
+    """Returns (offsets bytes, padded text blob, polygons bytes) for words or lines."""
+    offsets = array("I", [0])
+    blob = bytearray()
+    polygons = array("f")
+    for item in items:
+        blob += item.content.encode("utf-8")
+        offsets.append(len(blob))
+        polygons.extend(_quad(item.polygon))
+    blob += b"\0" * (-len(blob) % 4)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        polygons.byteswap()
+    return offsets.tobytes(), bytes(blob), polygons.tobytes()
+
+
+def encode_columnar(result) -> bytes:
+    """
+    Encodes the words and lines of an AnalyzeResult in the columnar layout.
+    Args:
+        result: AnalyzeResult (or any object with the same pages/words/lines shape).
+    Returns:
+        The encoded document as bytes.
+    """
+    pages = result.pages or []
+    page_table = bytearray()
+    all_words, all_lines = [], []
+    for page in pages:
+        words = page.words or []
+        lines = page.lines or []
+        page_table += _PAGE.pack(
+            page.page_number, page.width or 0.0, page.height or 0.0, _UNITS.get(page.unit, 2),
+            len(all_words), len(words), len(all_lines), len(lines)
+        )
+        all_words.extend(words)
+        all_lines.extend(lines)
+
+    sections = [bytes(page_table)]
+    sections.extend(_pack_column(all_words))
+    sections.extend(_pack_column(all_lines))
+
+    offsets = []
+    position = _HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+    header = _HEADER.pack(MAGIC, VERSION, len(pages), len(all_words), len(all_lines), *offsets, position)
+    return header + b"".join(sections)
+
+
+class ColumnarDocument:
+    """
+    Read-only view over an encoded document. Nothing is copied: text and
+    polygons are decoded on access from the underlying buffer.
+
+        doc = ColumnarDocument.open("result.bin")
+        for page in doc.pages():
+            for i in page["words"]:
+                print(doc.word_text(i), doc.word_polygon(i))
+    """
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        if len(self._buffer) < _HEADER.size:
+            raise ValueError("Columnar document is truncated")
+        (magic, version, self.page_count, self.word_count, self.line_count,
+         self._pages_off, self._word_offsets_off, self._word_text_off, self._word_polygons_off,
+         self._line_offsets_off, self._line_text_off, self._line_polygons_off, size) = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a columnar document (bad magic or version)")
+        if size > len(self._buffer):
+            raise ValueError("Columnar document is truncated")
+
+    @classmethod
+    def open(cls, path):
+        """Memory-maps an encoded file; the mapping lives as long as the document object."""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped)
+
+    def page(self, index):
+        """Returns page `index` (0-based) with `words`/`lines` as ranges of global indexes."""
+        (page_number, width, height, unit, first_word, word_count,
+         first_line, line_count) = _PAGE.unpack_from(self._buffer, self._pages_off + index * _PAGE.size)
+        return {
+            "page": page_number,
+            "width": width,
+            "height": height,
+            "unit": _UNIT_NAMES.get(unit, "other"),
+            "words": range(first_word, first_word + word_count),
+            "lines": range(first_line, first_line + line_count),
+        }
+
+    def pages(self):
+        for index in range(self.page_count):
+            yield self.page(index)
+
+    def find_page(self, page_number):
+        """Returns the page numbered `page_number` (see page()), or None; pages are in page order."""
+        low, high = 0, self.page_count
+        while low < high:
+            middle = (low + high) // 2
+            number, = struct.unpack_from("<I", self._buffer, self._pages_off + middle * _PAGE.size)
+            if number < page_number:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.page_count:
+            page = self.page(low)
+            if page["page"] == page_number:
+                return page
+        return None
+
+    def _text(self, offsets_off, text_off, i):
+        start, end = struct.unpack_from("<II", self._buffer, offsets_off + 4 * i)
+        return str(self._buffer[text_off + start:text_off + end], "utf-8")
+
+    def _polygon(self, polygons_off, i):
+        return struct.unpack_from("<8f", self._buffer, polygons_off + 32 * i)
+
+    def word_text(self, i):
+        return self._text(self._word_offsets_off, self._word_text_off, i)
+
+    def word_polygon(self, i):
+        return self._polygon(self._word_polygons_off, i)
+
+    def line_text(self, i):
+        return self._text(self._line_offsets_off, self._line_text_off, i)
+
+    def line_polygon(self, i):
+        return self._polygon(self._line_polygons_off, i)
+
+    def word_polygons(self):
+        """All word polygons as one flat float32 memoryview (little-endian hosts only)."""
+        return self._float_view(self._word_polygons_off, self.word_count)
+
+    def line_polygons(self):
+        """All line polygons as one flat float32 memoryview (little-endian hosts only)."""
+        return self._float_view(self._line_polygons_off, self.line_count)
+
+    def _float_view(self, offset, count):
+        if sys.byteorder != "little":
+            raise RuntimeError("Zero-copy float views require a little-endian host; use *_polygon(i)")
+        return self._buffer[offset:offset + 32 * count].cast("f")
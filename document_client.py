@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import threading
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport, RequestsTransport
+from azure.ai.documentintelligence import DocumentIntelligenceClient
+from azure.ai.documentintelligence.aio import DocumentIntelligenceClient as AsyncDocumentIntelligenceClient
+from dotenv import load_dotenv
+from rate_limiter import AsyncRateLimitPolicy, RateLimitPolicy
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# API version sent to Document Intelligence
+API_VERSION = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_API_VERSION", "2024-11-30")
+
+# HTTP connection settings shared by every client created here
+HTTP_POOL_CONNECTIONS = int(os.environ.get("DI_HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("DI_HTTP_POOL_MAXSIZE", "32"))
+HTTP_KEEPALIVE_SECONDS = float(os.environ.get("DI_HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_CONNECTION_TIMEOUT = float(os.environ.get("DI_HTTP_CONNECTION_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.environ.get("DI_HTTP_READ_TIMEOUT", "120"))
+
+_lock = threading.Lock()
+_clients = {}  # (endpoint, key) -> DocumentIntelligenceClient
+_async_clients = {}  # (endpoint, key) -> (event loop, AsyncDocumentIntelligenceClient)
+
+
+def get_azure_credentials():
+    """
+    Reads the Document Intelligence endpoint and key from the environment.
+    Returns:
+        (endpoint, key) tuple; raises ValueError if either is missing.
+    """
+    endpoint = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
+    key = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_KEY")
+    if not endpoint or not key:
+        raise ValueError("Azure Document Intelligence credentials not found.")
+    return endpoint, key
+
+
+def _build_session():
+    session = requests.Session()
+    # Retries are handled by the SDK's retry policy, not by urllib3
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_client(endpoint=None, key=None) -> DocumentIntelligenceClient:
+    """
+    Returns the long-lived synchronous client for `endpoint`/`key`.
+    The client is created on first use and reuses its pooled, keep-alive
+    HTTP connections for every later call.
+    Args:
+        endpoint: Service endpoint; defaults to the environment setting.
+        key: API key; defaults to the environment setting.
+    """
+    if endpoint is None or key is None:
+        endpoint, key = get_azure_credentials()
+    with _lock:
+        client = _clients.get((endpoint, key))
+        if client is None:
+            transport = RequestsTransport(
+                session=_build_session(),
+                session_owner=True,
+                connection_timeout=HTTP_CONNECTION_TIMEOUT,
+                read_timeout=HTTP_READ_TIMEOUT
+            )
+            client = DocumentIntelligenceClient(
+                endpoint=endpoint,
+                credential=AzureKeyCredential(key),
+                api_version=API_VERSION,
+                transport=transport,
+                # Every analyze attempt waits for the shared rate limiter / priority scheduler
+                per_retry_policies=[RateLimitPolicy()]
+            )
+            _clients[(endpoint, key)] = client
+            logger.info(f"Created shared Document Intelligence client for {endpoint}")
+    return client
+
+
+def _log_close_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not close a replaced async Document Intelligence client: {task.exception()}")
+
+
+def _discard_async_client(loop, client):
+    """Closes a shared async client that belongs to another event loop, so its aiohttp session is released."""
+    if loop.is_running():
+        # Still serving another thread: close it on its own loop
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+        return
+    # Its loop has stopped; close the session from the current one
+    task = asyncio.get_running_loop().create_task(client.close())
+    task.add_done_callback(_log_close_error)
+
+
+def get_async_client(endpoint=None, key=None) -> AsyncDocumentIntelligenceClient:
+    """
+    Returns the long-lived async client for `endpoint`/`key`.
+    Must be called from inside a running event loop; the client (and its
+    aiohttp connection pool) is bound to that loop.
+    Args:
+        endpoint: Service endpoint; defaults to the environment setting.
+        key: API key; defaults to the environment setting.
+    """
+    if endpoint is None or key is None:
+        endpoint, key = get_azure_credentials()
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get((endpoint, key))
+    if entry is not None and entry[0] is loop:
+        return entry[1]
+    if entry is not None:
+        _discard_async_client(*entry)
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_MAXSIZE,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS
+    )
+    session = aiohttp.ClientSession(
+        connector=connector,
+        cookie_jar=aiohttp.DummyCookieJar(),
+        auto_decompress=False
+    )
+    transport = AioHttpTransport(
+        session=session,
+        session_owner=True,
+        connection_timeout=HTTP_CONNECTION_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT
+    )
+    client = AsyncDocumentIntelligenceClient(
+        endpoint=endpoint,
+        credential=AzureKeyCredential(key),
+        api_version=API_VERSION,
+        transport=transport,
+        per_retry_policies=[AsyncRateLimitPolicy()]
+    )
+    _async_clients[(endpoint, key)] = (loop, client)
+    logger.info(f"Created shared async Document Intelligence client for {endpoint}")
+    return client
+
+
+def close_clients():
+    """Closes every shared synchronous client. Safe to call more than once."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+async def close_async_clients():
+    """Closes every shared async client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    for client_key, (client_loop, client) in list(_async_clients.items()):
+        if client_loop is loop:
+            del _async_clients[client_key]
+            await client.close()
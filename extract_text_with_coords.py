@@ -1,17 +1,14 @@
 import os
 import sys
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
+from document_client import get_client
+from spatial_index import DocumentIndex
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
 def analyze_document(endpoint, key, file_path, model_id="prebuilt-layout"):
-    document_intelligence_client = DocumentIntelligenceClient(
-        endpoint=endpoint,
-        credential=AzureKeyCredential(key)
-    )
+    document_intelligence_client = get_client(endpoint, key)
     with open(file_path, "rb") as f:
         poller = document_intelligence_client.begin_analyze_document(
             model_id,
@@ -20,36 +17,42 @@ def analyze_document(endpoint, key, file_path, model_id="prebuilt-layout"):
     result = poller.result()
     return result
 
+def extract_page_lines(page):
+    output = []
+    if hasattr(page, 'lines') and page.lines:
+        for idx, line in enumerate(page.lines):
+            # Each line has a polygon (list of 8 floats: 4 points)
+            output.append({
+                'page': page.page_number,
+                'line_index': idx,
+                'text': line.content,
+                'polygon': line.polygon
+            })
+    return output
+
+def extract_page_words(page):
+    output = []
+    if hasattr(page, 'words') and page.words:
+        for idx, word in enumerate(page.words):
+            output.append({
+                'page': page.page_number,
+                'word_index': idx,
+                'text': word.content,
+                'polygon': word.polygon
+            })
+    return output
+
+# The words/lines shape shared by /analyze-pdf, the page store and bulk_analyze.py records
 def extract_text_and_coords(result):
     output = []
     for page in result.pages:
-        page_number = page.page_number
-        if hasattr(page, 'lines') and page.lines:
-            for line in page.lines:
-                text = line.content
-                # Each line has a polygon (list of 8 floats: 4 points)
-                polygon = line.polygon
-                output.append({
-                    'page': page_number,
-                    'text': text,
-                    'polygon': polygon
-                })
+        output.extend(extract_page_lines(page))
     return output
 
 def extract_words_and_coords(result):
     output = []
     for page in result.pages:
-        page_number = page.page_number
-        if hasattr(page, 'words') and page.words:
-            for idx, word in enumerate(page.words):
-                text = word.content
-                polygon = word.polygon
-                output.append({
-                    'page': page_number,
-                    'word_index': idx,
-                    'text': text,
-                    'polygon': polygon
-                })
+        output.extend(extract_page_words(page))
     return output
 
 def main():
@@ -72,12 +75,29 @@ def main():
         words_coords = extract_words_and_coords(result)
         for item in words_coords[:10]:
             print(f"Page {item['page']} Word {item['word_index']}: '{item['text']}' at {item['polygon']}")
+        # Index words and lines per page once, instead of scanning all words per lookup
+        words_by_page, lines_by_page = {}, {}
+        for w in words_coords:
+            words_by_page.setdefault(w['page'], []).append(w)
+        for l in text_coords:
+            lines_by_page.setdefault(l['page'], []).append(l)
+        index = DocumentIndex(
+            (page.page_number, page.width, page.height,
+             words_by_page.get(page.page_number, []), lines_by_page.get(page.page_number, []))
+            for page in result.pages
+        )
         # Example: highlight the 3rd word on page 1
         page_x = 1
         word_n = 2  # zero-based index, so 2 is the third word
-        word_to_highlight = next((w for w in words_coords if w['page'] == page_x and w['word_index'] == word_n), None)
+        page_entry = index.page(page_x)
+        word_to_highlight = page_entry['words'][word_n] if page_entry and word_n < len(page_entry['words']) else None
         if word_to_highlight:
             print(f"\nHighlight example: Page {page_x} Word {word_n+1}: '{word_to_highlight['text']}' at {word_to_highlight['polygon']}")
+            # Example: hit-test the centre of that word
+            x = sum(word_to_highlight['polygon'][0::2]) / 4
+            y = sum(word_to_highlight['polygon'][1::2]) / 4
+            hit = index.word_at(page_x, x, y)
+            print(f"Word at ({x:.2f}, {y:.2f}) on page {page_x}: '{hit['text'] if hit else None}'")
         else:
             print(f"\nNo word found at page {page_x} index {word_n}")
     except Exception as e:
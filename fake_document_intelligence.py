@@ -0,0 +1,377 @@
+"""
+Local stand-in for the Document Intelligence analyze API, for load tests and
+offline development. It speaks the same long-running-operation protocol as the
+service, so the unmodified SDK clients in document_client.py can talk to it:
+
+    POST {endpoint}/documentintelligence/documentModels/{model}:analyze  -> 202 + Operation-Location
+    GET  {endpoint}/documentintelligence/documentModels/{model}/analyzeResults/{id}
+         -> {"status": "running"} until the simulated latency has passed, then
+            {"status": "succeeded", "analyzeResult": {...}}
+
+Results are replayed from recordings (`record` below) keyed on the document's
+SHA-256 and the model. Documents without a recording get a result synthesized
+from the PDF's text layer, so any born-digital PDF (e.g. sample_invoice.pdf)
+produces realistic words, lines and polygons.
+
+    python fake_document_intelligence.py record sample_invoice.pdf --model prebuilt-invoice
+    python fake_document_intelligence.py serve --port 8765 --latency 1.5 --throttle-rate 0.05
+
+Then point the apps at it:
+    AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT=http://127.0.0.1:8765 AZURE_DOCUMENT_INTELLIGENCE_KEY=fake
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS_DIR = os.environ.get("FAKE_DI_RECORDINGS_DIR", "recordings")
+API_VERSION = "2024-11-30"
+# Finished operations are forgotten after this many seconds
+OPERATION_TTL_SECONDS = 600
+
+_ANALYZE_PATH = re.compile(r"^/documentintelligence/documentModels/([^/:]+):analyze$")
+_RESULT_PATH = re.compile(r"^/documentintelligence/documentModels/([^/]+)/analyzeResults/([^/]+)$")
+
+
+def recording_path(directory, sha256, model_id):
+    return os.path.join(directory, model_id, f"{sha256}.json")
+
+
+def record(document_path, model_id="prebuilt-layout", directory=RECORDINGS_DIR):
+    """Analyzes a document with the real service and saves the result for replay."""
+    from document_client import get_client
+
+    with open(document_path, "rb") as f:
+        document = f.read()
+    poller = get_client().begin_analyze_document(
+        model_id,
+        body=document,
+        content_type="application/octet-stream"
+    )
+    result = poller.result()
+    path = recording_path(directory, hashlib.sha256(document).hexdigest(), model_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result.as_dict(), f)
+    return path
+
+
+def synthesize_result(document: bytes, model_id: str) -> dict:
+    """
+    Builds an analyzeResult from the PDF's own text layer: one line per text run,
+    words split on whitespace, polygons in inches with a top-left origin.
+    Non-PDF input yields a single empty page.
+    """
+    content = []
+    offset = 0
+    pages = []
+    try:
+        reader = PdfReader(io.BytesIO(document))
+        pdf_pages = reader.pages
+    except Exception:
+        pdf_pages = []
+
+    for number, pdf_page in enumerate(pdf_pages, start=1):
+        width = float(pdf_page.mediabox.width)
+        height = float(pdf_page.mediabox.height)
+        runs = []
+
+        def visit(text, cm, tm, font_dict, font_size):
+            if text.strip():
+                runs.append((text.strip(), cm[4] + tm[4], cm[5] + tm[5], font_size or 10.0))
+
+        pdf_page.extract_text(visitor_text=visit)
+        page_start = offset
+        words, lines = [], []
+        for text, x, y, size in runs:
+            char_width = size * 0.5
+            top = (height - y - size * 0.8) / 72
+            bottom = (height - y + size * 0.2) / 72
+            line_start = offset
+            cursor = x
+            for token in re.finditer(r"\S+", text):
+                left = (x + token.start() * char_width) / 72
+                right = (x + token.end() * char_width) / 72
+                words.append({
+                    "content": token.group(),
+                    "polygon": [left, top, right, top, right, bottom, left, bottom],
+                    "confidence": 0.99,
+                    "span": {"offset": line_start + token.start(), "length": len(token.group())}
+                })
+                cursor = x + token.end() * char_width
+            lines.append({
+                "content": text,
+                "polygon": [x / 72, top, cursor / 72, top, cursor / 72, bottom, x / 72, bottom],
+                "spans": [{"offset": line_start, "length": len(text)}]
+            })
+            content.append(text)
+            offset += len(text) + 1
+        pages.append({
+            "pageNumber": number,
+            "angle": 0,
+            "width": width / 72,
+            "height": height / 72,
+            "unit": "inch",
+            "spans": [{"offset": page_start, "length": max(0, offset - 1 - page_start)}],
+            "words": words,
+            "lines": lines
+        })
+
+    if not pages:
+        pages.append({"pageNumber": 1, "angle": 0, "width": 8.5, "height": 11, "unit": "inch",
+                      "spans": [], "words": [], "lines": []})
+    return {
+        "apiVersion": API_VERSION,
+        "modelId": model_id,
+        "stringIndexType": "textElements",
+        "content": "\n".join(content),
+        "pages": pages
+    }
+
+
+def select_pages(result: dict, pages: str) -> dict:
+    """
+    Narrows a full result to a `pages` parameter such as "1-3,5", like the service:
+    only those pages are analyzed and they keep their page numbers.
+    """
+    from incremental_analysis import fold_split_items, slice_unit
+    from chunked_analysis import merge_results
+    from azure.ai.documentintelligence.models import AnalyzeResult
+
+    wanted = set()
+    for part in pages.split(","):
+        first, _, last = part.strip().partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"Invalid pages parameter: {pages}")
+        wanted.update(range(int(first), int(last or first) + 1))
+    result = json.loads(json.dumps(result))  # slice_unit moves items out of its input
+    positions = [i for i, page in enumerate(result.get("pages") or []) if page["pageNumber"] in wanted]
+    if not positions:
+        raise ValueError(f"No pages in range {pages}")
+    units = [slice_unit(result, i, i) for i in positions]
+    merged = merge_results([AnalyzeResult(unit) for unit in units], [unit["pages"][0]["pageNumber"] for unit in units])
+    fold_split_items(merged)
+    return merged.as_dict()
+
+
+class FakeService:
+    """
+    State and behaviour of the fake service.
+    Args:
+        recordings_dir: Directory written by record().
+        latency: Base seconds from submission until the operation succeeds.
+        latency_per_page: Extra seconds per page.
+        jitter: Random +/- fraction applied to the latency.
+        throttle_rate: Fraction of analyze requests rejected with 429.
+        max_tps: Analyze requests per second above which requests get 429 (0 = unlimited).
+        retry_after: Retry-After seconds sent with 429 responses.
+        poll_retry_after: Retry-After seconds sent while an operation is running.
+    """
+
+    def __init__(self, recordings_dir=RECORDINGS_DIR, latency=1.0, latency_per_page=0.0, jitter=0.0,
+                 throttle_rate=0.0, max_tps=0.0, retry_after=1, poll_retry_after=1):
+        self.recordings_dir = recordings_dir
+        self.latency = latency
+        self.latency_per_page = latency_per_page
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.max_tps = max_tps
+        self.retry_after = retry_after
+        self.poll_retry_after = poll_retry_after
+        self._lock = threading.Lock()
+        self._operations = {}  # id -> (ready_at, created, latency, result)
+        self._recent_posts = []
+        self._synthesized = {}  # (sha256, model_id) -> result
+        self.stats = {"analyze": 0, "throttled": 0, "polls": 0}
+
+    def load_result(self, document, model_id):
+        sha256 = hashlib.sha256(document).hexdigest()
+        path = recording_path(self.recordings_dir, sha256, model_id)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        with self._lock:
+            cached = self._synthesized.get((sha256, model_id))
+        if cached is None:
+            cached = synthesize_result(document, model_id)
+            with self._lock:
+                self._synthesized[(sha256, model_id)] = cached
+        return cached
+
+    def should_throttle(self):
+        now = time.monotonic()
+        with self._lock:
+            self._recent_posts = [t for t in self._recent_posts if now - t < 1.0]
+            over_quota = self.max_tps and len(self._recent_posts) >= self.max_tps
+            if over_quota or random.random() < self.throttle_rate:
+                self.stats["throttled"] += 1
+                return True
+            self._recent_posts.append(now)
+            self.stats["analyze"] += 1
+            return False
+
+    def submit(self, document, model_id, pages=None):
+        result = self.load_result(document, model_id)
+        if pages:
+            result = select_pages(result, pages)
+        latency = self.latency + self.latency_per_page * len(result.get("pages") or [])
+        if self.jitter:
+            latency *= 1 + random.uniform(-self.jitter, self.jitter)
+        operation_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            # Drop operations nobody has polled for a while
+            for stale in [k for k, (ready_at, *_) in self._operations.items() if now - ready_at > OPERATION_TTL_SECONDS]:
+                del self._operations[stale]
+            self._operations[operation_id] = (now + latency, datetime.now(timezone.utc), latency, result)
+        return operation_id
+
+    def poll(self, operation_id):
+        with self._lock:
+            self.stats["polls"] += 1
+            operation = self._operations.get(operation_id)
+        if operation is None:
+            return None
+        ready_at, created, latency, result = operation
+        done = time.monotonic() >= ready_at
+        body = {
+            "status": "succeeded" if done else "running",
+            "createdDateTime": created.isoformat(),
+            # Like the real service: a finished operation was last updated when it completed
+            "lastUpdatedDateTime": (created + timedelta(seconds=latency) if done else datetime.now(timezone.utc)).isoformat()
+        }
+        if body["status"] == "succeeded":
+            body["analyzeResult"] = result
+        return body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("apim-request-id", uuid.uuid4().hex)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, code, message, headers=None):
+        self._send(status, {"error": {"code": code, "message": message}}, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        document = self._read_body()
+        match = _ANALYZE_PATH.match(url.path)
+        if not match:
+            return self._error(404, "NotFound", "Resource not found")
+        if not self.headers.get("Ocp-Apim-Subscription-Key"):
+            return self._error(401, "401", "Access denied due to missing subscription key")
+        if service.should_throttle():
+            return self._error(429, "429", "Requests to the analyze operation have exceeded the rate limit.",
+                               {"Retry-After": str(service.retry_after)})
+
+        model_id = match.group(1)
+        query = parse_qs(url.query)
+        api_version = query.get("api-version", [API_VERSION])[0]
+        try:
+            operation_id = service.submit(document, model_id, query.get("pages", [None])[0])
+        except ValueError as e:
+            return self._error(400, "InvalidParameter", str(e))
+        host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_port}"
+        location = (f"http://{host}/documentintelligence/documentModels/{model_id}"
+                    f"/analyzeResults/{operation_id}?api-version={api_version}")
+        self._send(202, headers={"Operation-Location": location})
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            return self._send(200, service.stats)
+        match = _RESULT_PATH.match(url.path)
+        if not match:
+            return self._error(404, "NotFound", "Resource not found")
+        body = service.poll(match.group(2))
+        if body is None:
+            return self._error(404, "NotFound", "Analyze operation not found")
+        headers = {"Retry-After": str(service.poll_retry_after)} if body["status"] == "running" else None
+        self._send(200, body, headers)
+
+
+def start_server(service=None, host="127.0.0.1", port=0):
+    """Starts the fake service on a background thread and returns the server (see server_port)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service or FakeService()
+    threading.Thread(target=server.serve_forever, name="fake-document-intelligence", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Document Intelligence analyze API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the fake service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--recordings", default=RECORDINGS_DIR)
+    serve.add_argument("--latency", type=float, default=1.0, help="Seconds until an analysis succeeds")
+    serve.add_argument("--latency-per-page", type=float, default=0.0)
+    serve.add_argument("--jitter", type=float, default=0.0, help="Random +/- fraction of the latency")
+    serve.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of analyze requests answered with 429")
+    serve.add_argument("--max-tps", type=float, default=0.0, help="Analyze requests per second before 429s (0 = unlimited)")
+    serve.add_argument("--retry-after", type=int, default=1)
+    serve.add_argument("--poll-retry-after", type=int, default=1)
+
+    rec = commands.add_parser("record", help="Analyze documents with the real service and save the results")
+    rec.add_argument("documents", nargs="+")
+    rec.add_argument("--model", default="prebuilt-layout")
+    rec.add_argument("--recordings", default=RECORDINGS_DIR)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "record":
+        for document in args.documents:
+            print(f"Recorded {document} -> {record(document, args.model, args.recordings)}")
+        return
+
+    service = FakeService(args.recordings, args.latency, args.latency_per_page, args.jitter,
+                          args.throttle_rate, args.max_tps, args.retry_after, args.poll_retry_after)
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"Fake Document Intelligence listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
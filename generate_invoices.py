@@ -0,0 +1,402 @@
+"""
+Synthetic invoice corpus with ground truth, for throughput and accuracy tests.
+
+`create_sample_invoice.py` draws one fixed page; this generates any number of
+invoices with randomized (but seeded, so reproducible) page counts, line items,
+fonts, page rotations and layouts, spread over worker processes. Next to every
+PDF it writes `<name>.truth.json` with the exact polygon of every word drawn,
+in the service's convention (inches, top-left origin of the page as displayed,
+clockwise from the word's top-left corner), plus a `manifest.json` of the corpus.
+
+    python generate_invoices.py generate corpus --count 2000 --pages 1-5
+    python generate_invoices.py generate corpus-long --count 20 --pages 1,10,100,500 --rotations 0,90
+    python generate_invoices.py score corpus/invoice_000001.truth.json result.json
+
+`score` compares an analyzeResult (e.g. a cached result, a bulk_analyze.py
+record or a raw service response) with the ground truth: recall of the truth
+words and the IoU and corner error of the matched polygons.
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import orjson
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import getAscentDescent, stringWidth
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+# Regular -> bold face of the standard PDF fonts (no font files needed)
+FONTS = {
+    "Helvetica": "Helvetica-Bold",
+    "Times-Roman": "Times-Bold",
+    "Courier": "Courier-Bold",
+}
+
+# Positions in inches from the bottom-left corner of the unrotated page.
+# `columns` are (header, x, alignment) for description, quantity, unit price and amount.
+LAYOUTS = {
+    "classic": {
+        "company": (1.0, 10.0), "title": (6.0, 10.0), "bill_to": (1.0, 8.5),
+        "table_top": 7.5, "row_height": 0.3, "body_size": 10, "header_size": 12,
+        "columns": [("Description", 1.1, "left"), ("Quantity", 4.7, "right"),
+                    ("Unit Price", 6.0, "right"), ("Amount", 7.0, "right")],
+        "shade_header": True,
+    },
+    "modern": {
+        "company": (5.0, 10.0), "title": (1.0, 10.0), "bill_to": (5.0, 8.5),
+        "table_top": 7.8, "row_height": 0.28, "body_size": 10, "header_size": 11,
+        "columns": [("Item", 1.0, "left"), ("Qty", 5.0, "right"),
+                    ("Rate", 6.1, "right"), ("Total", 7.4, "right")],
+        "shade_header": False,
+    },
+    "compact": {
+        "company": (0.75, 10.25), "title": (5.75, 10.25), "bill_to": (0.75, 9.0),
+        "table_top": 8.25, "row_height": 0.2, "body_size": 8, "header_size": 9,
+        "columns": [("Description", 0.8, "left"), ("Qty", 4.5, "right"),
+                    ("Price", 5.75, "right"), ("Amount", 7.6, "right")],
+        "shade_header": True,
+    },
+}
+# Rows stop this far above the bottom of the page (footer and totals below it)
+TABLE_BOTTOM = 1.5
+FOOTER_Y = 0.5
+
+COMPANY_WORDS = ["Northwind", "Contoso", "Fabrikam", "Litware", "Adventure", "Tailspin", "Proseware",
+                 "Wingtip", "Lucerne", "Alpine", "Coho", "Margie's", "Woodgrove", "Trey"]
+COMPANY_SUFFIXES = ["Ltd.", "Inc.", "GmbH", "LLC", "Corporation", "Group", "Partners"]
+STREETS = ["Main Street", "Tech Boulevard", "Business Road", "Harbor Way", "Oak Avenue", "Market Square"]
+CITIES = ["Innovation City", "Business City", "Springfield", "Riverside", "Lakeview", "Fairview"]
+ITEM_WORDS = ["Software", "Development", "Consulting", "Cloud", "Hosting", "Support", "Maintenance",
+              "License", "Hardware", "Installation", "Training", "Design", "Audit", "Storage",
+              "Network", "Security", "Migration", "Backup", "Monthly", "Annual", "Premium", "Services"]
+
+
+def parse_choices(spec, convert=int):
+    """Expands "1-5" / "1,10,100" / "0,90" style options into the list of values to pick from."""
+    values = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if convert is int and "-" in part:
+            first, last = (int(n) for n in part.split("-", 1))
+            values.extend(range(first, last + 1))
+        else:
+            values.append(convert(part))
+    if not values:
+        raise ValueError(f"No values in {spec!r}")
+    return values
+
+
+def to_display(u, v, rotation, width, height):
+    """Maps a point of the unrotated page (inches, top-left origin) onto the page as displayed."""
+    if rotation == 90:
+        return height - v, u
+    if rotation == 180:
+        return width - u, height - v
+    if rotation == 270:
+        return v, width - u
+    return u, v
+
+
+class TruthCanvas:
+    """A reportlab canvas that records the polygon of every word it draws."""
+
+    def __init__(self, path, font):
+        self.canvas = canvas.Canvas(path, pagesize=letter, invariant=1)
+        self.font = font
+        self.width, self.height = letter[0] / inch, letter[1] / inch
+        self.pages = []
+        self.words = []
+        self.rotation = 0
+
+    def rotate(self, rotation):
+        self.rotation = rotation
+        self.canvas.setPageRotation(rotation)
+
+    def text(self, x, y, text, size, bold=False, align="left"):
+        """Draws `text` with its baseline at (x, y) inches; align "right" ends it at x."""
+        font = FONTS[self.font] if bold else self.font
+        x, y = x * inch, y * inch
+        if align == "right":
+            x -= stringWidth(text, font, size)
+        self.canvas.setFont(font, size)
+        self.canvas.drawString(x, y, text)
+
+        ascent, descent = getAscentDescent(font, size)
+        top, bottom = self.height - (y + ascent) / inch, self.height - (y + descent) / inch
+        position = 0
+        for word in text.split(" "):
+            if word:
+                left = (x + stringWidth(text[:position], font, size)) / inch
+                right = left + stringWidth(word, font, size) / inch
+                polygon = []
+                for u, v in ((left, top), (right, top), (right, bottom), (left, bottom)):
+                    polygon.extend(round(c, 4) for c in to_display(u, v, self.rotation, self.width, self.height))
+                self.words.append({"content": word, "polygon": polygon})
+            position += len(word) + 1
+
+    def show_page(self):
+        sideways = self.rotation in (90, 270)
+        self.pages.append({
+            "pageNumber": len(self.pages) + 1,
+            "angle": 0,
+            "width": self.height if sideways else self.width,
+            "height": self.width if sideways else self.height,
+            "unit": "inch",
+            "rotation": self.rotation,
+            "words": self.words,
+        })
+        self.words = []
+        self.rotation = 0
+        self.canvas.showPage()
+
+    def save(self):
+        self.canvas.save()
+
+
+def _company(rng):
+    return f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_SUFFIXES)}"
+
+
+def _address(rng):
+    return f"{rng.randint(1, 9999)} {rng.choice(STREETS)}", f"{rng.choice(CITIES)}, {rng.randint(10000, 99999)}"
+
+
+def _line_item(rng):
+    description = " ".join(rng.sample(ITEM_WORDS, rng.randint(1, 4)))
+    return description, rng.randint(1, 120), round(rng.uniform(5, 2500), 2)
+
+
+def _draw_table_header(page, layout, top):
+    size = layout["header_size"]
+    if layout["shade_header"]:
+        page.canvas.setFillColor(colors.lightgrey)
+        page.canvas.rect(layout["columns"][0][1] * inch - 0.1 * inch, (top - 0.1) * inch,
+                         (layout["columns"][-1][1] - layout["columns"][0][1] + 0.2) * inch, 0.3 * inch, fill=1)
+        page.canvas.setFillColor(colors.black)
+    for header, x, align in layout["columns"]:
+        page.text(x, top, header, size, bold=True, align=align)
+
+
+def generate_invoice(path, rng, page_count, line_items, font, layout_name, rotations):
+    """
+    Draws one invoice of `page_count` pages and returns its ground truth pages.
+    Args:
+        line_items: Values to pick the number of table rows on each page from.
+        rotations: Values to pick each page's /Rotate from.
+    """
+    layout = LAYOUTS[layout_name]
+    page = TruthCanvas(path, font)
+    size, row_height = layout["body_size"], layout["row_height"]
+    invoice_number = f"INV-{rng.randint(2015, 2030)}-{rng.randint(1, 99999):05d}"
+    issued = f"{rng.randint(2015, 2030)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    subtotal = 0.0
+
+    for number in range(1, page_count + 1):
+        page.rotate(rng.choice(rotations))
+        if number == 1:
+            x, y = layout["company"]
+            page.text(x, y, _company(rng), size + 8, bold=True)
+            street, city = _address(rng)
+            page.text(x, y - 0.3, street, size)
+            page.text(x, y - 0.5, city, size)
+            page.text(x, y - 0.7, f"Phone: ({rng.randint(200, 999)}) {rng.randint(100, 999)}-{rng.randint(1000, 9999)}", size)
+            x, y = layout["title"]
+            page.text(x, y, "INVOICE", size + 6, bold=True)
+            page.text(x, y - 0.3, f"Invoice #: {invoice_number}", size)
+            page.text(x, y - 0.5, f"Date: {issued}", size)
+            x, y = layout["bill_to"]
+            page.text(x, y, "Bill To:", size + 1, bold=True)
+            page.text(x, y - 0.25, _company(rng), size)
+            page.text(x, y - 0.45, ", ".join(_address(rng)), size)
+            top = layout["table_top"]
+        else:
+            page.text(layout["columns"][0][1], 10.25, f"Invoice #: {invoice_number} (continued)", size, bold=True)
+            top = 9.75
+        _draw_table_header(page, layout, top)
+
+        # The last page keeps room for the totals
+        bottom = TABLE_BOTTOM + (4 * row_height if number == page_count else 0)
+        capacity = max(0, int((top - row_height - bottom) / row_height))
+        y = top - row_height - 0.1
+        for _ in range(min(rng.choice(line_items), capacity)):
+            description, quantity, price = _line_item(rng)
+            amount = quantity * price
+            subtotal += amount
+            for (_, x, align), value in zip(layout["columns"], (description, str(quantity), f"${price:,.2f}", f"${amount:,.2f}")):
+                page.text(x, y, value, size, align=align)
+            y -= row_height
+
+        if number == page_count:
+            tax = round(subtotal * 0.08, 2)
+            label_x, value_x = layout["columns"][2][1] - 1.0, layout["columns"][3][1]
+            for label, value in (("Subtotal:", subtotal), ("Tax (8%):", tax), ("Total:", subtotal + tax)):
+                y -= row_height
+                page.text(label_x, y, label, size, bold=label == "Total:")
+                page.text(value_x, y, f"${value:,.2f}", size, bold=label == "Total:", align="right")
+        page.text(layout["columns"][-1][1], FOOTER_Y, f"Page {number} of {page_count}", size - 1, align="right")
+        page.show_page()
+    page.save()
+    return page.pages
+
+
+def generate_one(task):
+    """Worker process entry point: generates invoice number `index` of a corpus."""
+    index, output_dir, seed, options = task
+    # Seeded per document, so the corpus does not depend on the worker count
+    rng = random.Random(f"{seed}:{index}")
+    name = f"invoice_{index:06d}"
+    page_count = rng.choice(options["pages"])
+    font = rng.choice(options["fonts"])
+    layout = rng.choice(options["layouts"])
+    pdf_path = os.path.join(output_dir, name + ".pdf")
+    pages = generate_invoice(pdf_path, rng, page_count, options["line_items"], font, layout, options["rotations"])
+    truth = {"file": name + ".pdf", "font": font, "layout": layout, "pages": pages}
+    with open(os.path.join(output_dir, name + ".truth.json"), "wb") as f:
+        f.write(orjson.dumps(truth))
+    return {"file": name + ".pdf", "truth": name + ".truth.json", "pages": page_count,
+            "words": sum(len(p["words"]) for p in pages), "font": font, "layout": layout,
+            "rotations": sorted({p["rotation"] for p in pages}), "bytes": os.path.getsize(pdf_path)}
+
+
+def generate(args):
+    options = {
+        "pages": parse_choices(args.pages),
+        "line_items": parse_choices(args.line_items),
+        "fonts": parse_choices(args.fonts, str),
+        "layouts": parse_choices(args.layouts, str),
+        "rotations": parse_choices(args.rotations),
+    }
+    for option, known in (("fonts", FONTS), ("layouts", LAYOUTS), ("rotations", (0, 90, 180, 270))):
+        unknown = [value for value in options[option] if value not in known]
+        if unknown:
+            raise SystemExit(f"Unknown {option}: {', '.join(map(str, unknown))} (choose from {', '.join(map(str, known))})")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tasks = [(index, args.output_dir, args.seed, options) for index in range(1, args.count + 1)]
+    started = time.perf_counter()
+    documents = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for entry in executor.map(generate_one, tasks, chunksize=max(1, min(32, args.count // (4 * (args.workers or os.cpu_count() or 1))))):
+            documents.append(entry)
+            if len(documents) % 500 == 0:
+                logger.info(f"{len(documents)}/{args.count} invoices")
+    elapsed = time.perf_counter() - started
+
+    pages = sum(d["pages"] for d in documents)
+    words = sum(d["words"] for d in documents)
+    manifest = {"seed": args.seed, "options": options, "documents": documents, "pages": pages, "words": words}
+    with open(os.path.join(args.output_dir, "manifest.json"), "wb") as f:
+        f.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    logger.info(f"Wrote {len(documents)} invoices ({pages} pages, {words} words) to {args.output_dir} "
+                f"in {elapsed:.1f}s ({pages / elapsed if elapsed else 0:.0f} pages/s)")
+
+
+def _box(polygon):
+    xs, ys = polygon[0::2], polygon[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    overlap = width * height
+    return overlap / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - overlap)
+
+
+def _center(polygon):
+    return sum(polygon[0::2]) / (len(polygon) // 2), sum(polygon[1::2]) / (len(polygon) // 2)
+
+
+def score(truth, result):
+    """
+    Compares the words of an analyzeResult dict with ground truth pages.
+    Each truth word is matched with the nearest unmatched result word of the same
+    content on its page, so extractors with a different reading order score alike.
+    Returns:
+        Dict with word recall, mean polygon IoU and median / p95 / max corner error (inches).
+    """
+    result_pages = {page["pageNumber"]: page for page in result.get("pages") or []}
+    truth_words = matched = 0
+    ious, errors = [], []
+    for truth_page in truth["pages"]:
+        candidates = {}
+        for word in (result_pages.get(truth_page["pageNumber"]) or {}).get("words") or []:
+            if word.get("polygon"):
+                candidates.setdefault(word["content"], []).append(word)
+        truth_words += len(truth_page["words"])
+        for want in truth_page["words"]:
+            same = candidates.get(want["content"])
+            if not same:
+                continue
+            x, y = _center(want["polygon"])
+            got = min(same, key=lambda w: (_center(w["polygon"])[0] - x) ** 2 + (_center(w["polygon"])[1] - y) ** 2)
+            same.remove(got)
+            matched += 1
+            ious.append(_iou(_box(want["polygon"]), _box(got["polygon"])))
+            errors.append(max(((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5 for x1, y1, x2, y2 in zip(
+                want["polygon"][0::2], want["polygon"][1::2], got["polygon"][0::2], got["polygon"][1::2])))
+    errors.sort()
+    return {
+        "truth_words": truth_words,
+        "matched_words": matched,
+        "recall": round(matched / truth_words, 4) if truth_words else None,
+        "mean_iou": round(statistics.fmean(ious), 4) if ious else None,
+        "median_corner_error": round(errors[len(errors) // 2], 4) if errors else None,
+        "p95_corner_error": round(errors[min(len(errors) - 1, int(len(errors) * 0.95))], 4) if errors else None,
+        "max_corner_error": round(errors[-1], 4) if errors else None,
+    }
+
+
+def load_result(path):
+    """Reads an analyzeResult from a JSON file: a bare result, a service response or a bulk_analyze.py record."""
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+    for key in ("analyzeResult", "result"):
+        if isinstance(data.get(key), dict):
+            return data[key]
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic invoice corpus with word-level ground truth")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="Generate a corpus of invoice PDFs and their ground truth")
+    gen.add_argument("output_dir")
+    gen.add_argument("--count", type=int, default=100)
+    gen.add_argument("--pages", default="1", help='Page counts to pick from, e.g. "1-5" or "1,10,100,500"')
+    gen.add_argument("--line-items", default="5-25", help="Line items per page to pick from")
+    gen.add_argument("--fonts", default=",".join(FONTS), help=f"Any of: {', '.join(FONTS)}")
+    gen.add_argument("--layouts", default=",".join(LAYOUTS), help=f"Any of: {', '.join(LAYOUTS)}")
+    gen.add_argument("--rotations", default="0", help="Page rotations to pick from, e.g. 0,90,180,270")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+
+    sc = commands.add_parser("score", help="Compare an analysis result with a document's ground truth")
+    sc.add_argument("truth")
+    sc.add_argument("result")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.command == "generate":
+        generate(args)
+    else:
+        with open(args.truth, "rb") as f:
+            truth = orjson.loads(f.read())
+        print(orjson.dumps(score(truth, load_result(args.result)), option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""
+Page-level incremental re-analysis of revised documents.
+
+Every analyzed PDF has its per-page content hashes recorded in a small SQLite
+index next to the result cache. When a new upload shares most of its pages with
+a cached analysis of the same model, only the pages whose hash changed are sent
+to the service (as a `pages` list); the unchanged pages are cut out of the cached
+result and everything is stitched back together with chunked_analysis.merge_results,
+which fixes up page numbers, span offsets and element references.
+
+Only models whose results are page-local (INCREMENTAL_MODELS) take part; results
+with `documents` (fields extracted from the document as a whole, e.g.
+prebuilt-invoice) are never reused page by page.
+"""
+import difflib
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from pypdf import PdfReader
+
+from chunked_analysis import PAGE_SEPARATOR, merge_results, page_spec
+from document_client import API_VERSION
+from result_cache import CACHE_DIR, analysis_cache
+
+logger = logging.getLogger(__name__)
+
+# Incremental analysis settings, overridable from the environment / .env file.
+# INCREMENTAL_ANALYSIS=0 always sends the whole document.
+INCREMENTAL_ANALYSIS = os.environ.get("INCREMENTAL_ANALYSIS", "1") != "0"
+# Minimum fraction of an upload's pages that must be reusable from a cached analysis
+INCREMENTAL_MIN_REUSE = float(os.environ.get("INCREMENTAL_MIN_REUSE", "0.5"))
+# Models whose results are page-local; others (e.g. prebuilt-invoice) are always analyzed in full
+INCREMENTAL_MODELS = os.environ.get("INCREMENTAL_MODELS", "prebuilt-read,prebuilt-layout").split(",")
+PAGE_INDEX_PATH = os.environ.get("PAGE_INDEX_PATH", os.path.join(CACHE_DIR, "pages.sqlite3"))
+# Cached analyses considered per upload, best match first
+MAX_CANDIDATES = 5
+
+# Collections whose items are referenced as "/<kind>/<index>" from sections, figures, ...
+_REF_KINDS = ("paragraphs", "tables", "figures", "sections", "keyValuePairs")
+# Document-wide items whose spans are split between page units
+_SPAN_LISTS = ("styles", "languages")
+# Elements that can span pages; a page unit is never cut through one of them
+_GLUE_KINDS = ("paragraphs", "tables", "figures", "keyValuePairs")
+# Marks the parts of an item cut by slice_unit until fold_split_items rejoins them
+_SPLIT_ID = "_splitId"
+
+
+# --- Page hashes ---------------------------------------------------------
+
+def _hash_resources(digest, resources, seen):
+    resources = resources.get_object() if resources is not None else None
+    if not resources:
+        return
+    xobjects = resources.get("/XObject")
+    if xobjects:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            xobject = xobjects[name].get_object()
+            if id(xobject) in seen:
+                continue
+            seen.add(id(xobject))
+            digest.update(name.encode("utf-8"))
+            digest.update(xobject.get_data())
+            if xobject.get("/Subtype") == "/Form":
+                _hash_resources(digest, xobject.get("/Resources"), seen)
+    fonts = resources.get("/Font")
+    if fonts:
+        fonts = fonts.get_object()
+        for name in sorted(fonts):
+            digest.update(f"{name}={fonts[name].get_object().get('/BaseFont')}".encode("utf-8"))
+
+
+def _page_hash(page) -> str:
+    """Hashes what a page renders: its geometry, content stream, images/forms and fonts."""
+    digest = hashlib.sha256()
+    digest.update(repr(([float(v) for v in page.mediabox], page.get("/Rotate", 0))).encode("utf-8"))
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    _hash_resources(digest, page.get("/Resources"), set())
+    return digest.hexdigest()
+
+
+def page_hashes(document):
+    """
+    Returns the content hash of every page of a PDF, or None for other inputs.
+    `document` is bytes or a seekable binary file, whose position is left unchanged.
+    """
+    if isinstance(document, (bytes, bytearray)):
+        head, source, position = document[:1024], io.BytesIO(document), None
+    else:
+        position = document.tell()
+        head, source = document.read(1024), document
+        document.seek(position)
+    if not head.lstrip().startswith(b"%PDF"):
+        return None
+    try:
+        return [_page_hash(page) for page in PdfReader(source).pages]
+    except Exception as e:
+        # Hashing is an optimization; an odd PDF is simply analyzed in full
+        logger.warning(f"Could not hash PDF pages, analyzing the whole document: {e}")
+        return None
+    finally:
+        if position is not None:
+            source.seek(position)
+
+
+class PageHashIndex:
+    """
+    SQLite index from page hashes to the cached analyses (result cache keys) containing them.
+    The database is opened on first use.
+    """
+
+    def __init__(self, path=PAGE_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def _conn(self):
+        # Caller must hold the lock
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            with self._db:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS page_hashes (
+                        result_key TEXT NOT NULL,
+                        model_id TEXT NOT NULL,
+                        api_version TEXT NOT NULL,
+                        page_number INTEGER NOT NULL,
+                        page_hash TEXT NOT NULL,
+                        PRIMARY KEY (result_key, page_number)
+                    )
+                    """
+                )
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS page_hashes_lookup ON page_hashes (model_id, api_version, page_hash)"
+                )
+        return self._db
+
+    def record(self, result_key, model_id, hashes, api_version=API_VERSION) -> None:
+        """Records the page hashes of the analysis cached under `result_key`."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM page_hashes WHERE result_key = ?", (result_key,))
+            self._conn.executemany(
+                "INSERT INTO page_hashes (result_key, model_id, api_version, page_number, page_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(result_key, model_id, api_version, number, h) for number, h in enumerate(hashes, start=1)]
+            )
+
+    def candidates(self, model_id, hashes, exclude=None, api_version=API_VERSION):
+        """Returns [(result_key, matching pages)] of analyses sharing pages with `hashes`, best first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result_key, COUNT(DISTINCT page_hash) FROM page_hashes "
+                "WHERE model_id = ? AND api_version = ? AND result_key != ? "
+                "AND page_hash IN (SELECT value FROM json_each(?)) "
+                "GROUP BY result_key ORDER BY 2 DESC LIMIT ?",
+                (model_id, api_version, exclude or "", json.dumps(sorted(set(hashes))), MAX_CANDIDATES)
+            ).fetchall()
+        return [(key, matched) for key, matched in rows]
+
+    def hashes(self, result_key):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_hash FROM page_hashes WHERE result_key = ? ORDER BY page_number", (result_key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def forget(self, result_key) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM page_hashes WHERE result_key = ?", (result_key,))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# Shared by api.py and app.py
+page_index = PageHashIndex()
+
+
+# --- Cutting results into page units -------------------------------------
+
+def _spans(node):
+    """Yields every span dict below `node` (keys `span` and `spans`)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("span", "spans"):
+                yield from (value if isinstance(value, list) else [value])
+            else:
+                yield from _spans(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _spans(item)
+
+
+def _page_numbers(node):
+    """Returns the page numbers of every bounding region below `node`."""
+    numbers = set()
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "boundingRegions":
+                numbers.update(region["pageNumber"] for region in value)
+            else:
+                numbers |= _page_numbers(value)
+    elif isinstance(node, list):
+        for item in node:
+            numbers |= _page_numbers(item)
+    return numbers
+
+
+def _anchor(item):
+    offsets = [span["offset"] for span in _spans(item)]
+    return min(offsets) if offsets else None
+
+
+def page_units(result: dict):
+    """
+    Groups the pages of a result dict into units that can be cut out independently:
+    consecutive pages joined by an element that spans them (e.g. a table continued
+    on the next page). Returns [(first, last)] positions in result["pages"].
+    """
+    positions = {page["pageNumber"]: i for i, page in enumerate(result.get("pages") or [])}
+    glue_until = list(range(len(positions)))  # position -> last position of its unit
+    for kind in _GLUE_KINDS:
+        for item in result.get(kind) or []:
+            spanned = sorted(positions[n] for n in _page_numbers(item) if n in positions)
+            if len(spanned) > 1:
+                for position in range(spanned[0], spanned[-1]):
+                    glue_until[position] = max(glue_until[position], spanned[-1])
+    units = []
+    first = 0
+    while first < len(glue_until):
+        last = first
+        end = glue_until[first]
+        while last < end:
+            last += 1
+            end = max(end, glue_until[last])
+        units.append((first, last))
+        first = last + 1
+    return units
+
+
+def _relocate(node, offset_delta, index_maps):
+    """Shifts span offsets and renumbers "/<kind>/<index>" references (dropping ones cut away)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("span", "spans"):
+                for span in (value if isinstance(value, list) else [value]):
+                    span["offset"] += offset_delta
+            elif key == "elements" and isinstance(value, list):
+                node[key] = [ref for ref in (_remap_ref(ref, index_maps) for ref in value) if ref is not None]
+            else:
+                _relocate(value, offset_delta, index_maps)
+    elif isinstance(node, list):
+        for item in node:
+            _relocate(item, offset_delta, index_maps)
+
+
+def _remap_ref(ref, index_maps):
+    kind, _, index = ref.strip("/").partition("/")
+    if kind not in index_maps or not index.isdigit():
+        return ref
+    new_index = index_maps[kind].get(int(index))
+    return f"/{kind}/{new_index}" if new_index is not None else None
+
+
+def _clip_spans(spans, start, end):
+    """Returns the parts of `spans` inside [start, end), relative to start."""
+    clipped = []
+    for span in spans or []:
+        first = max(span["offset"], start)
+        last = min(span["offset"] + span["length"], end)
+        if last > first or (span["length"] == 0 and start <= span["offset"] < end):
+            clipped.append({"offset": first - start, "length": max(0, last - first)})
+    return clipped
+
+
+def _overlaps(spans, start, end):
+    return any(span["offset"] < end and span["offset"] + span["length"] > start
+               or (span["length"] == 0 and start <= span["offset"] < end) for span in spans or [])
+
+
+def slice_unit(result: dict, first, last, source="") -> dict:
+    """
+    Cuts pages first..last (positions in result["pages"]) out of a result dict, as
+    if only those pages had been analyzed: content, spans and element references
+    start afresh and the unit gets its own root section. Page numbers are kept.
+    Sections, styles and languages that continue into other units are cut at the
+    unit's edges and tagged with `source`, so fold_split_items can rejoin them.
+    Elements are moved, not copied, so every unit of `result` may be cut only once.
+    """
+    pages = result["pages"][first:last + 1]
+    page_spans = [span for page in pages for span in page.get("spans") or []]
+    start = min((span["offset"] for span in page_spans), default=0)
+    end = max((span["offset"] + span["length"] for span in page_spans), default=start)
+    numbers = {page["pageNumber"] for page in pages}
+
+    def in_unit(item):
+        anchor = _anchor(item)
+        if anchor is None:
+            return bool(_page_numbers(item) & numbers)
+        return start <= anchor < end or anchor == start
+
+    sections = result.get("sections") or []
+    kept = {}
+    for kind in _REF_KINDS:
+        if kind == "sections":
+            # Every section covering part of the unit; the root (index 0) is rebuilt below
+            kept[kind] = [i for i in range(1, len(sections)) if _overlaps(sections[i].get("spans"), start, end)]
+        else:
+            kept[kind] = [i for i, item in enumerate(result.get(kind) or []) if in_unit(item)]
+    index_maps = {kind: {old: new for new, old in enumerate(kept[kind])} for kind in _REF_KINDS}
+
+    unit = {key: value for key, value in result.items()
+            if key not in _REF_KINDS and key not in _SPAN_LISTS and key not in ("content", "pages", "warnings")}
+    unit["content"] = result.get("content", "")[start:end]
+    if first == 0 and result.get("warnings"):
+        unit["warnings"] = result["warnings"]
+    unit["pages"] = pages
+    _relocate(pages, -start, index_maps)
+    for kind in _REF_KINDS:
+        if kind == "sections":
+            continue
+        items = [result[kind][i] for i in kept[kind]]
+        _relocate(items, -start, index_maps)
+        if items:
+            unit[kind] = items
+
+    if sections:
+        # Section refs are shifted by one for the new root at index 0
+        index_maps["sections"] = {old: new + 1 for old, new in index_maps["sections"].items()}
+        parent = {}
+        for index, section in enumerate(sections):
+            for ref in section.get("elements") or []:
+                parent[ref] = index
+        kept_sections = set(kept["sections"])
+        root_elements = []
+        for kind in ("paragraphs", "tables", "figures", "sections"):
+            for old in kept[kind]:
+                owner = parent.get(f"/{kind}/{old}")
+                if owner is not None and (owner == 0 or owner not in kept_sections):
+                    root_elements.append((_anchor(result[kind][old]) or 0, f"/{kind}/{index_maps[kind][old]}"))
+        root = {"spans": _clip_spans(sections[0].get("spans"), start, end),
+                "elements": [ref for _, ref in sorted(root_elements)]}
+        children = []
+        for old in kept["sections"]:
+            # Copied, since a section can be part of several units
+            section = {**sections[old], "spans": _clip_spans(sections[old].get("spans"), start, end),
+                       _SPLIT_ID: f"{source}/sections/{old}"}
+            _relocate(section, 0, index_maps)
+            children.append(section)
+        unit["sections"] = [root] + children
+
+    for kind in _SPAN_LISTS:
+        items = []
+        for index, item in enumerate(result.get(kind) or []):
+            spans = _clip_spans(item.get("spans"), start, end)
+            if spans:
+                items.append({**item, "spans": spans, _SPLIT_ID: f"{source}/{kind}/{index}"})
+        if items:
+            unit[kind] = items
+    return unit
+
+
+def _append_spans(spans, more):
+    for span in more:
+        last = spans[-1] if spans else None
+        # Spans separated only by the page separator become one again
+        if last and span["offset"] <= last["offset"] + last["length"] + len(PAGE_SEPARATOR):
+            last["length"] = max(last["length"], span["offset"] + span["length"] - last["offset"])
+        else:
+            spans.append(span)
+
+
+def fold_split_items(result: dict) -> None:
+    """Rejoins the parts of sections, styles and languages that slice_unit cut at unit edges."""
+    for kind in ("sections",) + _SPAN_LISTS:
+        items = result.get(kind)
+        if not items:
+            continue
+        folded = []
+        position = {}  # split id -> index in folded
+        index_map = {}
+        for index, item in enumerate(items):
+            split_id = item.pop(_SPLIT_ID, None)
+            if split_id is not None and split_id in position:
+                target = folded[position[split_id]]
+                _append_spans(target.setdefault("spans", []), item.get("spans") or [])
+                if "elements" in item:
+                    target.setdefault("elements", []).extend(item["elements"])
+                index_map[index] = position[split_id]
+                continue
+            if split_id is not None:
+                position[split_id] = len(folded)
+            index_map[index] = len(folded)
+            folded.append(item)
+        if kind == "sections":
+            for section in folded:
+                refs = (_remap_ref(ref, {"sections": index_map}) for ref in section.get("elements") or [])
+                section["elements"] = list(dict.fromkeys(refs))
+        result[kind] = folded
+
+
+# --- Planning and stitching ----------------------------------------------
+
+_stats = {"revisions": 0, "pages_reused": 0, "pages_analyzed": 0}
+
+
+class Revision:
+    """
+    What to analyze for one upload. `pages` is the service `pages` parameter
+    (None: analyze the whole document) and `needs_service` is False when every
+    page can be reused. finish() turns the service result into the full result;
+    remember() records the upload's page hashes once that result is cached.
+    """
+
+    def __init__(self, result_key, model_id, hashes, base=None, reused=(), changed=()):
+        self.result_key = result_key
+        self.model_id = model_id
+        self.hashes = hashes
+        self.base = base  # cached result dict the unchanged pages are cut from
+        self.reused = list(reused)  # (first new page, first base position, last base position)
+        self.changed = list(changed)  # 1-based page numbers sent to the service
+        self.pages = page_spec(self.changed) if base is not None else None
+
+    @property
+    def incremental(self) -> bool:
+        return self.base is not None
+
+    @property
+    def needs_service(self) -> bool:
+        return not self.incremental or bool(self.changed)
+
+    def finish(self, analyzed):
+        """
+        Returns the AnalyzeResult of the whole upload.
+        Args:
+            analyzed: The service's AnalyzeResult for `pages`, or None if not needs_service.
+        """
+        if not self.incremental:
+            return analyzed
+        return self._stitch(analyzed)
+
+    def remember(self, result) -> None:
+        """Makes the cached `result` of this upload reusable for later revisions."""
+        if self.hashes and not result.get("documents"):
+            page_index.record(self.result_key, self.model_id, self.hashes)
+
+    def _stitch(self, analyzed):
+        units = [(first_page, slice_unit(self.base, first, last, "base"))
+                 for first_page, first, last in self.reused]
+        if analyzed is not None:
+            fresh = analyzed.as_dict()
+            fresh_pages = fresh.get("pages") or []
+            if len(fresh_pages) != len(self.changed):
+                raise ValueError(f"Expected {len(self.changed)} analyzed pages, got {len(fresh_pages)}")
+            # One unit per run of consecutive changed pages
+            first = 0
+            for position in range(1, len(self.changed) + 1):
+                if position == len(self.changed) or self.changed[position] != self.changed[position - 1] + 1:
+                    units.append((self.changed[first], slice_unit(fresh, first, position - 1, "fresh")))
+                    first = position
+        units.sort(key=lambda unit: unit[0])
+        _stats["pages_reused"] += len(self.hashes) - len(self.changed)
+        _stats["pages_analyzed"] += len(self.changed)
+        logger.info(f"Re-analyzed {len(self.changed)} of {len(self.hashes)} pages ({self.pages or 'none'}), "
+                    f"reusing the rest of a cached analysis")
+        result = merge_results([unit for _, unit in units], [first_page for first_page, _ in units])
+        fold_split_items(result)
+        return result
+
+
+def _plan_reuse(base, base_hashes, hashes):
+    """Returns (reused units, changed pages) for rebuilding `hashes` from `base`, or None."""
+    base_pages = base.get("pages") or []
+    if base.get("documents") or len(base_pages) != len(base_hashes):
+        return None
+    if [page.get("pageNumber") for page in base_pages] != list(range(1, len(base_pages) + 1)):
+        return None
+
+    # Aligns the two page sequences, so inserted, deleted and moved-along pages are found too
+    blocks = difflib.SequenceMatcher(None, base_hashes, hashes, autojunk=False).get_matching_blocks()
+    reused = []
+    covered = set()
+    for first, last in page_units(base):
+        for a, b, size in blocks:
+            if a <= first and last < a + size:
+                new_first = b + first - a
+                reused.append((new_first + 1, first, last))
+                covered.update(range(new_first, new_first + last - first + 1))
+                break
+    if len(covered) < INCREMENTAL_MIN_REUSE * len(hashes) or not covered:
+        return None
+    changed = [i + 1 for i in range(len(hashes)) if i not in covered]
+    return reused, changed
+
+
+def plan_revision(document, model_id, result_key) -> Revision:
+    """
+    Hashes the pages of an upload and looks for a cached analysis of an earlier
+    revision to reuse. Blocking (reads the PDF); run it off the event loop.
+    """
+    if not INCREMENTAL_ANALYSIS or model_id not in INCREMENTAL_MODELS:
+        return Revision(result_key, model_id, None)
+    hashes = page_hashes(document)
+    if not hashes:
+        return Revision(result_key, model_id, hashes)
+    for candidate_key, matched in page_index.candidates(model_id, hashes, exclude=result_key):
+        if matched < INCREMENTAL_MIN_REUSE * len(hashes):
+            break
+        cached = analysis_cache.get(candidate_key)
+        if cached is None:
+            # Evicted from the cache; its pages cannot be reused any more
+            page_index.forget(candidate_key)
+            continue
+        base = cached.as_dict()
+        plan = _plan_reuse(base, page_index.hashes(candidate_key), hashes)
+        if plan is not None:
+            _stats["revisions"] += 1
+            return Revision(result_key, model_id, hashes, base, *plan)
+    return Revision(result_key, model_id, hashes)
+
+
+def stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+from page_store import page_store
+from result_cache import analysis_cache, cache_key
+from search_index import text_index
+
+logger = logging.getLogger(__name__)
+
+# Job settings, overridable from the environment / .env file
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_RETRY_AFTER_SECONDS = int(os.environ.get("JOB_RETRY_AFTER_SECONDS", "2"))
+# Unfinished jobs whose runner has not renewed them for this long are failed by other runners
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    SQLite-backed store of analysis jobs and their results.
+    Results are kept as AnalyzeResult JSON so they survive restarts and each
+    app can render them with its own converter.
+
+    Several processes (both apps, uvicorn workers) can share one database. Each
+    store has its own `owner` id, and the jobs it creates carry a lease that its
+    runner renews while they are unfinished; only jobs whose lease has run out
+    (their process is gone) are taken over and failed by others.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    model_id TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    error TEXT,
+                    result TEXT,
+                    owner TEXT,
+                    lease_until REAL
+                )
+                """
+            )
+            # Databases created before jobs had owners get the columns (and expired leases)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def create(self, filename, model_id, sha256) -> str:
+        """Records a new queued job and returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, filename, model_id, sha256, created_at, updated_at, owner, lease_until) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, model_id, sha256, now, now, self.owner, now + self.lease_seconds)
+            )
+        return job_id
+
+    def set_status(self, job_id, status, error=None, result=None) -> None:
+        """Moves a job to `status`; `result` is an AnalyzeResult stored as JSON."""
+        payload = json.dumps(result.as_dict(), separators=(",", ":")) if result is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, result = COALESCE(?, result), updated_at = ? WHERE id = ?",
+                (status, error, payload, time.time(), job_id)
+            )
+
+    def get(self, job_id) -> Optional[dict]:
+        """Returns the job's status fields (without the result), or None if unknown."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, filename, model_id, sha256, created_at, updated_at, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_result(self, job_id) -> Optional[AnalyzeResult]:
+        """Returns the stored AnalyzeResult of a succeeded job, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["result"] is None:
+            return None
+        return AnalyzeResult(json.loads(row["result"]))
+
+    def renew_leases(self) -> None:
+        """Extends the lease of this store's unfinished jobs."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + self.lease_seconds, self.owner, QUEUED, RUNNING)
+            )
+
+    def fail_unfinished(self, reason) -> int:
+        """Marks this store's own queued/running jobs as failed (on shutdown, their input is gone)."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (FAILED, reason, time.time(), self.owner, QUEUED, RUNNING)
+            )
+        return cursor.rowcount
+
+    def fail_expired(self, reason) -> int:
+        """
+        Marks queued/running jobs of other stores whose lease has run out as failed:
+        the process that owned them stopped without finishing them.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                "WHERE status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+                (FAILED, reason, now, QUEUED, RUNNING, now)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """
+    Runs submitted analyses on a thread pool and records their progress in a JobStore.
+    Args:
+        store: The JobStore to record jobs in.
+        analyze: Callable (file, model_id) -> AnalyzeResult that calls the service.
+        max_workers: Number of analyses run at the same time.
+    A heartbeat thread renews the leases of the runner's jobs and fails the jobs
+    of runners that stopped without finishing them.
+    """
+
+    def __init__(self, store, analyze, max_workers=JOB_WORKERS):
+        self.store = store
+        self.analyze = analyze
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._stopped = threading.Event()
+        self._closed = False
+        self._pending = {}  # job id -> upload of a job that has not started yet
+        self._lock = threading.Lock()
+        self._reclaim_orphans()
+        self._heartbeat = threading.Thread(target=self._renew_leases, name="analysis-job-leases", daemon=True)
+        self._heartbeat.start()
+
+    def _reclaim_orphans(self):
+        interrupted = self.store.fail_expired("The server restarted before the job finished; please resubmit.")
+        if interrupted:
+            logger.warning(f"Marked {interrupted} unfinished jobs of stopped servers as failed")
+
+    def _renew_leases(self):
+        # Renewed well before the lease runs out, so a busy process never loses its jobs
+        while not self._stopped.wait(self.store.lease_seconds / 3):
+            try:
+                self.store.renew_leases()
+                self._reclaim_orphans()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew job leases: {e}")
+
+    def submit(self, upload, filename, model_id) -> str:
+        """
+        Queues a spooled upload for analysis and returns the job id right away.
+        The runner takes ownership of `upload` and closes it when the job ends.
+        """
+        job_id = self.store.create(filename, model_id, upload.sha256)
+        with self._lock:
+            self._pending[job_id] = upload
+        try:
+            self._executor.submit(self._run, job_id, upload, filename, model_id)
+        except RuntimeError:
+            # Shut down in the meantime; the job is failed with the other queued ones
+            with self._lock:
+                self._pending.pop(job_id, None)
+            upload.close()
+            raise
+        return job_id
+
+    def _run(self, job_id, upload, filename, model_id):
+        with self._lock:
+            self._pending.pop(job_id, None)
+        try:
+            with upload:
+                self.store.set_status(job_id, RUNNING)
+                result_key = cache_key(upload.sha256, model_id)
+                result = analysis_cache.get(result_key)
+                if result is None:
+                    result = self.analyze(upload.file, model_id)
+                    analysis_cache.put(result_key, result)
+                    page_store.put(result_key, result)
+            self.store.set_status(job_id, SUCCEEDED, result=result)
+            # Also for cache hits: the job knows the filename the upload paths do not
+            text_index.add_async(result_key, result, filename)
+            logger.info(f"Job {job_id} succeeded")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self.store.set_status(job_id, FAILED, error=str(e))
+
+    def shutdown(self) -> None:
+        """Stops accepting work, waits for running analyses to finish and fails the queued ones."""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        # Uploads of the cancelled jobs are never closed by _run
+        with self._lock:
+            dropped, self._pending = list(self._pending.values()), {}
+        for upload in dropped:
+            upload.close()
+        self._stopped.set()
+        self._heartbeat.join()
+        cancelled = self.store.fail_unfinished("The server stopped before the job started; please resubmit.")
+        if cancelled:
+            logger.warning(f"Marked {cancelled} queued jobs as failed on shutdown")
+        self.store.close()
+
+
+def job_etag(job) -> str:
+    """ETag of a job's status representation; it changes whenever the job is updated."""
+    return f'"{job["id"]}-{job["status"]}-{job["updated_at"]:.6f}"'
+
+
+def job_status_body(job) -> dict:
+    """JSON body returned by GET /jobs/{id}."""
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "model_id": job["model_id"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "error": job["error"],
+    }
+
+
+def is_finished(job) -> bool:
+    return job["status"] in (SUCCEEDED, FAILED)
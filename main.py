@@ -2,8 +2,7 @@
 
 import os
 import sys
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
+from document_client import get_client
 
 from dotenv import load_dotenv
 
@@ -17,10 +16,7 @@ def analyze_document(endpoint, key, file_path, model_id="prebuilt-document"):
     Args:
         model_id: The ID of the model to use (e.g., "prebuilt-document", "prebuilt-invoice", "prebuilt-receipt")
     """
-    document_intelligence_client = DocumentIntelligenceClient(
-        endpoint=endpoint,
-        credential=AzureKeyCredential(key)
-    )
+    document_intelligence_client = get_client(endpoint, key)
 
     # Use the passed model_id
     with open(file_path, "rb") as f:
@@ -0,0 +1,228 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, Summary, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their stage breakdown
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "5"))
+
+# Stages recorded per request; the names are used as the `stage` label
+UPLOAD_READ = "upload_read"
+TEMP_FILE_WRITE = "temp_file_write"
+TEXT_LAYER = "text_layer"
+SERVICE_SUBMIT = "service_submit"
+POLLING_WAIT = "polling_wait"
+EXTRACTION = "extraction"
+SERIALIZATION = "serialization"
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 2.5e8)
+
+REQUEST_SECONDS = Histogram(
+    "docintel_request_duration_seconds", "End-to-end request latency",
+    ["app", "endpoint", "status"], buckets=_LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "docintel_stage_duration_seconds", "Time spent per request stage",
+    ["app", "endpoint", "stage"], buckets=_LATENCY_BUCKETS
+)
+DOCUMENT_PAGES = Histogram(
+    "docintel_document_pages", "Pages per analyzed document",
+    ["app", "endpoint"], buckets=(1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2000)
+)
+DOCUMENT_WORDS = Histogram(
+    "docintel_document_words", "Words per analyzed document",
+    ["app", "endpoint"], buckets=(10, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+)
+PAYLOAD_BYTES = Histogram(
+    "docintel_payload_bytes", "Request and response body sizes",
+    ["app", "endpoint", "direction"], buckets=_SIZE_BUCKETS
+)
+ERRORS = Counter(
+    "docintel_errors_total", "Failed requests by error class",
+    ["app", "endpoint", "error_class"]
+)
+STATUS_POLLS = Counter(
+    "docintel_status_polls_total", "Status polls sent while waiting for analyses",
+    ["model_id"]
+)
+POLLING_LAG_SECONDS = Histogram(
+    "docintel_polling_lag_seconds", "Time between an analysis finishing and the poll that saw it",
+    ["model_id"], buckets=_LATENCY_BUCKETS
+)
+# A summary, since the value can be negative (histograms with negative buckets have no _sum)
+POLLING_SAVED_SECONDS = Summary(
+    "docintel_polling_saved_seconds", "Latency saved compared with fixed-interval polling (negative: lost)",
+    ["model_id"]
+)
+PAGES_ROUTED = Counter(
+    "docintel_pages_routed_total", "Pages read from the PDF text layer or sent to the service",
+    ["model_id", "source"]
+)
+MODEL_ROUTES = Counter(
+    "docintel_model_routes_total", "Models chosen for requests, by why they were chosen",
+    ["model_id", "reason"]
+)
+MODEL_ANALYSIS_SECONDS = Histogram(
+    "docintel_model_analysis_seconds", "Time from submitting an analysis until its result, per model",
+    ["model_id"], buckets=_LATENCY_BUCKETS
+)
+MODEL_PAGES = Counter(
+    "docintel_model_pages_total", "Pages analyzed by the service, per model",
+    ["model_id"]
+)
+
+_current = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """
+    Collects the stage timings, document counts and sizes of one request.
+    Stages that repeat (e.g. chunked analyses) are summed; everything is
+    observed into the Prometheus metrics when the request finishes.
+    """
+
+    def __init__(self, app, endpoint):
+        self.app = app
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.pages = None
+        self.words = None
+        self.request_bytes = None
+        self.response_bytes = None
+        self.error_class = None
+        self.finished = False
+        # Stages can be added from several threads at once (e.g. chunk requests)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        if self.finished:
+            # e.g. serialization of a streamed response, which outlives the request handler
+            STAGE_SECONDS.labels(self.app, self.endpoint, stage).observe(seconds)
+        else:
+            with self._lock:
+                self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self, status) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        labels = (self.app, self.endpoint)
+        REQUEST_SECONDS.labels(*labels, str(status)).observe(total)
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.labels(*labels, stage).observe(seconds)
+        if self.pages is not None:
+            DOCUMENT_PAGES.labels(*labels).observe(self.pages)
+            DOCUMENT_WORDS.labels(*labels).observe(self.words or 0)
+        if self.request_bytes is not None:
+            PAYLOAD_BYTES.labels(*labels, "request").observe(self.request_bytes)
+        if self.response_bytes is not None:
+            PAYLOAD_BYTES.labels(*labels, "response").observe(self.response_bytes)
+        if self.error_class is None and int(status) >= 400:
+            self.error_class = f"http_{status}"
+        if self.error_class is not None:
+            ERRORS.labels(*labels, self.error_class).inc()
+
+        if total >= SLOW_REQUEST_SECONDS:
+            logger.warning(json.dumps({
+                "event": "slow_request",
+                "app": self.app,
+                "endpoint": self.endpoint,
+                "status": status,
+                "total_ms": round(total * 1000, 1),
+                "stages_ms": {stage: round(s * 1000, 1) for stage, s in self.stages.items()},
+                "pages": self.pages,
+                "words": self.words,
+                "request_bytes": self.request_bytes,
+                "response_bytes": self.response_bytes,
+                "error_class": self.error_class,
+            }))
+
+
+def start_request(app, endpoint) -> RequestTimer:
+    """Creates the timer of the current request and makes it visible to record_* below."""
+    timer = RequestTimer(app, endpoint)
+    _current.set(timer)
+    return timer
+
+
+def current_timer():
+    return _current.get()
+
+
+def record_stage(stage, seconds) -> None:
+    timer = _current.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as `name` for the current request (no-op outside a request)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_document(result) -> None:
+    """Records the page and word counts of an AnalyzeResult for the current request."""
+    timer = _current.get()
+    if timer is not None and result is not None:
+        pages = result.pages or []
+        timer.pages = len(pages)
+        timer.words = sum(len(page.words or []) for page in pages)
+
+
+def record_error(error) -> None:
+    timer = _current.get()
+    if timer is not None:
+        timer.error_class = type(error).__name__
+
+
+def record_upload(upload) -> None:
+    """Splits a SpooledUpload's copy time into reading the request and writing the buffer."""
+    timer = _current.get()
+    if timer is not None:
+        timer.request_bytes = upload.size
+        timer.add(UPLOAD_READ, max(0.0, upload.copy_seconds - upload.write_seconds))
+        timer.add(TEMP_FILE_WRITE, upload.write_seconds)
+
+
+def record_polling(model_id, polls, lag, saved) -> None:
+    """Records how an analysis was polled (see adaptive_polling.py); not tied to a request."""
+    STATUS_POLLS.labels(model_id).inc(polls)
+    POLLING_LAG_SECONDS.labels(model_id).observe(max(0.0, lag))
+    POLLING_SAVED_SECONDS.labels(model_id).observe(saved)
+
+
+def record_pages_routed(model_id, local, service) -> None:
+    """Records where the pages of a document were extracted (see text_layer.py)."""
+    PAGES_ROUTED.labels(model_id, "text_layer").inc(local)
+    PAGES_ROUTED.labels(model_id, "service").inc(service)
+
+
+def record_model_route(model_id, reason) -> None:
+    """Records which model a request was routed to (see model_router.py)."""
+    MODEL_ROUTES.labels(model_id, reason).inc()
+
+
+def record_model_analysis(model_id, pages, seconds) -> None:
+    """Records the duration and page count of one analysis; not tied to a request."""
+    MODEL_ANALYSIS_SECONDS.labels(model_id).observe(seconds)
+    MODEL_PAGES.labels(model_id).inc(pages)
+
+
+def render():
+    """Returns (body, content type) of the Prometheus text exposition."""
+    return generate_latest(), CONTENT_TYPE_LATEST
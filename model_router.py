@@ -0,0 +1,172 @@
+"""
+Picks the cheapest model that returns what a request asks for.
+
+Callers describe what they need from an analysis:
+
+    TEXT             words, lines, their polygons and the text content
+    TABLES           tables
+    KEY_VALUE_PAIRS  key-value pairs
+    FIELDS           typed invoice fields (the result's `documents`)
+
+MODEL_CAPABILITIES lists the prebuilt models from the cheapest and fastest up
+and route() returns the first one that covers every need: prebuilt-read for
+text and coordinates, prebuilt-layout once tables or key-value pairs are
+needed, prebuilt-invoice for invoice fields. In API version 2024-11-30,
+key-value pairs are an add-on of the layout and invoice models, so a route
+that needs them also carries the `keyValuePairs` feature. Such results are
+cached apart from plain ones (Route.key).
+
+A request can name its model instead (?model=). Every decision is counted per
+model together with its reason, and the duration of every analysis is
+recorded per model. The docintel_model_* metrics and the "routing" section of
+/cache/stats show both, so the routing can be checked against benchmark.py
+runs (--model pins a model for comparison).
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Model routing settings, overridable from the environment / .env file.
+# MODEL_ROUTING=0 analyzes with each endpoint's previous fixed model.
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "1") != "0"
+# Models a request may pick with ?model= (comma-separated); empty allows any model id
+ALLOWED_MODELS = [m.strip() for m in os.environ.get("ALLOWED_MODELS", "").split(",") if m.strip()]
+# Analyses per model kept for the latency percentiles in stats()
+ROUTING_HISTORY_SIZE = int(os.environ.get("ROUTING_HISTORY_SIZE", "200"))
+
+# What a request can ask for
+TEXT = "text"
+TABLES = "tables"
+KEY_VALUE_PAIRS = "key_value_pairs"
+FIELDS = "fields"
+
+# Prebuilt models, cheapest and fastest first, with what each one returns
+MODEL_CAPABILITIES = (
+    ("prebuilt-read", frozenset({TEXT})),
+    ("prebuilt-layout", frozenset({TEXT, TABLES, KEY_VALUE_PAIRS})),
+    ("prebuilt-invoice", frozenset({TEXT, TABLES, KEY_VALUE_PAIRS, FIELDS})),
+)
+# Needs served by an add-on feature (features=[...]) rather than by the model alone
+ADD_ON_FEATURES = {KEY_VALUE_PAIRS: "keyValuePairs"}
+
+# Why a model was used; the `reason` metric label
+ROUTED = "routed"
+OVERRIDE = "override"
+FIXED = "fixed"
+
+# Model ids as the service accepts them; anything else is rejected before any work is done
+_MODEL_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9._~-]{1,63}")
+_CAPABILITIES = dict(MODEL_CAPABILITIES)
+
+
+def _percentile(sorted_values, pct):
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Route:
+    """The model, and the add-on features it needs, chosen for one request."""
+
+    def __init__(self, model_id, features=(), reason=ROUTED):
+        self.model_id = model_id
+        self.features = tuple(features)
+        self.reason = reason
+
+    @property
+    def key(self) -> str:
+        """Model id for the result cache: results with add-on features are cached apart."""
+        return "+".join((self.model_id, *self.features))
+
+    def __repr__(self):
+        return f"Route({self.key!r}, {self.reason!r})"
+
+
+class ModelRouter:
+    """
+    Chooses models per request and keeps per-model decision counts and analysis
+    durations for stats(); the same numbers go to the Prometheus metrics.
+    """
+
+    def __init__(self, routing=MODEL_ROUTING, allowed_models=ALLOWED_MODELS, history_size=ROUTING_HISTORY_SIZE):
+        self.routing = routing
+        self.allowed_models = list(allowed_models)
+        self._history_size = history_size
+        self._decisions = {}  # model_id -> {reason: count}
+        self._analyses = {}  # model_id -> {"analyses", "pages", "seconds", "recent": deque of seconds}
+        self._lock = threading.Lock()
+
+    def route(self, needs, override=None, default=None) -> Route:
+        """
+        Picks the model for a request.
+        Args:
+            needs: What the result must contain (TEXT, TABLES, KEY_VALUE_PAIRS, FIELDS).
+            override: Model id named by the request (?model=), used as-is.
+            default: The endpoint's fixed model, used when routing is turned off.
+        Raises:
+            ValueError: For a malformed or disallowed override.
+        """
+        needs = frozenset(needs)
+        if override:
+            if not _MODEL_ID.fullmatch(override) or (self.allowed_models and override not in self.allowed_models):
+                raise ValueError(f"Unknown or disallowed model: {override}")
+            model_id, reason = override, OVERRIDE
+        elif not self.routing and default:
+            model_id, reason = default, FIXED
+        else:
+            # The most capable model when nothing covers every need
+            model_id = next((m for m, capabilities in MODEL_CAPABILITIES if needs <= capabilities),
+                            MODEL_CAPABILITIES[-1][0])
+            reason = ROUTED
+        # Add-ons are only requested from models that support them (custom models are assumed to)
+        capabilities = _CAPABILITIES.get(model_id)
+        features = sorted(ADD_ON_FEATURES[need] for need in needs
+                          if need in ADD_ON_FEATURES and (capabilities is None or need in capabilities))
+        route = Route(model_id, features, reason)
+
+        with self._lock:
+            counts = self._decisions.setdefault(model_id, {})
+            counts[reason] = counts.get(reason, 0) + 1
+        metrics.record_model_route(model_id, reason)
+        logger.debug(f"{route} for {', '.join(sorted(needs)) or 'nothing'}")
+        return route
+
+    def record_analysis(self, model_id, result, seconds) -> None:
+        """Records how long the service took to analyze `result` with `model_id`."""
+        pages = len(result.pages or []) if result is not None else 0
+        with self._lock:
+            entry = self._analyses.get(model_id)
+            if entry is None:
+                entry = self._analyses[model_id] = {"analyses": 0, "pages": 0, "seconds": 0.0,
+                                                    "recent": deque(maxlen=self._history_size)}
+            entry["analyses"] += 1
+            entry["pages"] += pages
+            entry["seconds"] += seconds
+            entry["recent"].append(seconds)
+        metrics.record_model_analysis(model_id, pages, seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            decisions = {model_id: dict(counts) for model_id, counts in self._decisions.items()}
+            analyses = {model_id: (entry["analyses"], entry["pages"], entry["seconds"], sorted(entry["recent"]))
+                        for model_id, entry in self._analyses.items()}
+        latency = {}
+        for model_id, (count, pages, seconds, recent) in analyses.items():
+            latency[model_id] = {
+                "analyses": count,
+                "pages": pages,
+                "mean_seconds": round(seconds / count, 3),
+                "seconds_per_page": round(seconds / pages, 3) if pages else None,
+                "p50_seconds": round(_percentile(recent, 50), 3),
+                "p95_seconds": round(_percentile(recent, 95), 3),
+            }
+        return {"enabled": self.routing, "decisions": decisions, "latency": latency}
+
+
+# Shared by the apps and the job runners
+model_router = ModelRouter()
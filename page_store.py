@@ -0,0 +1,192 @@
+"""
+Page-indexed, memory-mapped store of analysis results.
+
+Every analysis is written once in the columnar layout (columnar.py) to
+PAGE_STORE_DIR/<id[:2]>/<id>.bin, where the id is the analysis's cache key -
+the `document` of /search hits and the X-Document-Id of /analyze-pdf responses.
+Reading a page maps the file, finds the page in the page table with a binary
+search and decodes only that page's words and lines, so
+GET /documents/{id}/pages/{n} costs the same for a 1-page and a 2000-page
+document. Mapped files are kept open in a small LRU.
+
+Analyses cached before the store existed (or whose file was evicted) are
+written from the analysis cache on first access.
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from columnar import ColumnarDocument, encode_columnar
+from result_cache import CACHE_DIR, analysis_cache
+
+logger = logging.getLogger(__name__)
+
+# Page store settings, overridable from the environment / .env file
+PAGE_STORE_DIR = os.environ.get("PAGE_STORE_DIR", os.path.join(CACHE_DIR, "page_store"))
+PAGE_STORE_MAX_BYTES = int(os.environ.get("PAGE_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Documents kept memory-mapped between requests
+PAGE_STORE_OPEN_FILES = int(os.environ.get("PAGE_STORE_OPEN_FILES", "64"))
+
+# Ids are cache keys (hex SHA-256); anything else never reaches the filesystem
+_DOCUMENT_ID = re.compile(r"[0-9a-f]{64}")
+
+
+def _rounded(polygon):
+    # float32 on disk; rounded so the JSON does not carry float32 noise
+    return [round(v, 4) for v in polygon]
+
+
+class PageStore:
+    """
+    One columnar file per analyzed document, read a page at a time through mmap.
+    Files are written atomically; once over `max_bytes`, the oldest are removed.
+    """
+
+    def __init__(self, directory=PAGE_STORE_DIR, max_bytes=PAGE_STORE_MAX_BYTES, open_files=PAGE_STORE_OPEN_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.open_files = open_files
+        self._open = OrderedDict()  # document id -> ColumnarDocument
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # Computed lazily on first write
+        self._counters = {"stores": 0, "page_reads": 0, "backfills": 0, "evictions": 0}
+
+    def _path(self, document_id):
+        return os.path.join(self.directory, document_id[:2], f"{document_id}.bin")
+
+    def put(self, document_id, result) -> None:
+        """Stores the words and lines of an AnalyzeResult. Disk errors are logged, never raised."""
+        payload = encode_columnar(result)
+        path = self._path(document_id)
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never map a partial file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write page store entry {document_id}: {e}")
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return
+
+        with self._lock:
+            self._counters["stores"] += 1
+            # A mapping of the replaced file would still show the old contents
+            self._open.pop(document_id, None)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(payload) - previous_size
+            over_limit = self._disk_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _document(self, document_id):
+        """Returns the mapped ColumnarDocument of `document_id`, or None if it is unknown."""
+        with self._lock:
+            document = self._open.get(document_id)
+            if document is not None:
+                self._open.move_to_end(document_id)
+                return document
+        try:
+            document = ColumnarDocument.open(self._path(document_id))
+        except (OSError, ValueError):
+            result = analysis_cache.get(document_id)
+            if result is None:
+                return None
+            self.put(document_id, result)
+            with self._lock:
+                self._counters["backfills"] += 1
+            try:
+                document = ColumnarDocument.open(self._path(document_id))
+            except (OSError, ValueError):
+                return None
+        with self._lock:
+            self._open[document_id] = document
+            # Dropped mappings are unmapped once the last page read using them is done
+            while len(self._open) > self.open_files:
+                self._open.popitem(last=False)
+        return document
+
+    def page(self, document_id, page_number):
+        """
+        Returns the words and lines of one page of a stored analysis, in the shape of
+        /analyze-pdf's words and lines, or None if the document or page is unknown.
+        """
+        if not _DOCUMENT_ID.fullmatch(document_id):
+            return None
+        document = self._document(document_id)
+        if document is None:
+            return None
+        page = document.find_page(page_number)
+        if page is None:
+            return None
+        with self._lock:
+            self._counters["page_reads"] += 1
+        return {
+            "document": document_id,
+            "page": page_number,
+            "width": round(page["width"], 4),
+            "height": round(page["height"], 4),
+            "unit": page["unit"],
+            "words": [{"page": page_number, "word_index": index, "text": document.word_text(i),
+                       "polygon": _rounded(document.word_polygon(i))}
+                      for index, i in enumerate(page["words"])],
+            "lines": [{"page": page_number, "line_index": index, "text": document.line_text(i),
+                       "polygon": _rounded(document.line_polygon(i))}
+                      for index, i in enumerate(page["lines"])],
+        }
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".bin"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_disk_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Removes the oldest files until the store is under its size limit."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._counters["evictions"] += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} page store entries ({total} bytes on disk)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "open_documents": len(self._open), "disk_bytes": self._disk_bytes}
+
+
+# Shared by the apps and the job runner
+page_store = PageStore()
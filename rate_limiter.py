@@ -0,0 +1,304 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from azure.core.pipeline.policies import AsyncHTTPPolicy, HTTPPolicy
+
+logger = logging.getLogger(__name__)
+
+# Rate limit settings, overridable from the environment / .env file.
+# The defaults match the S0 tier quota of 15 analyze requests per second.
+RATE_LIMIT_TPS = float(os.environ.get("DI_RATE_LIMIT_TPS", "15"))
+RATE_LIMIT_BURST = float(os.environ.get("DI_RATE_LIMIT_BURST", str(RATE_LIMIT_TPS)))
+MAX_CONCURRENCY = int(os.environ.get("DI_MAX_CONCURRENCY", "16"))
+MIN_CONCURRENCY = int(os.environ.get("DI_MIN_CONCURRENCY", "1"))
+LATENCY_TARGET_SECONDS = float(os.environ.get("DI_LATENCY_TARGET_SECONDS", "5"))
+# Pause used when a 429 response carries no usable Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+# Priority lanes: interactive requests (the viewer, /analyze-pdf) are always
+# dispatched before bulk work (background jobs, batch uploads)
+INTERACTIVE = "interactive"
+BULK = "bulk"
+_LANES = {INTERACTIVE: 0, BULK: 1}
+
+# Request option that carries the lane through the SDK pipeline, e.g.
+# client.begin_analyze_document(model_id, body=..., analysis_priority=BULK)
+PRIORITY_OPTION = "analysis_priority"
+
+
+class _Ticket:
+    """A queued request; `grant` is called (under the scheduler lock) when it may proceed."""
+
+    __slots__ = ("lane", "seq", "grant", "granted", "cancelled")
+
+    def __init__(self, lane, seq, grant):
+        self.lane = lane
+        self.seq = seq
+        self.grant = grant
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.lane, self.seq) < (other.lane, other.seq)
+
+
+def _retry_after_seconds(response):
+    headers = response.headers
+    for name, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("Retry-After", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass  # HTTP-date form; fall back to the default pause
+    return DEFAULT_RETRY_AFTER_SECONDS
+
+
+class AnalysisScheduler:
+    """
+    Process-wide admission control for analyze requests to Document Intelligence.
+
+    A request is dispatched when (1) it is the oldest waiter of the highest-priority
+    lane, (2) fewer than `limit` analyze requests are in flight and (3) the token
+    bucket has a token. `limit` adapts AIMD-style: it grows while requests complete
+    under the latency target and is halved on a 429, after which every lane is
+    paused for the response's Retry-After. Both threads and asyncio tasks can wait
+    on the same scheduler.
+    Args:
+        rate: Tokens added per second (analyze requests per second); 0 disables the bucket.
+        burst: Bucket capacity.
+        max_concurrency: Upper bound (and starting value) of the concurrency limit.
+        min_concurrency: Lower bound of the concurrency limit.
+        latency_target: Request latency (seconds) above which the limit shrinks.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_TPS, burst=RATE_LIMIT_BURST, max_concurrency=MAX_CONCURRENCY,
+                 min_concurrency=MIN_CONCURRENCY, latency_target=LATENCY_TARGET_SECONDS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min(min_concurrency, max_concurrency))
+        self.latency_target = latency_target
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.dispatched = 0
+        self.throttled = 0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._backoff_until = 0.0
+        self._waiters = []  # heap of _Ticket
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    # --- Acquiring -------------------------------------------------------
+
+    def acquire(self, priority=INTERACTIVE) -> None:
+        """Blocks the calling thread until an analyze request may be sent."""
+        ready = threading.Event()
+        self._enqueue(priority, ready.set)
+        ready.wait()
+
+    async def acquire_async(self, priority=INTERACTIVE) -> None:
+        """Waits (without blocking the event loop) until an analyze request may be sent."""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+        ticket = self._enqueue(priority, grant)
+        try:
+            await ready
+        except asyncio.CancelledError:
+            with self._lock:
+                if ticket.granted:
+                    # Granted just as we were cancelled: hand the slot back
+                    self.in_flight -= 1
+                    self._dispatch_locked()
+                else:
+                    ticket.cancelled = True
+            raise
+
+    def _enqueue(self, priority, grant):
+        ticket = _Ticket(_LANES.get(priority, _LANES[INTERACTIVE]), next(self._seq), grant)
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+            self._dispatch_locked()
+        return ticket
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _dispatch_locked(self):
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            ticket = self._waiters[0]
+            if ticket.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return  # the next release() dispatches again
+            wait = self.paused_until - now
+            if self.rate > 0 and self._tokens < 1:
+                wait = max(wait, (1 - self._tokens) / self.rate)
+            if wait > 0:
+                self._wake_after(wait)
+                return
+            heapq.heappop(self._waiters)
+            if self.rate > 0:
+                self._tokens -= 1
+            self.in_flight += 1
+            self.dispatched += 1
+            ticket.granted = True
+            try:
+                ticket.grant()
+            except RuntimeError:
+                # The waiter's event loop has been closed; nobody will use the slot
+                self.in_flight -= 1
+
+    def _wake_after(self, wait):
+        # One timer at a time: waiting only ever gets shorter for a given head of queue
+        if self._timer is None:
+            self._timer = threading.Timer(wait, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch_locked()
+
+    # --- Feedback --------------------------------------------------------
+
+    def release(self, latency=None, response=None) -> None:
+        """
+        Returns the slot of a dispatched request and adapts the limit to its outcome.
+        Args:
+            latency: Seconds the request took, or None if it failed without a response.
+            response: The HTTP response, used to detect 429s and read Retry-After.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if response is not None and response.status_code == 429:
+                self._throttle_locked(_retry_after_seconds(response))
+            elif latency is not None and response is not None and response.status_code < 400:
+                if latency > self.latency_target:
+                    self.limit = max(self.min_concurrency, self.limit * 0.9)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._dispatch_locked()
+
+    def observe(self, response) -> None:
+        """Records the outcome of a request that did not go through acquire() (e.g. a status poll)."""
+        if response.status_code == 429:
+            with self._lock:
+                self._throttle_locked(_retry_after_seconds(response))
+                self._dispatch_locked()
+
+    def _throttle_locked(self, retry_after):
+        now = time.monotonic()
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self._tokens = 0.0
+        # A burst of 429s from one overload only halves the limit once
+        if now >= self._backoff_until:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self._backoff_until = now + retry_after
+            logger.warning(f"Document Intelligence throttled us; pausing {retry_after:.1f}s, "
+                           f"concurrency limit now {int(self.limit)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {lane: 0 for lane in _LANES}
+            names = {index: lane for lane, index in _LANES.items()}
+            for ticket in self._waiters:
+                if not ticket.cancelled:
+                    queued[names[ticket.lane]] += 1
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queued": queued,
+                "dispatched": self.dispatched,
+                "throttled": self.throttled,
+                "paused_for": max(0.0, self.paused_until - time.monotonic()),
+            }
+
+
+# Shared by every client created in document_client.py
+analysis_scheduler = AnalysisScheduler()
+
+
+def _is_analyze_request(http_request):
+    return http_request.method == "POST" and ":analyze" in http_request.url
+
+
+def _priority(request):
+    # Pop the option so it never reaches the transport; keep it on the context for retries
+    priority = request.context.options.pop(PRIORITY_OPTION, None)
+    if priority is not None:
+        request.context[PRIORITY_OPTION] = priority
+    return request.context.get(PRIORITY_OPTION, INTERACTIVE)
+
+
+class RateLimitPolicy(HTTPPolicy):
+    """
+    Pipeline policy (installed after the SDK's RetryPolicy) that sends every
+    analyze attempt through the scheduler. Status polls pass straight through,
+    but a 429 on them still pauses the scheduler.
+    """
+
+    def __init__(self, scheduler=None):
+        super().__init__()
+        self.scheduler = scheduler or analysis_scheduler
+
+    def send(self, request):
+        priority = _priority(request)
+        if not _is_analyze_request(request.http_request):
+            response = self.next.send(request)
+            self.scheduler.observe(response.http_response)
+            return response
+
+        self.scheduler.acquire(priority)
+        start = time.monotonic()
+        try:
+            response = self.next.send(request)
+        except BaseException:
+            self.scheduler.release()
+            raise
+        self.scheduler.release(time.monotonic() - start, response.http_response)
+        return response
+
+
+class AsyncRateLimitPolicy(AsyncHTTPPolicy):
+    """Async counterpart of RateLimitPolicy for the aio client."""
+
+    def __init__(self, scheduler=None):
+        super().__init__()
+        self.scheduler = scheduler or analysis_scheduler
+
+    async def send(self, request):
+        priority = _priority(request)
+        if not _is_analyze_request(request.http_request):
+            response = await self.next.send(request)
+            self.scheduler.observe(response.http_response)
+            return response
+
+        await self.scheduler.acquire_async(priority)
+        start = time.monotonic()
+        try:
+            response = await self.next.send(request)
+        except BaseException:
+            self.scheduler.release()
+            raise
+        self.scheduler.release(time.monotonic() - start, response.http_response)
+        return response
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+from document_client import API_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Cache settings, overridable from the environment / .env file
+CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", ".analysis_cache")
+CACHE_MEMORY_ITEMS = int(os.environ.get("ANALYSIS_CACHE_MEMORY_ITEMS", "64"))
+CACHE_DISK_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def cache_key(sha256: str, model_id: str, api_version: str = API_VERSION) -> str:
+    """
+    Builds the cache key for one analysis.
+    The API version is part of the key because a newer API version can return
+    a differently shaped result for the same PDF.
+    Args:
+        sha256: Hex SHA-256 digest of the document bytes.
+        model_id: The Document Intelligence model used for the analysis.
+        api_version: The service API version used for the analysis.
+    Returns:
+        A filesystem-safe key string.
+    """
+    return hashlib.sha256(f"{sha256}|{model_id}|{api_version}".encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for AnalyzeResult objects.
+
+    The memory tier is an LRU of serialized results (bounded by item count).
+    The disk tier stores one JSON file per key under `directory`; entries older
+    than `ttl_seconds` are treated as misses and the oldest entries are evicted
+    once the directory grows past `disk_max_bytes`.
+
+    Results are stored as JSON (AnalyzeResult.as_dict()) and a fresh
+    AnalyzeResult is built on every hit, so callers can never mutate the
+    cached copy.
+    """
+
+    def __init__(self, directory=CACHE_DIR, memory_items=CACHE_MEMORY_ITEMS,
+                 disk_max_bytes=CACHE_DISK_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (stored_at, json bytes)
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # Computed lazily on first disk write
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "expired": 0,
+            "evictions": 0,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _remember(self, key, stored_at, payload):
+        # Caller must hold the lock
+        self._memory[key] = (stored_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[AnalyzeResult]:
+        """Returns the cached AnalyzeResult for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if not self._expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return AnalyzeResult(json.loads(payload))
+                del self._memory[key]
+                self._counters["expired"] += 1
+
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                self._remove(path)
+                with self._lock:
+                    self._counters["expired"] += 1
+                    self._counters["misses"] += 1
+                return None
+            with open(path, "rb") as f:
+                payload = f.read()
+        except OSError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self._remember(key, stored_at, payload)
+            self._counters["disk_hits"] += 1
+        return AnalyzeResult(json.loads(payload))
+
+    def put(self, key: str, result: AnalyzeResult) -> None:
+        """Stores `result` in both tiers. Disk errors are logged, never raised."""
+        payload = json.dumps(result.as_dict(), separators=(",", ":")).encode("utf-8")
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, payload)
+            self._counters["stores"] += 1
+
+        path = self._path(key)
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write analysis cache entry {key}: {e}")
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(payload) - previous_size
+            over_limit = self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_disk_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_disk(self):
+        """Removes expired entries, then the oldest ones, until under the size limit."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, path in entries:
+            if total <= self.disk_max_bytes and not self._expired(mtime):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._counters["evictions"] += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} analysis cache entries ({total} bytes on disk)")
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and current tier sizes."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# Shared cache instance used by api.py and app.py
+analysis_cache = AnalysisCache()
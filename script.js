@@ -9,6 +9,8 @@ const pdfCanvas = document.getElementById('pdfCanvas');
 const textLayer = document.getElementById('textLayer'); // New reference for text layer
 const pdfViewerContainer = document.getElementById('pdfViewerContainer');
 const ctx = pdfCanvas.getContext('2d');
+const highlightCanvas = document.getElementById('highlightCanvas'); // Overlay for field highlights
+const highlightCtx = highlightCanvas.getContext('2d');
 const pageNumDisplay = document.getElementById('pageNumDisplay');
 const totalPagesDisplay = document.getElementById('totalPagesDisplay');
 const prevPageButton = document.getElementById('prevPageButton');
@@ -23,7 +25,7 @@ let pageRendering = false;
 let pageNumPending = null;
 const scale = 1.5; // Adjust scale for rendering quality/size
 let currentAnalysisResult = null; // Store the actual result from the backend
-let highlightAfterRender = null; // Store polygon data for highlighting after page render
+let highlightAfterRender = null; // Normalized polygon to highlight once its page has rendered
 let currentRenderTask = null; // Keep track of rendering task
 let currentTextLayerTask = null; // Keep track of text layer rendering task
 
@@ -54,6 +56,9 @@ async function renderPage(pageNum) {
             const viewport = page.getViewport({ scale: scale });
             pdfCanvas.height = viewport.height;
             pdfCanvas.width = viewport.width;
+            // The overlay matches the page canvas pixel for pixel (resizing also clears it)
+            highlightCanvas.height = viewport.height;
+            highlightCanvas.width = viewport.width;
 
             // Adjust text layer dimensions to match canvas
             textLayer.style.width = `${viewport.width}px`;
@@ -91,7 +96,7 @@ async function renderPage(pageNum) {
 
                     // If a specific highlight was requested before rendering, draw it now
                     if (highlightAfterRender && highlightAfterRender.pageNum === pageNum) {
-                        drawSpecificHighlight(highlightAfterRender.polygon, pageNum);
+                        drawHighlight(highlightAfterRender.polygon);
                         highlightAfterRender = null; // Clear the request
                     }
 
@@ -314,130 +319,43 @@ analyzeButton.addEventListener('click', async () => {
 });
 
 /**
- * Clears any existing highlight divs.
+ * Clears the highlight overlay; the rendered page underneath is untouched.
  */
 function clearHighlights() {
-    const existingHighlights = pdfViewerContainer.querySelectorAll('.highlight');
-    existingHighlights.forEach(h => h.remove());
+    highlightCtx.clearRect(0, 0, highlightCanvas.width, highlightCanvas.height);
 }
 
 /**
  * Handles clicks on field values to highlight the location on the PDF canvas.
+ * The highlight goes on the overlay canvas; the page is only rendered again
+ * when the field is on a different page than the one shown.
  * @param {Array} boundingRegions The bounding regions from the analysis result for a specific field.
  */
 function handleLocationClick(boundingRegions) {
-    console.log("--- handleLocationClick Start ---");
-    console.log(`Current page number viewed: ${currentPageNum}`);
-
-    // Most critical check: Is pdfDoc defined and non-null?
-    if (typeof pdfDoc === 'undefined') {
-        // This is the ReferenceError case
-        console.error("Highlight Error: CRITICAL - pdfDoc variable is not defined in this scope!");
-        alert("Error: PDF document reference is missing (undefined). Please try reloading the PDF.");
-        return;
-    }
-    if (pdfDoc === null) {
-        // This handles the case where it's reset or hasn't loaded yet
+    if (!pdfDoc) {
         console.error("Highlight Error: pdfDoc is null. PDF might be loading, failed to load, or was reset.");
         alert("Error: PDF document is not ready (null). Please wait for it to load or reload the file.");
         return;
     }
-    if (!pdfCanvas || !ctx) {
-        console.error("Highlight Error: Canvas or 2D context is not ready.");
-        return;
-    }
-
-    // --- If we passed the checks above, pdfDoc exists and is not null ---
-    console.log("Highlight Info: pdfDoc object is available:", pdfDoc);
 
-    // Find the region matching the currently displayed page number
-    const region = boundingRegions.find(r => r.page_number === currentPageNum);
-
-    if (!region) {
-        console.warn(`Highlight Warning: No bounding region found where page_number === ${currentPageNum}.`);
-        const availablePages = boundingRegions.map(r => r.page_number);
-        console.log(`Available page numbers in these regions: [${availablePages.join(', ')}]`);
-        console.log("--- handleLocationClick End (No Region Found) ---");
+    // Prefer a region on the page being viewed, otherwise jump to the field's first page
+    const region = boundingRegions.find(r => r.page_number === currentPageNum) || boundingRegions[0];
+    const polygon = region && region.normalized_polygon;
+    if (!polygon || polygon.length < 8 || polygon.length % 2 !== 0) {
+        console.warn("Highlight Warning: No usable normalized polygon in these regions:", boundingRegions);
         return;
     }
-
-    console.log(`Highlight Info: Found region for page ${currentPageNum}:`, JSON.stringify(region, null, 2));
-
-    if (!region.polygon || region.polygon.length === 0) {
-        console.warn(`Highlight Warning: Region found for page ${currentPageNum}, but it has no polygon data or polygon is empty.`);
-        console.log("--- handleLocationClick End (Missing Polygon) ---");
+    if (region.page_number > pdfDoc.numPages) {
+        console.warn(`Highlight Warning: Page ${region.page_number} is not in the loaded PDF.`);
         return;
     }
 
-    const polygon = region.polygon;
-    console.log("Highlight Info: Valid polygon found:", polygon);
-
-    if (polygon.length < 8 || polygon.length % 2 !== 0) {
-        console.warn("Highlight Warning: Polygon data seems invalid (less than 4 points or odd number of coordinates):", polygon);
-        console.log("--- handleLocationClick End (Invalid Polygon) ---");
-        return;
+    if (region.page_number === currentPageNum && !pageRendering) {
+        drawHighlight(polygon);
+    } else {
+        highlightAfterRender = { pageNum: region.page_number, polygon: polygon };
+        queueRenderPage(region.page_number);
     }
-
-    console.log("Highlight Info: Proceeding to re-render page and draw highlight...");
-    renderPage(currentPageNum).then(() => {
-        console.log("Highlight Info: Page re-rendered. Getting page object...");
-        pdfDoc.getPage(currentPageNum).then(page => {
-            const scale = 1.5; // Must match the scale in renderPage
-            const viewport = page.getViewport({ scale: scale });
-            const pageHeightInPoints = page.view[3]; // Height of the PDF page in points
-
-            console.log("Highlight Info: Viewport obtained. Drawing polygon...");
-            console.log("Page dimensions:", page.view, "Height in points:", pageHeightInPoints);
-
-            // Start a new path
-            ctx.beginPath();
-
-            // CRITICAL FIX: Proper coordinate conversion from inches to PDF points to canvas pixels
-            // 1. Convert first point from inches (Document Intelligence) to PDF points (1 inch = 72 points)
-            // 2. For Y coordinates, we need to flip the origin from top-left to bottom-left
-            // 3. Then convert from points to canvas pixels using the viewport
-
-            const INCH_TO_POINT = 72; // Standard conversion: 1 inch = 72 points in PDF
-
-            // Convert first coordinate and move to it
-            const firstPointX_point = polygon[0] * INCH_TO_POINT; // X: inch to point
-            const firstPointY_point = pageHeightInPoints - (polygon[1] * INCH_TO_POINT); // Y: inch to point with origin flip
-
-            // Convert from PDF points to canvas pixels
-            const firstPoint = viewport.convertToViewportPoint(firstPointX_point, firstPointY_point);
-            ctx.moveTo(firstPoint[0], firstPoint[1]);
-            console.log(`Draw: MoveTo (${firstPoint[0].toFixed(2)}, ${firstPoint[1].toFixed(2)}) [converted from inches: (${polygon[0]}, ${polygon[1]})]`);
-
-            // Do the same for each remaining point
-            for (let i = 2; i < polygon.length; i += 2) {
-                const pointX_point = polygon[i] * INCH_TO_POINT; // X: inch to point
-                const pointY_point = pageHeightInPoints - (polygon[i + 1] * INCH_TO_POINT); // Y: inch to point with origin flip
-
-                // Convert from PDF points to canvas pixels
-                const point = viewport.convertToViewportPoint(pointX_point, pointY_point);
-                ctx.lineTo(point[0], point[1]);
-                console.log(`Draw: LineTo (${point[0].toFixed(2)}, ${point[1].toFixed(2)}) [converted from inches: (${polygon[i]}, ${polygon[i + 1]})]`);
-            }
-
-            ctx.closePath();
-
-            // Style the highlight
-            ctx.fillStyle = 'rgba(255, 255, 0, 0.3)'; // Semi-transparent yellow fill
-            ctx.strokeStyle = 'rgba(255, 0, 0, 0.7)'; // Red border
-            ctx.lineWidth = 2; // Make border a bit thicker for visibility
-
-            // Apply the drawing
-            ctx.fill();
-            ctx.stroke();
-            console.log("Highlight Info: Drawing complete.");
-
-        }).catch(err => {
-            console.error('Highlight Error: Failed to get page object after re-render:', err);
-        });
-    }).catch(err => {
-        console.error('Highlight Error: Failed to re-render page before highlighting:', err);
-    });
-    console.log("--- handleLocationClick End (Highlight Attempted) ---");
 }
 
 /**
@@ -473,7 +391,7 @@ function displayFormattedResults(resultData) {
                 `;
 
                 const valueSpan = listItem.querySelector('.field-value');
-                if (field.bounding_regions && field.bounding_regions.length > 0 && field.bounding_regions[0].polygon) {
+                if (field.bounding_regions && field.bounding_regions.length > 0 && field.bounding_regions[0].normalized_polygon) {
                     valueSpan.style.cursor = 'pointer';
                     valueSpan.style.textDecoration = 'underline';
 
@@ -508,52 +426,27 @@ function displayFormattedResults(resultData) {
 }
 
 /**
- * Draws a single highlight based on polygon data.
- * Clears previous highlights first.
- * @param {number[]} polygon The polygon coordinates (from Document Intelligence, in inches, top-left origin).
- * @param {number} pageNum The page number the polygon belongs to.
+ * Draws a single highlight on the overlay canvas, replacing the previous one.
+ * @param {number[]} polygon Page-relative polygon (x, y pairs in 0..1, top-left origin) from the backend.
  */
-function drawSpecificHighlight(polygon, pageNum) {
-    clearHighlights(); // Clear any existing highlights
-    if (!pdfDoc || pageNum !== currentPageNum) return; // Ensure correct page is loaded
-
-    pdfDoc.getPage(pageNum).then(page => {
-        const viewport = page.getViewport({ scale: scale });
-        const pageHeightInPoints = page.view[3];
-
-        if (polygon && polygon.length >= 8) {
-            let minX_inch = polygon[0], maxX_inch = polygon[0];
-            let minY_inch = polygon[1], maxY_inch = polygon[1];
-            for (let i = 2; i < polygon.length; i += 2) {
-                minX_inch = Math.min(minX_inch, polygon[i]);
-                maxX_inch = Math.max(maxX_inch, polygon[i]);
-                minY_inch = Math.min(minY_inch, polygon[i + 1]);
-                maxY_inch = Math.max(maxY_inch, polygon[i + 1]);
-            }
+function drawHighlight(polygon) {
+    clearHighlights();
+    const width = highlightCanvas.width;
+    const height = highlightCanvas.height;
 
-            const pdfPointsTopLeft = [
-                minX_inch * 72,
-                pageHeightInPoints - (minY_inch * 72)
-            ];
-            const pdfPointsBottomRight = [
-                maxX_inch * 72,
-                pageHeightInPoints - (maxY_inch * 72)
-            ];
-
-            const viewportTopLeft = viewport.convertToViewportPoint(pdfPointsTopLeft[0], pdfPointsTopLeft[1]);
-            const viewportBottomRight = viewport.convertToViewportPoint(pdfPointsBottomRight[0], pdfPointsBottomRight[1]);
-
-            const highlight = document.createElement('div');
-            highlight.className = 'highlight';
-            highlight.style.left = `${viewportTopLeft[0]}px`;
-            highlight.style.top = `${viewportTopLeft[1]}px`;
-            highlight.style.width = `${viewportBottomRight[0] - viewportTopLeft[0]}px`;
-            highlight.style.height = `${viewportBottomRight[1] - viewportTopLeft[1]}px`;
-            pdfViewerContainer.appendChild(highlight);
-        }
-    }).catch(error => {
-        console.error("Error getting page for specific highlighting:", error);
-    });
+    highlightCtx.beginPath();
+    highlightCtx.moveTo(polygon[0] * width, polygon[1] * height);
+    for (let i = 2; i < polygon.length; i += 2) {
+        highlightCtx.lineTo(polygon[i] * width, polygon[i + 1] * height);
+    }
+    highlightCtx.closePath();
+
+    // Style the highlight
+    highlightCtx.fillStyle = 'rgba(255, 255, 0, 0.3)'; // Semi-transparent yellow fill
+    highlightCtx.strokeStyle = 'rgba(255, 0, 0, 0.7)'; // Red border
+    highlightCtx.lineWidth = 2; // Make border a bit thicker for visibility
+    highlightCtx.fill();
+    highlightCtx.stroke();
 }
 
 // TODO: Add basic pagination controls (optional)
@@ -0,0 +1,459 @@
+"""
+Persistent full-text index over the words of every analyzed document.
+
+Each finished analysis is added to a SQLite inverted index on a background
+writer thread: one posting per (term, document) holding the packed word
+positions (page_number << 16 | word_index) of the term, plus one row per page with
+the page's words and their polygons packed as float32s. Searches never touch
+the result cache or the service; they read the postings of the query terms
+(rarest first, restricted to the documents still in the running) and return
+the matching documents with the polygons of the matched words.
+
+Terms are whole words, case-folded and without surrounding punctuation, so
+"Total:" is found by `total`. A quoted "phrase" matches consecutive words of
+the same page (word_index i, i + 1, ...); all parts of a query must match.
+
+    python search_index.py rebuild          # index every analysis in the result cache
+    python search_index.py search '"amount due" contoso'
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from result_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Search index settings, overridable from the environment / .env file.
+# SEARCH_INDEX=0 stops indexing new analyses (searches still read the existing index).
+SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "1") != "0"
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", os.path.join(CACHE_DIR, "search.sqlite3"))
+# Matched words returned per document; the rest are only counted
+SEARCH_MAX_HITS_PER_DOCUMENT = int(os.environ.get("SEARCH_MAX_HITS_PER_DOCUMENT", "20"))
+# Documents returned per search unless ?limit= asks for fewer
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "100"))
+
+_EDGE_PUNCTUATION = re.compile(r"^\W+|\W+$")
+_QUERY_PARTS = re.compile(r'"([^"]*)"|(\S+)')
+_POLYGON = struct.Struct("<8f")
+# A word position is page_number << 16 | word_index, stored as a u32
+_WORD_BITS = 16
+_WORD_MASK = (1 << _WORD_BITS) - 1
+_POSITION_SIZE = 4
+
+
+def normalize_term(text) -> str:
+    """Index term of a word: NFKC, case-folded, without leading/trailing punctuation ('' if none is left)."""
+    return _EDGE_PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).casefold())
+
+
+def parse_query(query):
+    """
+    Splits a query into phrases (lists of terms). Quoted text is one phrase;
+    every other word is a phrase of its own.
+    Raises:
+        ValueError: If the query has no searchable terms.
+    """
+    phrases = []
+    for quoted, word in _QUERY_PARTS.findall(query or ""):
+        terms = [normalize_term(w) for w in (quoted.split() if quoted else [word])]
+        terms = [t for t in terms if t]
+        if terms:
+            phrases.append(terms)
+    if not phrases:
+        raise ValueError("The query has no searchable words")
+    return phrases
+
+
+def _pack(values, typecode):
+    packed = array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(blob, typecode):
+    values = array(typecode)
+    values.frombytes(blob)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _quad(polygon):
+    # Always store 4 points (as columnar.py does); other shapes become their bounding box
+    if polygon and len(polygon) == 8:
+        return polygon
+    if not polygon:
+        return [0.0] * 8
+    xs, ys = polygon[0::2], polygon[1::2]
+    left, top, right, bottom = min(xs), min(ys), max(xs), max(ys)
+    return [left, top, right, top, right, bottom, left, bottom]
+
+
+def document_postings(result):
+    """
+    Returns (pages, postings) of an AnalyzeResult: one (page_number, width, height,
+    unit, words, packed polygons) tuple per page and {term: [position, ...]}.
+    Words past the 65536th of a page are stored but not searchable.
+    """
+    pages, postings = [], {}
+    for page in result.get("pages") or []:
+        number = page.get("pageNumber")
+        words = page.get("words") or []
+        polygons = array("f")
+        for index, word in enumerate(words):
+            polygons.extend(_quad(word.get("polygon")))
+            term = normalize_term(word.get("content") or "")
+            if term and index <= _WORD_MASK:
+                postings.setdefault(term, []).append(number << _WORD_BITS | index)
+        if sys.byteorder != "little":
+            polygons.byteswap()
+        pages.append((number, page.get("width"), page.get("height"), page.get("unit"),
+                      json.dumps([word.get("content") for word in words], ensure_ascii=False),
+                      polygons.tobytes()))
+    return pages, postings
+
+
+def _phrase_starts(blobs, document_id, phrase):
+    """Positions at which `phrase` starts in one document; {term: {document_id: positions blob}}."""
+    starts = set(_unpack(blobs[phrase[0]][document_id], "I"))
+    for offset, term in enumerate(phrase[1:], start=1):
+        # Word i + offset holds the phrase's offset-th term; positions never cross pages
+        starts.intersection_update([p - offset for p in _unpack(blobs[term][document_id], "I")])
+        if not starts:
+            break
+    return starts
+
+
+def _match_count(blobs, document_id, phrases):
+    """Total occurrences of the phrases in one document, or 0 unless every phrase occurs."""
+    total = 0
+    for phrase in phrases:
+        if len(phrase) == 1:
+            found = len(blobs[phrase[0]][document_id]) // _POSITION_SIZE
+        else:
+            found = len(_phrase_starts(blobs, document_id, phrase))
+        if not found:
+            return 0
+        total += found
+    return total
+
+
+class SearchIndex:
+    """
+    SQLite inverted index of analyzed documents (see the module docstring).
+    Documents are keyed by their result cache key and indexed once; writes go
+    through a single background thread, searches run on the caller's thread.
+    The database is opened on first use.
+    """
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._writer = None
+
+    @property
+    def _conn(self):
+        # Caller must hold the lock
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            with self._db:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS documents (
+                        id INTEGER PRIMARY KEY,
+                        result_key TEXT NOT NULL UNIQUE,
+                        model_id TEXT,
+                        filename TEXT,
+                        page_count INTEGER NOT NULL,
+                        word_count INTEGER NOT NULL,
+                        indexed_at REAL NOT NULL
+                    )
+                    """
+                )
+                self._db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS pages (
+                        document_id INTEGER NOT NULL,
+                        page_number INTEGER NOT NULL,
+                        width REAL,
+                        height REAL,
+                        unit TEXT,
+                        words TEXT NOT NULL,
+                        polygons BLOB NOT NULL,
+                        PRIMARY KEY (document_id, page_number)
+                    ) WITHOUT ROWID
+                    """
+                )
+                # positions: little-endian u32 (page_number << 16 | word_index) values in reading order
+                self._db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS postings (
+                        term TEXT NOT NULL,
+                        document_id INTEGER NOT NULL,
+                        positions BLOB NOT NULL,
+                        PRIMARY KEY (term, document_id)
+                    ) WITHOUT ROWID
+                    """
+                )
+                # Document frequency per term, so the rarest term of a query is read first
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, documents INTEGER NOT NULL) WITHOUT ROWID"
+                )
+        return self._db
+
+    def add(self, result_key, result, filename=None) -> bool:
+        """
+        Indexes an AnalyzeResult under its result cache key. Returns False if the key
+        was already indexed (its result cannot change; only a missing filename is filled in).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM documents WHERE result_key = ?", (result_key,)).fetchone()
+            if row is not None:
+                if filename:
+                    with self._conn:
+                        self._conn.execute("UPDATE documents SET filename = COALESCE(filename, ?) WHERE id = ?",
+                                           (filename, row[0]))
+                return False
+
+        # Extraction runs outside the lock so searches are not held up by it
+        pages, postings = document_postings(result)
+        word_count = sum(len(positions) for positions in postings.values())
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM documents WHERE result_key = ?", (result_key,)).fetchone():
+                return False
+            document_id = self._conn.execute(
+                "INSERT INTO documents (result_key, model_id, filename, page_count, word_count, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (result_key, result.get("modelId"), filename, len(pages), word_count, time.time())
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (document_id, page_number, width, height, unit, words, polygons) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(document_id, *page) for page in pages]
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (term, document_id, positions) VALUES (?, ?, ?)",
+                [(term, document_id, _pack(positions, "I")) for term, positions in postings.items()]
+            )
+            self._conn.executemany(
+                "INSERT INTO terms (term, documents) VALUES (?, 1) "
+                "ON CONFLICT (term) DO UPDATE SET documents = documents + 1",
+                [(term,) for term in postings]
+            )
+        return True
+
+    def add_async(self, result_key, result, filename=None) -> None:
+        """Queues add() on the index's writer thread; failures are logged, never raised."""
+        if not SEARCH_INDEX:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+            writer = self._writer
+        writer.submit(self._add_logged, result_key, result, filename)
+
+    def _add_logged(self, result_key, result, filename):
+        try:
+            if self.add(result_key, result, filename):
+                logger.info(f"Indexed analysis {result_key[:12]} for search")
+        except Exception as e:
+            logger.warning(f"Could not index analysis {result_key[:12]} for search: {e}")
+
+    def _postings(self, term, frequency, document_ids=None):
+        # Caller must hold the lock
+        if document_ids is not None and len(document_ids) * 4 < frequency:
+            # Few candidates left: look them up instead of reading the whole posting list
+            rows = self._conn.execute(
+                "SELECT document_id, positions FROM postings "
+                "WHERE term = ? AND document_id IN (SELECT value FROM json_each(?))",
+                (term, json.dumps(sorted(document_ids)))
+            )
+            return dict(rows.fetchall())
+        rows = self._conn.execute("SELECT document_id, positions FROM postings WHERE term = ?", (term,))
+        if document_ids is None:
+            return dict(rows.fetchall())
+        return {document_id: blob for document_id, blob in rows if document_id in document_ids}
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS, max_hits=SEARCH_MAX_HITS_PER_DOCUMENT) -> dict:
+        """
+        Returns the documents matching every phrase of `query`, most matches first,
+        each with up to `max_hits` hits ({page, word_index, text, polygons}).
+        Raises:
+            ValueError: If the query has no searchable terms.
+        """
+        started = time.perf_counter()
+        phrases = parse_query(query)
+        terms = {term for phrase in phrases for term in phrase}
+        limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+
+        with self._lock:
+            frequencies = dict(self._conn.execute(
+                "SELECT term, documents FROM terms WHERE term IN (SELECT value FROM json_each(?))",
+                (json.dumps(sorted(terms)),)
+            ).fetchall())
+            blobs = {}
+            candidates = None
+            if len(frequencies) == len(terms):
+                # Rarest term first; every later lookup only reads the remaining candidates
+                for term in sorted(terms, key=frequencies.get):
+                    blobs[term] = self._postings(term, frequencies[term], candidates)
+                    candidates = set(blobs[term])
+                    if not candidates:
+                        break
+
+        # Single words are counted from the blob sizes; only phrases are decoded
+        counts = {}
+        for document_id in candidates or ():
+            count = _match_count(blobs, document_id, phrases)
+            if count:
+                counts[document_id] = count
+        ranked = heapq.nsmallest(limit, counts, key=lambda document_id: (-counts[document_id], document_id))
+
+        # Hit positions are only worked out for the returned documents
+        matches = {}
+        for document_id in ranked:
+            hits = []
+            for phrase in phrases:
+                starts = _phrase_starts(blobs, document_id, phrase)
+                hits.extend((p >> _WORD_BITS, p & _WORD_MASK, len(phrase)) for p in starts)
+            matches[document_id] = (counts[document_id], sorted(hits)[:max_hits])
+        documents = self._describe(ranked, matches)
+        return {
+            "query": query,
+            "total": len(counts),
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            "documents": documents,
+        }
+
+    def _describe(self, document_ids, matches):
+        """Loads the metadata of the ranked documents and the text and polygons of their hits."""
+        if not document_ids:
+            return []
+        wanted = {(document_id, page) for document_id in document_ids for page, _, _ in matches[document_id][1]}
+        with self._lock:
+            metadata = {row[0]: row[1:] for row in self._conn.execute(
+                "SELECT id, result_key, model_id, filename, page_count FROM documents "
+                "WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(document_ids),)
+            )}
+            pages = {}
+            for document_id, page in wanted:
+                row = self._conn.execute(
+                    "SELECT width, height, unit, words, polygons FROM pages WHERE document_id = ? AND page_number = ?",
+                    (document_id, page)
+                ).fetchone()
+                if row is not None:
+                    pages[document_id, page] = row
+
+        documents = []
+        for document_id in document_ids:
+            result_key, model_id, filename, page_count = metadata[document_id]
+            count, found = matches[document_id]
+            hits = []
+            for page, index, length in found:
+                row = pages.get((document_id, page))
+                if row is None:
+                    continue
+                width, height, unit, words, polygons = row
+                words = json.loads(words)
+                hits.append({
+                    "page": page,
+                    "word_index": index,
+                    "text": " ".join(words[index:index + length]),
+                    # float32 on disk; rounded so the JSON does not carry float32 noise
+                    "polygons": [[round(v, 4) for v in _POLYGON.unpack_from(polygons, i * _POLYGON.size)]
+                                 for i in range(index, index + length)],
+                    "width": width,
+                    "height": height,
+                    "unit": unit,
+                })
+            documents.append({
+                "document": result_key,
+                "filename": filename,
+                "model_id": model_id,
+                "page_count": page_count,
+                "matches": count,
+                "hits": hits,
+            })
+        return documents
+
+    def stats(self) -> dict:
+        with self._lock:
+            documents, words = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(word_count), 0) FROM documents"
+            ).fetchone()
+        return {"documents": documents, "words": words}
+
+    def close(self) -> None:
+        """Waits for queued writes, then closes the database."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# Shared by api.py, app.py and the job runner
+text_index = SearchIndex()
+
+
+def rebuild(cache_dir=CACHE_DIR, index=None) -> int:
+    """Indexes every analysis found in the result cache directory; returns how many were new."""
+    from azure.ai.documentintelligence.models import AnalyzeResult
+
+    index = index or text_index
+    added = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(root, name), "rb") as f:
+                    result = AnalyzeResult(json.loads(f.read()))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable cache entry {name}: {e}")
+                continue
+            added += index.add(name[:-len(".json")], result)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text index over analyzed documents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("rebuild", help="Index every analysis in the result cache")
+    build.add_argument("--cache-dir", default=CACHE_DIR)
+    find = commands.add_parser("search", help="Search the index")
+    find.add_argument("query")
+    find.add_argument("--limit", type=int, default=10)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "rebuild":
+        print(f"Indexed {rebuild(args.cache_dir)} new analyses ({text_index.stats()})")
+    else:
+        print(json.dumps(text_index.search(args.query, args.limit), indent=2, ensure_ascii=False))
+    text_index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key (for threads, e.g. Flask).
+    The first caller runs the function; callers arriving while it runs wait
+    for it and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> Future
+        self.started = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Returns fn(), sharing one call among all concurrent callers with this key."""
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+                self.started += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            logger.info(f"Waiting for in-flight analysis {key[:12]}")
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent awaits with the same key on one event loop.
+    The shared work runs in its own task, so a caller that is cancelled (e.g. its
+    client disconnected) does not cancel it for the others. The task is only
+    cancelled when every caller waiting on it has gone away.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key -> _Flight
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, start):
+        """
+        Awaits the shared work for `key`, starting it with start() if none is in flight.
+        Args:
+            key: Coalescing key, e.g. the result cache key.
+            start: Callable returning a coroutine or future; only called for the first caller.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(start()))
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Waiting for in-flight analysis {key[:12]}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is waiting any more: stop the work and let a later call start afresh
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self._flights)}
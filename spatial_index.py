@@ -0,0 +1,136 @@
+import os
+
+# Grid resolution per page side; each cell holds the items whose bounding box overlaps it
+SPATIAL_GRID_CELLS = int(os.environ.get("SPATIAL_GRID_CELLS", "32"))
+
+
+def bounding_box(polygon):
+    xs, ys = polygon[0::2], polygon[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def point_in_polygon(x, y, polygon):
+    """Ray-casting point-in-polygon test for a flat [x1, y1, ... xn, yn] polygon."""
+    inside = False
+    points = list(zip(polygon[0::2], polygon[1::2]))
+    j = len(points) - 1
+    for i in range(len(points)):
+        xi, yi = points[i]
+        xj, yj = points[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class PageIndex:
+    """
+    Uniform-grid spatial index over the polygons of one page.
+    Lookups only visit the grid cells touched by the query, so their cost
+    depends on local density rather than on the number of items on the page.
+    Args:
+        polygons: One polygon (flat [x1, y1, ... xn, yn] list) per item.
+        width: Page width in the polygons' unit (inferred from the polygons if None).
+        height: Page height in the polygons' unit (inferred from the polygons if None).
+        cells: Number of grid cells per side.
+    """
+
+    def __init__(self, polygons, width=None, height=None, cells=SPATIAL_GRID_CELLS):
+        self.boxes = [bounding_box(p) if p else None for p in polygons]
+        self.polygons = polygons
+        boxes = [b for b in self.boxes if b]
+        self.width = width or max((b[2] for b in boxes), default=1.0) or 1.0
+        self.height = height or max((b[3] for b in boxes), default=1.0) or 1.0
+        self.cells = cells
+        self.grid = {}
+        for index, box in enumerate(self.boxes):
+            if box is None:
+                continue
+            left, top, right, bottom = self._cell_range(*box)
+            for cx in range(left, right + 1):
+                for cy in range(top, bottom + 1):
+                    self.grid.setdefault((cx, cy), []).append(index)
+
+    def _cell(self, value, extent):
+        return min(self.cells - 1, max(0, int(value / extent * self.cells)))
+
+    def _cell_range(self, left, top, right, bottom):
+        return (self._cell(left, self.width), self._cell(top, self.height),
+                self._cell(right, self.width), self._cell(bottom, self.height))
+
+    def at_point(self, x, y):
+        """Indexes of the items whose polygon contains (x, y), in item order."""
+        candidates = self.grid.get((self._cell(x, self.width), self._cell(y, self.height)), [])
+        hits = []
+        for index in candidates:
+            left, top, right, bottom = self.boxes[index]
+            if left <= x <= right and top <= y <= bottom and (
+                    point_in_polygon(x, y, self.polygons[index]) or len(self.polygons[index]) < 6):
+                hits.append(index)
+        return hits
+
+    def in_rect(self, left, top, right, bottom):
+        """Indexes of the items whose bounding box intersects the rectangle, in item order."""
+        if left > right:
+            left, right = right, left
+        if top > bottom:
+            top, bottom = bottom, top
+        cell_left, cell_top, cell_right, cell_bottom = self._cell_range(left, top, right, bottom)
+        hits = set()
+        for cx in range(cell_left, cell_right + 1):
+            for cy in range(cell_top, cell_bottom + 1):
+                for index in self.grid.get((cx, cy), ()):
+                    box = self.boxes[index]
+                    if box[0] <= right and box[2] >= left and box[1] <= bottom and box[3] >= top:
+                        hits.add(index)
+        return sorted(hits)
+
+
+class DocumentIndex:
+    """
+    Per-page spatial indexes over the words and lines of one analysis.
+    Args:
+        pages: Iterable of (page_number, width, height, words, lines) where words and
+               lines are the dicts produced by the extract_* helpers (with a 'polygon' key).
+    """
+
+    def __init__(self, pages):
+        self.pages = {}
+        for page_number, width, height, words, lines in pages:
+            self.pages[page_number] = {
+                "words": words,
+                "lines": lines,
+                "word_index": PageIndex([w["polygon"] for w in words], width, height),
+                "line_index": PageIndex([l["polygon"] for l in lines], width, height),
+            }
+
+    def page(self, page_number):
+        return self.pages.get(page_number)
+
+    def word_at(self, page_number, x, y):
+        """Returns the word containing (x, y) on the page, or None."""
+        page = self.pages.get(page_number)
+        if page is None:
+            return None
+        hits = page["word_index"].at_point(x, y)
+        return page["words"][hits[0]] if hits else None
+
+    def line_at(self, page_number, x, y):
+        """Returns the line containing (x, y) on the page, or None."""
+        page = self.pages.get(page_number)
+        if page is None:
+            return None
+        hits = page["line_index"].at_point(x, y)
+        return page["lines"][hits[0]] if hits else None
+
+    def words_in_rect(self, page_number, left, top, right, bottom):
+        page = self.pages.get(page_number)
+        if page is None:
+            return []
+        return [page["words"][i] for i in page["word_index"].in_rect(left, top, right, bottom)]
+
+    def lines_in_rect(self, page_number, left, top, right, bottom):
+        page = self.pages.get(page_number)
+        if page is None:
+            return []
+        return [page["lines"][i] for i in page["line_index"].in_rect(left, top, right, bottom)]
@@ -0,0 +1,124 @@
+"""
+Shared fixtures and helpers. The modules under test read their settings from
+the environment at import time, so the caches and indexes are pointed at a
+temporary directory before any of them is imported.
+"""
+import io
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_STATE_DIR = tempfile.mkdtemp(prefix="docintel-tests-")
+os.environ.update({
+    "ANALYSIS_CACHE_DIR": os.path.join(_STATE_DIR, "cache"),
+    "JOB_DB_PATH": os.path.join(_STATE_DIR, "jobs.sqlite3"),
+    "FAKE_DI_RECORDINGS_DIR": os.path.join(_STATE_DIR, "recordings"),
+    "ANALYZE_CHUNK_PAGES": "0",
+})
+
+from document_client import get_client  # noqa: E402
+from fake_document_intelligence import FakeService, start_server  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def fake_service():
+    """The fake service (see fake_document_intelligence.py), answering without delay."""
+    server = start_server(FakeService(latency=0, poll_retry_after=0))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def client(fake_service):
+    return get_client(f"http://127.0.0.1:{fake_service.server_port}", "test-key")
+
+
+def page_lines(number, count=3):
+    return [f"Page {number} line {i} with some words" for i in range(1, count + 1)]
+
+
+def text_result(pages, model_id="prebuilt-layout") -> dict:
+    """
+    Returns an analyzeResult dict for `pages` ({page number: text lines}) shaped like
+    the service's: one paragraph per line, a table over the first two words of each
+    page and a root section over every paragraph.
+    """
+    content, result_pages, paragraphs, tables = [], [], [], []
+    offset = 0
+    for number, lines in pages.items():
+        page_start = offset
+        words, line_items = [], []
+        for row, text in enumerate(lines):
+            top, bottom = 1 + 0.25 * row, 1.2 + 0.25 * row
+            for token in re.finditer(r"\S+", text):
+                left, right = 1 + 0.1 * token.start(), 1 + 0.1 * token.end()
+                words.append({"content": token.group(), "polygon": [left, top, right, top, right, bottom, left, bottom],
+                              "confidence": 0.99, "span": {"offset": offset + token.start(), "length": len(token.group())}})
+            right = 1 + 0.1 * len(text)
+            polygon = [1, top, right, top, right, bottom, 1, bottom]
+            line_items.append({"content": text, "polygon": polygon, "spans": [{"offset": offset, "length": len(text)}]})
+            paragraphs.append({"content": text, "spans": [{"offset": offset, "length": len(text)}],
+                               "boundingRegions": [{"pageNumber": number, "polygon": list(polygon)}]})
+            content.append(text)
+            offset += len(text) + 1
+        if len(words) >= 2:
+            first, second = words[:2]
+            tables.append({
+                "rowCount": 1,
+                "columnCount": 2,
+                "boundingRegions": [{"pageNumber": number, "polygon": list(line_items[0]["polygon"])}],
+                "spans": [{"offset": first["span"]["offset"],
+                           "length": second["span"]["offset"] + second["span"]["length"] - first["span"]["offset"]}],
+                "cells": [{"kind": "content", "rowIndex": 0, "columnIndex": column, "content": word["content"],
+                           "boundingRegions": [{"pageNumber": number, "polygon": list(word["polygon"])}],
+                           "spans": [dict(word["span"])]}
+                          for column, word in enumerate((first, second))],
+            })
+        result_pages.append({"pageNumber": number, "angle": 0, "width": 8.5, "height": 11, "unit": "inch",
+                             "spans": [{"offset": page_start, "length": max(0, offset - 1 - page_start)}],
+                             "words": words, "lines": line_items})
+    text = "\n".join(content)
+    return {
+        "apiVersion": "2024-11-30",
+        "modelId": model_id,
+        "stringIndexType": "textElements",
+        "content": text,
+        "pages": result_pages,
+        "paragraphs": paragraphs,
+        "tables": tables,
+        "sections": [{"spans": [{"offset": 0, "length": len(text)}],
+                      "elements": [f"/paragraphs/{i}" for i in range(len(paragraphs))]}],
+    }
+
+
+def make_pdf(pages) -> bytes:
+    """Returns a PDF with one page per list of text lines in `pages` (an empty list is a blank page)."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    for lines in pages:
+        y = 720
+        for line in lines:
+            pdf.drawString(72, y, line)
+            y -= 18
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def combine_pages(*sources) -> bytes:
+    """Returns a PDF of the given (pdf bytes, 0-based page index) pages, copied unchanged."""
+    writer = PdfWriter()
+    for document, index in sources:
+        writer.add_page(PdfReader(io.BytesIO(document)).pages[index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,129 @@
+"""
+Page-range chunks merged by chunked_analysis.py must equal the result of one
+request for the whole document.
+"""
+import asyncio
+import contextvars
+import threading
+
+import pytest
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+import metrics
+from chunked_analysis import analyze_in_chunks, analyze_in_chunks_async, merge_results, page_ranges
+from conftest import make_pdf, page_lines, text_result
+
+PAGES = 5
+
+
+class _Poller:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class _Client:
+    """Answers like the service would for `pages`: only those pages, content offsets from 0."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def _analyze(self, model_id, pages):
+        with self._lock:
+            self.requests.append(pages)
+        numbers = range(1, len(self.pages) + 1)
+        if pages:
+            first, _, last = pages.partition("-")
+            numbers = range(int(first), int(last or first) + 1)
+        return AnalyzeResult(text_result({n: self.pages[n - 1] for n in numbers}, model_id))
+
+    def begin_analyze_document(self, model_id, body=None, pages=None, **kwargs):
+        return _Poller(self._analyze(model_id, pages))
+
+
+class _AsyncPoller(_Poller):
+    async def result(self):
+        return self._result
+
+
+class _AsyncClient(_Client):
+    async def begin_analyze_document(self, model_id, body=None, pages=None, **kwargs):
+        return _AsyncPoller(self._analyze(model_id, pages))
+
+
+@pytest.fixture(scope="module")
+def pages():
+    return [page_lines(number, count=number) for number in range(1, PAGES + 1)]
+
+
+@pytest.fixture(scope="module")
+def document(pages):
+    return make_pdf(pages)
+
+
+def test_page_ranges():
+    assert page_ranges(5, 2) == [(1, 2), (3, 4), (5, 5)]
+    assert page_ranges(4, 4) == [(1, 4)]
+
+
+@pytest.mark.parametrize("chunk_pages", [1, 2, 3])
+def test_chunks_merge_into_the_single_request_result(pages, document, chunk_pages):
+    client = _Client(pages)
+
+    merged = analyze_in_chunks(client, "prebuilt-layout", document, chunk_pages=chunk_pages)
+
+    assert sorted(client.requests) == [f"{first}-{last}" for first, last in page_ranges(PAGES, chunk_pages)]
+    assert merged.as_dict() == text_result(dict(enumerate(pages, start=1)))
+
+
+def test_async_chunks_merge_into_the_single_request_result(pages, document):
+    client = _AsyncClient(pages)
+
+    merged = asyncio.run(analyze_in_chunks_async(client, "prebuilt-layout", document, chunk_pages=2))
+
+    assert len(client.requests) == 3
+    assert merged.as_dict() == text_result(dict(enumerate(pages, start=1)))
+
+
+def test_document_within_one_chunk_is_analyzed_in_one_request(pages, document):
+    client = _Client(pages)
+
+    result = analyze_in_chunks(client, "prebuilt-layout", document, chunk_pages=PAGES)
+
+    assert client.requests == [None]
+    assert len(result.pages) == PAGES
+
+
+def test_chunks_numbered_from_one_are_renumbered(pages):
+    chunks = [AnalyzeResult(text_result({1: pages[0], 2: pages[1]})), AnalyzeResult(text_result({1: pages[2]}))]
+
+    merged = merge_results(chunks, [1, 3])
+
+    assert [page.page_number for page in merged.pages] == [1, 2, 3]
+    assert merged.tables[2].bounding_regions[0].page_number == 3
+    assert merged.as_dict() == text_result(dict(enumerate(pages[:3], start=1)))
+
+
+def test_models_outside_chunk_models_are_analyzed_in_one_request(pages, document):
+    client = _Client(pages)
+
+    result = analyze_in_chunks(client, "prebuilt-invoice", document, chunk_pages=2)
+
+    assert client.requests == [None]
+    assert len(result.pages) == PAGES
+
+
+def test_chunk_stages_reach_the_request_timer(pages, document):
+    def request():
+        timer = metrics.start_request("api", "/analyze-pdf")
+        analyze_in_chunks(_Client(pages), "prebuilt-layout", document, chunk_pages=2)
+        return timer
+
+    timer = contextvars.copy_context().run(request)
+
+    assert metrics.SERVICE_SUBMIT in timer.stages
+    assert metrics.POLLING_WAIT in timer.stages
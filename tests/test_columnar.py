@@ -0,0 +1,82 @@
+"""
+Reading back the columnar words/lines encoding of columnar.py.
+"""
+import pytest
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from columnar import ColumnarDocument, encode_columnar
+from conftest import page_lines, text_result
+
+
+def _approx(polygon):
+    # Polygons are stored as float32
+    return pytest.approx(polygon, rel=1e-6, abs=1e-5)
+
+
+@pytest.fixture(scope="module")
+def result():
+    result = text_result({1: page_lines(1), 2: page_lines(2, count=5), 3: page_lines(3, count=1)}, "prebuilt-read")
+    # A page in another unit, with a triangle and a word without any polygon
+    result["pages"].append({
+        "pageNumber": 7, "angle": 0, "width": 1700, "height": 2200, "unit": "pixel", "spans": [],
+        "words": [{"content": "Größe", "polygon": [10, 20, 50, 5, 30, 40], "span": {"offset": 0, "length": 5}},
+                  {"content": "€", "span": {"offset": 6, "length": 1}}],
+        "lines": [],
+    })
+    return AnalyzeResult(result)
+
+
+def _check_round_trip(document, result):
+    assert (document.page_count, document.word_count, document.line_count) == (
+        len(result.pages), sum(len(p.words or []) for p in result.pages), sum(len(p.lines or []) for p in result.pages))
+    for page, expected in zip(document.pages(), result.pages):
+        assert page["page"] == expected.page_number
+        assert page["unit"] == expected.unit
+        assert (page["width"], page["height"]) == pytest.approx((expected.width, expected.height))
+        assert [document.word_text(i) for i in page["words"]] == [word.content for word in expected.words or []]
+        assert [document.line_text(i) for i in page["lines"]] == [line.content for line in expected.lines or []]
+        for i, line in zip(page["lines"], expected.lines or []):
+            assert document.line_polygon(i) == _approx(line.polygon)
+    flat = document.word_polygons()
+    assert len(flat) == 8 * document.word_count
+    for i, word in enumerate(word for page in result.pages[:3] for word in page.words):
+        assert document.word_polygon(i) == _approx(word.polygon)
+        assert flat[8 * i:8 * i + 8].tolist() == _approx(word.polygon)
+
+
+def test_round_trip(result):
+    _check_round_trip(ColumnarDocument(encode_columnar(result)), result)
+
+
+def test_file_round_trip(result, tmp_path):
+    path = tmp_path / "result.bin"
+    path.write_bytes(encode_columnar(result))
+
+    _check_round_trip(ColumnarDocument.open(path), result)
+
+
+def test_other_shapes_are_stored_as_their_bounding_box(result):
+    document = ColumnarDocument(encode_columnar(result))
+
+    triangle, missing = document.page(3)["words"]
+    assert document.word_text(triangle) == "Größe"
+    assert document.word_polygon(triangle) == _approx([10, 5, 50, 5, 50, 40, 10, 40])
+    assert document.word_polygon(missing) == _approx([0.0] * 8)
+
+
+def test_rejects_other_data(result):
+    with pytest.raises(ValueError):
+        ColumnarDocument(b"NOTCOLMN" + encode_columnar(result)[8:])
+    with pytest.raises(ValueError):
+        ColumnarDocument(encode_columnar(result)[:-4])
+    with pytest.raises(ValueError):
+        ColumnarDocument(encode_columnar(result)[:40])
+
+
+def test_find_page(result):
+    document = ColumnarDocument(encode_columnar(result))
+
+    assert [document.find_page(n)["page"] for n in (1, 2, 3, 7)] == [1, 2, 3, 7]
+    assert document.find_page(2)["words"] == document.page(1)["words"]
+    assert document.find_page(4) is None
+    assert document.find_page(8) is None
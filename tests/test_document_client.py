@@ -0,0 +1,34 @@
+"""
+The shared clients of document_client.py.
+"""
+import asyncio
+
+from document_client import close_async_clients, get_async_client
+
+
+def test_async_client_of_a_finished_loop_is_closed(fake_service):
+    endpoint = f"http://127.0.0.1:{fake_service.server_port}"
+    closed = []
+
+    async def first():
+        client = get_async_client(endpoint, "loop-key")
+        original = client.close
+
+        async def close():
+            closed.append(client)
+            await original()
+
+        client.close = close
+        return client
+
+    async def second():
+        client = get_async_client(endpoint, "loop-key")
+        await asyncio.sleep(0.01)
+        await close_async_clients()
+        return client
+
+    old = asyncio.run(first())
+    new = asyncio.run(second())
+
+    assert new is not old
+    assert closed == [old]
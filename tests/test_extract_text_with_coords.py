@@ -0,0 +1,34 @@
+"""
+The words/lines records shared by /analyze-pdf, bulk_analyze.py and the page store.
+"""
+import hashlib
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from conftest import page_lines, text_result
+from extract_text_with_coords import extract_text_and_coords, extract_words_and_coords
+from page_store import PageStore
+
+
+def test_records_are_numbered_per_page():
+    result = AnalyzeResult(text_result({1: page_lines(1, count=2), 2: page_lines(2)}))
+
+    lines = extract_text_and_coords(result)
+    words = extract_words_and_coords(result)
+
+    assert [(line["page"], line["line_index"]) for line in lines] == [(1, 0), (1, 1), (2, 0), (2, 1), (2, 2)]
+    assert lines[3]["text"] == page_lines(2)[1]
+    assert [word["word_index"] for word in words if word["page"] == 2] == list(range(len(" ".join(page_lines(2)).split())))
+
+
+def test_records_match_the_page_store(tmp_path):
+    result = AnalyzeResult(text_result({1: page_lines(1), 2: page_lines(2)}))
+    store = PageStore(str(tmp_path))
+    document_id = hashlib.sha256(b"records").hexdigest()
+    store.put(document_id, result)
+
+    page = store.page(document_id, 2)
+
+    expected = [line for line in extract_text_and_coords(result) if line["page"] == 2]
+    assert [{**line, "polygon": None} for line in page["lines"]] == [{**line, "polygon": None} for line in expected]
+    assert set(page["words"][0]) == set(extract_words_and_coords(result)[0])
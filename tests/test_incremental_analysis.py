@@ -0,0 +1,66 @@
+"""
+Results stitched from the reused pages of an earlier revision and freshly
+analyzed pages (incremental_analysis.py) must equal what one request for the
+whole document returns.
+"""
+import copy
+import hashlib
+
+import pytest
+
+from chunked_analysis import analyze_service, merge_results
+from conftest import combine_pages, make_pdf, page_lines, text_result
+from incremental_analysis import fold_split_items, plan_revision, slice_unit
+from result_cache import analysis_cache, cache_key
+
+PAGES = 5
+
+
+@pytest.fixture(scope="module")
+def document():
+    return make_pdf([page_lines(number) for number in range(1, PAGES + 1)])
+
+
+@pytest.mark.parametrize("ranges", [
+    [(0, 0), (1, 1), (2, 2), (3, 3), (4, 4)],
+    [(0, 1), (2, 4)],
+    [(0, 2), (3, 3), (4, 4)],
+])
+def test_sliced_pages_merge_back_into_the_whole_result(ranges):
+    full = text_result({number: page_lines(number, count=number) for number in range(1, PAGES + 1)})
+    units = [slice_unit(copy.deepcopy(full), first, last) for first, last in ranges]
+
+    merged = merge_results(units, [first + 1 for first, _ in ranges])
+    fold_split_items(merged)
+
+    assert merged.as_dict() == full
+
+
+def test_revision_reuses_unchanged_pages(client, fake_service, document):
+    model_id = "prebuilt-layout"
+    key = cache_key(hashlib.sha256(document).hexdigest(), model_id)
+    base = analyze_service(client, model_id, document)
+    analysis_cache.put(key, base)
+    plan_revision(document, model_id, key).remember(base)
+
+    replacement = make_pdf([["A rewritten third page", "with different text"]])
+    revision = combine_pages(*[(document, i) for i in range(2)], (replacement, 0),
+                             *[(document, i) for i in range(3, PAGES)])
+    plan = plan_revision(revision, model_id, cache_key(hashlib.sha256(revision).hexdigest(), model_id))
+    assert plan.incremental
+    assert plan.pages == "3"
+
+    before = fake_service.service.stats["analyze"]
+    stitched = plan.finish(analyze_service(client, model_id, revision, plan.pages))
+    assert fake_service.service.stats["analyze"] == before + 1
+
+    assert stitched.as_dict() == analyze_service(client, model_id, revision).as_dict()
+
+
+def test_unrelated_document_is_analyzed_whole(document):
+    other = make_pdf([page_lines(number + 10) for number in range(PAGES)])
+
+    plan = plan_revision(other, "prebuilt-layout", cache_key(hashlib.sha256(other).hexdigest(), "prebuilt-layout"))
+
+    assert not plan.incremental
+    assert plan.pages is None
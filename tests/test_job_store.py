@@ -0,0 +1,65 @@
+"""
+Jobs run by JobRunner (job_store.py), and what happens to their uploads.
+"""
+import io
+import sqlite3
+import threading
+
+import pytest
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from conftest import page_lines, text_result
+from job_store import FAILED, RUNNING, SUCCEEDED, JobRunner, JobStore
+from upload_spool import spool_stream
+
+
+def _upload(name):
+    return spool_stream(io.BytesIO(f"%PDF-1.4 {name}".encode()))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def test_shutdown_closes_the_uploads_of_queued_jobs(path):
+    started, release = threading.Event(), threading.Event()
+
+    def analyze(file, model_id):
+        started.set()
+        release.wait(5)
+        return AnalyzeResult(text_result({1: page_lines(1)}, model_id))
+
+    runner = JobRunner(JobStore(path), analyze, max_workers=1)
+    uploads = [_upload(f"queued-{i}") for i in range(3)]
+    job_ids = [runner.submit(upload, f"{i}.pdf", "prebuilt-read") for i, upload in enumerate(uploads)]
+    assert started.wait(5)
+
+    stopping = threading.Thread(target=runner.shutdown)
+    stopping.start()
+    release.set()
+    stopping.join(5)
+
+    assert all(upload.file.closed for upload in uploads)
+    store = JobStore(path)
+    assert [store.get(job_id)["status"] for job_id in job_ids] == [SUCCEEDED, FAILED, FAILED]
+    store.close()
+
+
+class _BrokenStore(JobStore):
+    def set_status(self, job_id, status, error=None, result=None):
+        if status == RUNNING:
+            raise sqlite3.OperationalError("database is locked")
+        super().set_status(job_id, status, error, result)
+
+
+def test_failing_status_update_closes_the_upload(path):
+    runner = JobRunner(_BrokenStore(path), lambda file, model_id: pytest.fail("analyzed"), max_workers=1)
+    upload = _upload("broken")
+
+    job_id = runner.submit(upload, "broken.pdf", "prebuilt-read")
+    runner._executor.shutdown(wait=True)
+
+    assert upload.file.closed
+    assert runner.store.get(job_id)["status"] == FAILED
+    runner.shutdown()
@@ -0,0 +1,69 @@
+"""
+Single pages served from the page store (page_store.py) and GET /documents/{id}/pages/{n}.
+"""
+import hashlib
+import os
+
+import pytest
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+import app
+from conftest import page_lines, text_result
+from page_store import PageStore
+
+
+def _document_id(name):
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PageStore(str(tmp_path))
+
+
+def test_page_shape(store):
+    document_id = _document_id("shape")
+    store.put(document_id, AnalyzeResult(text_result({1: page_lines(1), 2: page_lines(2)})))
+
+    page = store.page(document_id, 2)
+
+    assert (page["document"], page["page"], page["unit"]) == (document_id, 2, "inch")
+    assert [(w["word_index"], w["text"]) for w in page["words"][:2]] == [(0, "Page"), (1, "2")]
+    assert [(line["line_index"], line["text"]) for line in page["lines"]] == list(enumerate(page_lines(2)))
+    assert store.page(document_id, 3) is None
+
+
+@pytest.mark.parametrize("size", [0, 40, 100])
+def test_truncated_file_is_unknown(store, size):
+    document_id = _document_id(f"truncated-{size}")
+    store.put(document_id, AnalyzeResult(text_result({1: page_lines(1)})))
+    path = store._path(document_id)
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+    assert store.page(document_id, 1) is None
+
+
+def test_not_modified_only_for_known_pages(monkeypatch, store):
+    document_id = _document_id("etag")
+    store.put(document_id, AnalyzeResult(text_result({1: page_lines(1)})))
+    monkeypatch.setattr(app, "page_store", store)
+    client = app.app.test_client()
+
+    known = client.get(f"/documents/{document_id}/pages/1", headers={"If-None-Match": f'"{document_id}-1"'})
+    missing = client.get(f"/documents/{document_id}/pages/2", headers={"If-None-Match": f'"{document_id}-2"'})
+
+    assert known.status_code == 304
+    assert missing.status_code == 404
+
+
+def test_failed_write_leaves_no_temp_file(store, monkeypatch):
+    def replace(source, target):
+        raise OSError("disk full")
+
+    document_id = _document_id("full")
+    monkeypatch.setattr(os, "replace", replace)
+
+    store.put(document_id, AnalyzeResult(text_result({1: page_lines(1)})))
+
+    assert [name for _, _, names in os.walk(store.directory) for name in names] == []
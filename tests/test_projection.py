@@ -0,0 +1,23 @@
+"""
+The ?include= / ?fields= projection of POST /analyze (app.py).
+"""
+import pytest
+
+from app import RESULT_PARTS, parse_projection
+
+
+def test_everything_by_default():
+    assert parse_projection() == (RESULT_PARTS, None)
+
+
+def test_fields_alone_select_only_the_documents():
+    assert parse_projection(fields="InvoiceTotal, VendorName") == (("documents",), ["InvoiceTotal", "VendorName"])
+
+
+def test_fields_add_the_documents_to_the_included_parts():
+    assert parse_projection("tables", "InvoiceTotal") == (("tables", "documents"), ["InvoiceTotal"])
+
+
+def test_unknown_part():
+    with pytest.raises(ValueError):
+        parse_projection("tables,words")
@@ -0,0 +1,38 @@
+"""
+The two-tier analysis cache (result_cache.py).
+"""
+import os
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from conftest import page_lines, text_result
+from result_cache import AnalysisCache, cache_key
+
+
+def _files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+def test_disk_round_trip(tmp_path):
+    key = cache_key("0" * 64, "prebuilt-read")
+    result = AnalyzeResult(text_result({1: page_lines(1)}, "prebuilt-read"))
+    AnalysisCache(str(tmp_path)).put(key, result)
+
+    cached = AnalysisCache(str(tmp_path)).get(key)
+
+    assert cached.as_dict() == result.as_dict()
+    assert _files(tmp_path) == [f"{key}.json"]
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    def replace(source, target):
+        raise OSError("disk full")
+
+    cache = AnalysisCache(str(tmp_path))
+    key = cache_key("1" * 64, "prebuilt-read")
+    monkeypatch.setattr(os, "replace", replace)
+
+    cache.put(key, AnalyzeResult(text_result({1: page_lines(1)}, "prebuilt-read")))
+
+    assert _files(tmp_path) == []
+    assert cache.get(key) is not None
@@ -0,0 +1,91 @@
+"""
+Column-wise serialization of the tables of an analysis (app.py).
+"""
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from app import convert_analyze_result_to_dict
+from conftest import page_lines, text_result
+
+
+def _cell(row, column, content, offset, polygon=None, kind=None, **extra):
+    cell = {"rowIndex": row, "columnIndex": column, "content": content,
+            "spans": [{"offset": offset, "length": len(content)}], **extra}
+    if kind:
+        cell["kind"] = kind
+    if polygon:
+        cell["boundingRegions"] = [{"pageNumber": 1, "polygon": polygon}]
+    return cell
+
+
+def test_tables_are_serialized_column_wise():
+    content = "Item Qty\nWidget 3\nTotal 3"
+    words = [{"content": word, "polygon": [0] * 8, "span": {"offset": content.index(word, start), "length": len(word)}}
+             for word, start in (("Item", 0), ("Qty", 0), ("Widget", 0), ("3", 16), ("Total", 0), ("3", 24))]
+    table = {
+        "rowCount": 3,
+        "columnCount": 2,
+        "caption": {"content": "Order"},
+        "boundingRegions": [{"pageNumber": 1, "polygon": [1, 1, 5, 1, 5, 4, 1, 4]}],
+        "spans": [{"offset": 0, "length": len(content)}],
+        "cells": [
+            _cell(0, 0, "Item", 0, [1, 1, 3, 1, 3, 2, 1, 2], kind="columnHeader"),
+            _cell(0, 1, "Qty", 5, [3, 1, 5, 1, 5, 2, 3, 2], kind="columnHeader"),
+            _cell(1, 0, "Widget", 9, [1, 2, 3, 2, 3, 3, 1, 3]),
+            _cell(1, 1, "3", 16),
+            _cell(2, 0, "Total 3", 18, [1, 3, 5, 3, 5, 4, 1, 4], columnSpan=2),
+        ],
+    }
+    result = AnalyzeResult({
+        "apiVersion": "2024-11-30", "modelId": "prebuilt-layout", "content": content,
+        "pages": [{"pageNumber": 1, "width": 8, "height": 10, "unit": "inch", "words": words, "lines": []}],
+        "tables": [table],
+    })
+
+    tables = convert_analyze_result_to_dict(result, include=("tables",))["tables"]
+
+    assert tables == [{
+        "row_count": 3,
+        "column_count": 2,
+        "caption": "Order",
+        "bounding_regions": [{"page_number": 1, "polygon": [1, 1, 5, 1, 5, 4, 1, 4],
+                              "normalized_polygon": [0.125, 0.1, 0.625, 0.1, 0.625, 0.4, 0.125, 0.4]}],
+        "spans": [{"offset": 0, "length": len(content)}],
+        "header_rows": [0],
+        "columns": [["Item", "Widget", "Total 3"], ["Qty", "3", None]],
+        "merged_cells": [[2, 0, 1, 2]],
+        "cells": {
+            "row": [0, 0, 1, 1, 2],
+            "column": [0, 1, 0, 1, 0],
+            "kind": ["columnHeader", "columnHeader", "content", "content", "content"],
+            "page": [1, 1, 1, None, 1],
+            "polygon": [1, 1, 3, 1, 3, 2, 1, 2,
+                        3, 1, 5, 1, 5, 2, 3, 2,
+                        1, 2, 3, 2, 3, 3, 1, 3,
+                        0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                        1, 3, 5, 3, 5, 4, 1, 4],
+            "normalized_polygon": [0.125, 0.1, 0.375, 0.1, 0.375, 0.2, 0.125, 0.2,
+                                   0.375, 0.1, 0.625, 0.1, 0.625, 0.2, 0.375, 0.2,
+                                   0.125, 0.2, 0.375, 0.2, 0.375, 0.3, 0.125, 0.3,
+                                   0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                                   0.125, 0.3, 0.625, 0.3, 0.625, 0.4, 0.125, 0.4],
+            # [first word_index, word count]; cells without a region have no page to index
+            "words": [0, 1, 1, 1, 2, 1, 0, 0, 4, 2],
+        },
+    }]
+
+
+def test_cell_words_index_the_page_words():
+    result = AnalyzeResult(text_result({1: page_lines(1), 2: page_lines(2)}))
+    page = result.pages[1]
+    line = page.lines[1]
+    result["tables"] = [{
+        "rowCount": 1, "columnCount": 1,
+        "boundingRegions": [{"pageNumber": 2, "polygon": line.polygon}],
+        "cells": [{"rowIndex": 0, "columnIndex": 0, "content": line.content, "spans": line.spans,
+                   "boundingRegions": [{"pageNumber": 2, "polygon": line.polygon}]}],
+    }]
+
+    cells = convert_analyze_result_to_dict(result, include=("tables",))["tables"][0]["cells"]
+
+    first, count = cells["words"]
+    assert " ".join(word.content for word in page.words[first:first + count]) == line.content
@@ -0,0 +1,112 @@
+"""
+Pages read from the PDF text layer (text_layer.py), and their merge with the
+pages analyzed by the service.
+"""
+import copy
+import io
+
+import pytest
+from azure.ai.documentintelligence.models import AnalyzeResult
+from pypdf import PdfReader, PdfWriter
+
+from conftest import make_pdf, page_lines
+from fake_document_intelligence import synthesize_result
+from incremental_analysis import slice_unit
+from text_layer import TextLayerPlan, analyze_with_text_layer, preflight
+
+PAGES = 5
+
+
+def _analyze(client, document, pages=None):
+    poller = client.begin_analyze_document("prebuilt-read", body=document, pages=pages,
+                                           content_type="application/octet-stream")
+    return poller.result()
+
+
+@pytest.fixture(scope="module")
+def document():
+    return make_pdf([page_lines(number) for number in range(1, PAGES + 1)])
+
+
+def test_born_digital_pages_are_read_locally(document):
+    plan = preflight(document, "prebuilt-read")
+
+    assert sorted(plan.local) == list(range(1, PAGES + 1))
+    assert not plan.needs_service
+    unit = plan.local[2]
+    assert [page["pageNumber"] for page in unit["pages"]] == [2]
+    assert [line["content"] for line in unit["pages"][0]["lines"]] == page_lines(2)
+    assert [word["content"] for word in unit["pages"][0]["words"]] == " ".join(page_lines(2)).split()
+
+
+def test_pages_without_text_go_to_the_service():
+    plan = preflight(make_pdf([page_lines(1), [], page_lines(3), []]), "prebuilt-read")
+
+    assert sorted(plan.local) == [1, 3]
+    assert plan.service_pages == [2, 4]
+    assert plan.pages == "2,4"
+    assert plan.needs_service
+
+
+def test_only_requested_pages_are_considered(document):
+    plan = preflight(document, "prebuilt-read", "2-3")
+
+    assert sorted(plan.local) == [2, 3]
+    assert not plan.needs_service
+
+
+# Local pages have no tables, selection marks or fields for these models to return
+@pytest.mark.parametrize("model_id", ["prebuilt-layout", "prebuilt-invoice"])
+def test_other_models_always_use_the_service(document, model_id):
+    plan = preflight(document, model_id, "1-2")
+
+    assert plan.local == {}
+    assert plan.pages == "1-2"
+    assert plan.needs_service
+
+
+def test_rotated_pages_go_to_the_service(document):
+    writer = PdfWriter()
+    for index, page in enumerate(PdfReader(io.BytesIO(document)).pages):
+        writer.add_page(page.rotate(90) if index == 1 else page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+
+    plan = preflight(buffer.getvalue(), "prebuilt-read")
+
+    assert plan.service_pages == [2]
+    assert sorted(plan.local) == [1, 3, 4, 5]
+
+
+def test_text_layer_pages_merge_with_service_pages(client, document):
+    full = _analyze(client, document).as_dict()
+    local = {number: slice_unit(copy.deepcopy(full), number - 1, number - 1) for number in (1, 2, 5)}
+    plan = TextLayerPlan("prebuilt-read", local=local, service_pages=[3, 4])
+    assert plan.pages == "3-4"
+
+    stitched = plan.finish(_analyze(client, document, plan.pages))
+
+    assert stitched.as_dict() == full
+
+
+def test_stitching_rejects_a_short_service_result(document):
+    plan = TextLayerPlan("prebuilt-read", local={1: slice_unit(synthesize_result(document, "prebuilt-read"), 0, 0)},
+                         service_pages=[2, 3])
+
+    with pytest.raises(ValueError):
+        plan.finish(AnalyzeResult(synthesize_result(make_pdf([page_lines(2)]), "prebuilt-read")))
+
+
+def test_only_pages_without_text_are_analyzed(client):
+    document = make_pdf([page_lines(1), [], page_lines(3)])
+    requested = []
+
+    def analyze(pages):
+        requested.append(pages)
+        return _analyze(client, document, pages)
+
+    result = analyze_with_text_layer(document, "prebuilt-read", analyze)
+
+    assert requested == ["2"]
+    assert [page.page_number for page in result.pages] == [1, 2, 3]
+    assert [line.content for line in result.pages[2].lines] == page_lines(3)
@@ -0,0 +1,308 @@
+"""
+Local fast path for born-digital PDFs.
+
+Before a PDF is sent to the service, every requested page is laid out with
+pdfminer.six. Pages whose text layer is usable are turned into analyzeResult
+pages right away: words (with the exact glyph boxes as polygons), lines and
+paragraphs, in inches with a top-left origin like the service's output. Only
+the remaining pages (scans, text drawn as outlines, rotated pages, pages with
+unmapped glyphs) are sent to the service as a `pages` list; the two parts are
+then stitched in page order with the incremental_analysis/chunked_analysis
+helpers.
+
+A page's text layer is considered usable when it has at least
+LOCAL_TEXT_MIN_CHARS characters, at most LOCAL_TEXT_MAX_UNMAPPED of them could
+not be mapped to Unicode, images cover at most LOCAL_TEXT_MAX_IMAGE_COVERAGE
+of the page (so scans with an OCR text layer still go to the service) and the
+page is not rotated.
+
+Local pages carry words, lines and paragraphs only (no tables, selection marks
+or key-value pairs), so only models whose results never have more than that
+take part (LOCAL_TEXT_MODELS). The merged result is cached under the model's
+key like a service result, so adding e.g. prebuilt-layout there would serve
+results without tables to every later layout request for the same document.
+"""
+import io
+import logging
+import os
+
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTChar, LTContainer, LTImage, LTTextBox, LTTextLine
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+import metrics
+from chunked_analysis import count_pages, merge_results, page_spec, pages_from_spec
+from document_client import API_VERSION
+from incremental_analysis import fold_split_items, slice_unit
+
+logger = logging.getLogger(__name__)
+
+# Text layer settings, overridable from the environment / .env file.
+# LOCAL_TEXT_LAYER=0 sends every page to the service.
+LOCAL_TEXT_LAYER = os.environ.get("LOCAL_TEXT_LAYER", "1") != "0"
+# Models whose results may have locally extracted pages (only words, lines and paragraphs)
+LOCAL_TEXT_MODELS = os.environ.get("LOCAL_TEXT_MODELS", "prebuilt-read").split(",")
+LOCAL_TEXT_MIN_CHARS = int(os.environ.get("LOCAL_TEXT_MIN_CHARS", "1"))
+# Fraction of a page's characters that may be unmapped glyphs, e.g. "(cid:12)"
+LOCAL_TEXT_MAX_UNMAPPED = float(os.environ.get("LOCAL_TEXT_MAX_UNMAPPED", "0.05"))
+# Fraction of the page area that images may cover
+LOCAL_TEXT_MAX_IMAGE_COVERAGE = float(os.environ.get("LOCAL_TEXT_MAX_IMAGE_COVERAGE", "0.5"))
+# Longer documents skip the pre-flight (local layout takes tens of ms per page)
+LOCAL_TEXT_MAX_PAGES = int(os.environ.get("LOCAL_TEXT_MAX_PAGES", "200"))
+
+# Text inside form XObjects is laid out too; text boxes are not grouped
+# hierarchically (a third of the layout time, and only the boxes are used)
+_LAPARAMS = LAParams(all_texts=True, boxes_flow=None)
+POINTS_PER_INCH = 72.0
+
+_stats = {"documents": 0, "pages_local": 0, "pages_service": 0}
+
+
+def _walk(item):
+    """Yields the images and text boxes of a layout, descending into figures."""
+    if isinstance(item, (LTImage, LTTextBox)):
+        yield item
+    elif isinstance(item, LTContainer):
+        for child in item:
+            yield from _walk(child)
+
+
+def _layouts(source, page_indexes):
+    """
+    Yields the LTPage of each selected page, like pdfminer's extract_pages, or None
+    for rotated pages (which are not laid out: their LTPage does not record /Rotate).
+    """
+    resources = PDFResourceManager()
+    device = PDFPageAggregator(resources, laparams=_LAPARAMS)
+    interpreter = PDFPageInterpreter(resources, device)
+    for page in PDFPage.get_pages(source, page_indexes):
+        if page.rotate % 360:
+            yield None
+            continue
+        interpreter.process_page(page)
+        yield device.get_result()
+
+
+def _union(items):
+    return (min(i.x0 for i in items), min(i.y0 for i in items),
+            max(i.x1 for i in items), max(i.y1 for i in items))
+
+
+def _line_words(line):
+    """Splits a pdfminer text line into [(text, bounding box)] on whitespace."""
+    words, current = [], []
+    for char in line:
+        if isinstance(char, LTChar) and not char.get_text().isspace():
+            current.append(char)
+        elif current:
+            words.append(current)
+            current = []
+    if current:
+        words.append(current)
+    return [("".join(char.get_text() for char in chars), _union(chars)) for chars in words]
+
+
+def page_unit(layout, page_number, model_id):
+    """
+    Builds a single-page analyzeResult dict from a pdfminer LTPage, or returns None
+    if the page's text layer is not usable and the page has to go to the service.
+    """
+    left, bottom, right, top = layout.bbox
+    page_area = max((right - left) * (top - bottom), 1e-9)
+
+    def polygon(box):
+        # PDF user space (points, bottom-left origin) -> inches from the top-left corner
+        x0, x1 = (box[0] - left) / POINTS_PER_INCH, (box[2] - left) / POINTS_PER_INCH
+        y0, y1 = (top - box[3]) / POINTS_PER_INCH, (top - box[1]) / POINTS_PER_INCH
+        return [x0, y0, x1, y0, x1, y1, x0, y1]
+
+    image_area = 0.0
+    boxes = []
+    for item in _walk(layout):
+        if isinstance(item, LTImage):
+            width = max(0.0, min(item.x1, right) - max(item.x0, left))
+            height = max(0.0, min(item.y1, top) - max(item.y0, bottom))
+            image_area += width * height
+        else:
+            boxes.append(item)
+    if image_area > LOCAL_TEXT_MAX_IMAGE_COVERAGE * page_area:
+        return None
+
+    chars = unmapped = 0
+    content, words, lines, paragraphs = [], [], [], []
+    offset = 0
+    for box in boxes:
+        paragraph_start = offset
+        paragraph_lines = []
+        for line in box:
+            if not isinstance(line, LTTextLine):
+                continue
+            line_words = _line_words(line)
+            if not line_words:
+                continue
+            for text, _ in line_words:
+                chars += len(text)
+                unmapped += text.count("(cid:") * len("(cid:0)") + text.count("�")
+            line_text = " ".join(text for text, _ in line_words)
+            word_offset = offset
+            for text, word_box in line_words:
+                words.append({"content": text, "polygon": polygon(word_box), "confidence": 1.0,
+                              "span": {"offset": word_offset, "length": len(text)}})
+                word_offset += len(text) + 1
+            lines.append({"content": line_text, "polygon": polygon(_union([line])),
+                          "spans": [{"offset": offset, "length": len(line_text)}]})
+            paragraph_lines.append(line_text)
+            content.append(line_text)
+            offset += len(line_text) + 1
+        if paragraph_lines:
+            paragraphs.append({
+                "spans": [{"offset": paragraph_start, "length": offset - 1 - paragraph_start}],
+                "boundingRegions": [{"pageNumber": page_number, "polygon": polygon(_union([box]))}],
+                "content": " ".join(paragraph_lines)
+            })
+    if chars < LOCAL_TEXT_MIN_CHARS or unmapped > LOCAL_TEXT_MAX_UNMAPPED * chars:
+        return None
+
+    text = "\n".join(content)
+    unit = {
+        "apiVersion": API_VERSION,
+        "modelId": model_id,
+        "stringIndexType": "textElements",
+        "content": text,
+        "contentFormat": "text",
+        "pages": [{
+            "pageNumber": page_number,
+            "angle": 0.0,
+            "width": (right - left) / POINTS_PER_INCH,
+            "height": (top - bottom) / POINTS_PER_INCH,
+            "unit": "inch",
+            "words": words,
+            "lines": lines,
+            "spans": [{"offset": 0, "length": len(text)}]
+        }]
+    }
+    if paragraphs:
+        unit["paragraphs"] = paragraphs
+    return unit
+
+
+class TextLayerPlan:
+    """
+    Which pages of one document were read from its text layer and which need the
+    service. `pages` is the service `pages` parameter (the caller's own when nothing
+    was extracted locally) and `needs_service` is False when every page was.
+    finish() merges the service's result for `pages` with the local pages.
+    """
+
+    def __init__(self, model_id, requested=None, local=None, service_pages=()):
+        self.model_id = model_id
+        self.local = local or {}  # page number -> single-page result dict
+        self.service_pages = list(service_pages)
+        self.pages = page_spec(self.service_pages) if self.local else requested
+
+    @property
+    def needs_service(self) -> bool:
+        return not self.local or bool(self.service_pages)
+
+    @property
+    def service_page_count(self):
+        """Pages the service will analyze, if known (for adaptive polling)."""
+        return len(self.service_pages) if self.local else None
+
+    def finish(self, analyzed):
+        """
+        Returns the AnalyzeResult of every requested page.
+        Args:
+            analyzed: The service's AnalyzeResult for `pages`, or None if not needs_service.
+        """
+        if not self.local:
+            return analyzed
+        units = list(self.local.items())
+        if analyzed is not None:
+            fresh = analyzed.as_dict()
+            fresh_pages = fresh.get("pages") or []
+            if len(fresh_pages) != len(self.service_pages):
+                raise ValueError(f"Expected {len(self.service_pages)} analyzed pages, got {len(fresh_pages)}")
+            # One unit per run of consecutive service pages
+            first = 0
+            for position in range(1, len(fresh_pages) + 1):
+                if position == len(fresh_pages) or self.service_pages[position] != self.service_pages[position - 1] + 1:
+                    units.append((self.service_pages[first], slice_unit(fresh, first, position - 1, "service")))
+                    first = position
+        units.sort(key=lambda unit: unit[0])
+        result = merge_results([unit for _, unit in units], [number for number, _ in units])
+        fold_split_items(result)
+        return result
+
+
+def preflight(document, model_id, pages=None) -> TextLayerPlan:
+    """
+    Extracts the pages of a PDF that have a usable text layer. Blocking (lays out
+    the PDF); run it off the event loop.
+    Args:
+        document: PDF bytes or a seekable binary file, whose position is left unchanged.
+        model_id: The model the document is analyzed with.
+        pages: Optional `pages` parameter (e.g. "2,5-6") limiting the pages considered.
+    """
+    if not LOCAL_TEXT_LAYER or model_id not in LOCAL_TEXT_MODELS:
+        return TextLayerPlan(model_id, pages)
+    page_count = count_pages(document)
+    if page_count > LOCAL_TEXT_MAX_PAGES:
+        return TextLayerPlan(model_id, pages)
+
+    if isinstance(document, (bytes, bytearray)):
+        source, position = io.BytesIO(document), None
+    else:
+        source, position = document, document.tell()
+    if not source.read(1024).lstrip().startswith(b"%PDF"):
+        if position is not None:
+            source.seek(position)
+        return TextLayerPlan(model_id, pages)
+    source.seek(position or 0)
+
+    wanted = [n for n in (pages_from_spec(pages) if pages else range(1, page_count + 1)) if n <= page_count]
+    local = {}
+    try:
+        with metrics.stage(metrics.TEXT_LAYER):
+            for number, layout in zip(wanted, _layouts(source, {n - 1 for n in wanted})):
+                unit = page_unit(layout, number, model_id) if layout is not None else None
+                if unit is not None:
+                    local[number] = unit
+    except Exception as e:
+        # Anything pdfminer cannot read is left to the service
+        logger.warning(f"Could not read the PDF text layer, sending every page to the service: {e}")
+        local = {}
+    finally:
+        if position is not None:
+            source.seek(position)
+
+    requested = pages_from_spec(pages) if pages else range(1, page_count + 1)
+    service_pages = [n for n in requested if n not in local]
+    _stats["documents"] += 1
+    _stats["pages_local"] += len(local)
+    _stats["pages_service"] += len(service_pages)
+    metrics.record_pages_routed(model_id, len(local), len(service_pages))
+    if local:
+        logger.info(f"Extracted {len(local)} of {len(local) + len(service_pages)} pages from the PDF text layer"
+                    + (f"; sending pages {page_spec(service_pages)} to the service" if service_pages else ""))
+    return TextLayerPlan(model_id, pages, local, service_pages)
+
+
+def analyze_with_text_layer(document, model_id, analyze, pages=None):
+    """
+    Analyzes a document, reading what it can from the PDF text layer.
+    Args:
+        document: PDF bytes or a seekable binary file.
+        model_id: The model the document is analyzed with.
+        analyze: Called with a `pages` parameter (None: every page) to analyze pages with the service.
+        pages: Optional `pages` parameter limiting the analysis.
+    """
+    plan = preflight(document, model_id, pages)
+    if not plan.local:
+        return analyze(pages)
+    return plan.finish(analyze(plan.pages) if plan.needs_service else None)
+
+
+def stats() -> dict:
+    return dict(_stats)
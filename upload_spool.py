@@ -0,0 +1,150 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+# Upload limits, overridable from the environment / .env file
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(250 * 1024 * 1024)))
+UPLOAD_SPILL_BYTES = int(os.environ.get("UPLOAD_SPILL_BYTES", str(16 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised as soon as an upload exceeds the configured maximum size."""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes.")
+        self.max_bytes = max_bytes
+
+
+class InvalidContentLength(ValueError):
+    """Raised for a Content-Length header that is not a non-negative integer."""
+
+    def __init__(self, value):
+        super().__init__(f"Invalid Content-Length header: {value!r}")
+        self.value = value
+
+
+class SpooledUpload:
+    """
+    Buffers an upload in memory until it reaches `spill_bytes`, then moves it
+    to an anonymous temporary file. The SHA-256 of the content is computed
+    while writing, so the bytes never have to be re-read for hashing.
+
+    After finish(), `file` is positioned at 0 and can be passed directly as
+    the request body to begin_analyze_document.
+    """
+
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES, spill_bytes=UPLOAD_SPILL_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.file = io.BytesIO()
+        self.size = 0
+        self.spilled = False
+        self.sha256 = None
+        self._hasher = hashlib.sha256()
+        self._refs = 1
+        # Seconds spent copying the upload in total / writing it to the buffer (see metrics.py)
+        self.copy_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._hasher.update(chunk)
+        started = time.perf_counter()
+        if not self.spilled and self.size > self.spill_bytes:
+            # Past the threshold: move what we have to disk and keep writing there
+            disk_file = tempfile.TemporaryFile(suffix=".pdf")
+            disk_file.write(self.file.getbuffer())
+            self.file.close()
+            self.file = disk_file
+            self.spilled = True
+        self.file.write(chunk)
+        self.write_seconds += time.perf_counter() - started
+
+    def finish(self) -> str:
+        """Rewinds the buffer and returns the hex SHA-256 of the upload."""
+        self.file.seek(0)
+        self.sha256 = self._hasher.hexdigest()
+        return self.sha256
+
+    def retain(self):
+        """
+        Keeps the buffer open until one more close() call; used by work (such as a
+        coalesced analysis) that may outlive the request that created the upload.
+        """
+        self._refs += 1
+        return self
+
+    def close(self) -> None:
+        self._refs -= 1
+        if self._refs <= 0:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def spool_stream(stream, max_bytes=MAX_UPLOAD_BYTES, spill_bytes=UPLOAD_SPILL_BYTES) -> SpooledUpload:
+    """
+    Copies a file-like object into a SpooledUpload in fixed-size chunks.
+    Args:
+        stream: Readable binary file-like object (e.g. a Flask FileStorage stream).
+        max_bytes: Maximum accepted size; UploadTooLarge is raised past it.
+        spill_bytes: Size above which the upload is buffered on disk.
+    Returns:
+        A finished SpooledUpload; the caller is responsible for closing it.
+    """
+    upload = SpooledUpload(max_bytes=max_bytes, spill_bytes=spill_bytes)
+    started = time.perf_counter()
+    try:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+            upload.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+    upload.finish()
+    upload.copy_seconds = time.perf_counter() - started
+    return upload
+
+
+async def spool_chunks(chunks, max_bytes=MAX_UPLOAD_BYTES, spill_bytes=UPLOAD_SPILL_BYTES) -> SpooledUpload:
+    """
+    Async counterpart of spool_stream for an async iterator of byte chunks
+    (e.g. Starlette's request.stream()).
+    """
+    upload = SpooledUpload(max_bytes=max_bytes, spill_bytes=spill_bytes)
+    started = time.perf_counter()
+    try:
+        async for chunk in chunks:
+            if chunk:
+                upload.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+    upload.finish()
+    upload.copy_seconds = time.perf_counter() - started
+    return upload
+
+
+def check_content_length(content_length, max_bytes=MAX_UPLOAD_BYTES) -> None:
+    """
+    Rejects an upload up front when its declared Content-Length is already too large.
+    Raises:
+        InvalidContentLength: For a header that is not a non-negative integer.
+        UploadTooLarge: For a declared size above `max_bytes`.
+    """
+    if not content_length:
+        return
+    value = content_length.strip()
+    # int() would also accept "+5", "-5" and "1_000"
+    if not value.isascii() or not value.isdigit():
+        raise InvalidContentLength(content_length)
+    if max_bytes and int(value) > max_bytes:
+        raise UploadTooLarge(max_bytes)